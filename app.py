@@ -1,41 +1,112 @@
 from __future__ import annotations
 
 import base64
+import copy
 import hashlib
+import itertools
 import json
+import os
+import re
 import shutil
+import struct
+import sys
 import time
 import uuid
 import zipfile
 import threading
+from array import array
 from collections import OrderedDict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any
 
-import webview
-from pdf2image import convert_from_path
-from pypdf import PdfReader, PdfWriter
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.lib.colors import HexColor
 
-try:
-    import fitz  # PyMuPDF (in-process PDF renderer)
-except Exception:  # pragma: no cover
-    fitz = None
+# Heavy dependencies are imported on first use so the window can appear quickly:
+# pypdf/reportlab are only needed for export and merging, pdf2image only as a
+# render fallback, and PyMuPDF is warmed up in the background by main().
+_IMPORT_T0 = time.perf_counter()
+# Startup timings in ms (import, renderer warm-up, window, first page); see Api.get_startup_metrics.
+_STARTUP: dict[str, float] = {}
+_fitz_mod: Any = None
+_fitz_tried = False
+
+
+def _fitz() -> Any:
+    """PyMuPDF module (in-process PDF renderer), or None when unavailable."""
+    global _fitz_mod, _fitz_tried
+    if not _fitz_tried:
+        try:
+            try:
+                import pymupdf as _m
+            except ImportError:  # PyMuPDF < 1.24.3 only ships the legacy name
+                import fitz as _m
+
+            _fitz_mod = _m
+        except Exception:  # pragma: no cover
+            _fitz_mod = None
+        _fitz_tried = True
+    return _fitz_mod
 
 
 ROOT = Path(__file__).resolve().parent
 UI_DIR = ROOT / "ui"
-LOCAL = ROOT / "_local_data"
+LOCAL = Path(os.environ.get("INPUTSTUDIO_DATA") or (ROOT / "_local_data")).resolve()
 PROJECTS_DIR = LOCAL / "projects"
 WORKERS_PATH = LOCAL / "workers.json"
 ADMIN_SETTINGS_PATH = LOCAL / "admin_settings.json"
+# Content-addressed PDF store: blobs/<sha[:2]>/<sha>.pdf, hardlinked into project folders.
+BLOBS_DIR = LOCAL / "blobs"
+
+# Subsets of the export font (admin_settings.json "export_font"), keyed by source font + glyph set.
+FONT_CACHE_DIR = LOCAL / "fonts"
+FONT_CACHE_MAX = 32
+# Subsets registered with reportlab per export font and process; past this the whole font is
+# registered once instead (reportlab cannot unregister fonts, so this bounds a long session).
+FONT_SUBSETS_MAX = 8
+
+# Memoized exports: filled PDFs by digest of (template content, placements, used values,
+# export settings), hardlinked into exports/ when an identical export is requested again.
+EXPORT_CACHE_DIR = LOCAL / "export_cache"
+EXPORT_CACHE_MAX = 64
+EXPORT_FORMAT = 2  # bump when export output changes so older artifacts are not reused
+
+# Template rasters are cached per project as raw RGBA (memory-mapped, no PNG round trip),
+# least recently used dropped beyond this many MB.
+RASTER_CACHE_MB = 256
+
+# Without PyMuPDF, one poppler run renders the requested page and up to this many following pages.
+POPPLER_BATCH_PAGES = 4
 
 # Render DPI for preview images and coordinate system in this app.
 RENDER_DPI = 150
 
+# Local render/export service (python -m app serve). Clients opt in via
+# admin_settings.json "render_service_url" or the INPUTSTUDIO_SERVICE env var.
+SERVICE_PORT = 8765
+
+# Server-side undo log: max entries, and window (s) in which repeated edits of one tag merge.
+UNDO_LIMIT = 200
+UNDO_MERGE_SEC = 1.5
+
+# Workspace: recently used projects kept open (document, preview cache, plan, undo log),
+# evicted least-recently-used first beyond this count or estimated memory.
+WORKSPACE_MAX_PROJECTS = 4
+WORKSPACE_MEM_BUDGET_MB = 384
+
+# External change watcher (inotify on Linux, else polling every WATCH_POLL_SEC).
+WATCH_POLL_SEC = 1.0
+WATCH_DEBOUNCE_SEC = 0.3
+
+# Project catalog (search/list without opening project.json files). Saves are flushed to it
+# after CATALOG_FLUSH_SEC; the folder is reconciled by mtime at most every CATALOG_RESCAN_SEC.
+CATALOG_PATH = LOCAL / "catalog.sqlite3"
+CATALOG_FLUSH_SEC = 0.5
+CATALOG_RESCAN_SEC = 30.0
+
+# Workers and work activity (start/private/finish events, monthly totals). workers.json is
+# imported into it once; the file is left in place.
+ACTIVITY_PATH = LOCAL / "activity.sqlite3"
+
 
 def _ensure_dirs() -> None:
     LOCAL.mkdir(parents=True, exist_ok=True)
@@ -51,7 +122,37 @@ def _read_json(path: Path, default: Any) -> Any:
 
 def _write_json(path: Path, data: Any) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2, default=_json_default), encoding="utf-8")
+    _note_own_write(path)
+    if path.name == "project.json" and isinstance(data, dict):
+        _catalog().note(path, data)
+
+
+# (mtime_ns, size) of files this process wrote last, so the watcher can tell them from external edits.
+_OWN_WRITES: dict[str, tuple[int, int]] = {}
+
+
+def _file_stamp(path: Path) -> tuple[int, int] | None:
+    try:
+        st = path.stat()
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def _note_own_write(path: Path) -> None:
+    stamp = _file_stamp(path)
+    if stamp is not None:
+        _OWN_WRITES[str(Path(path).resolve())] = stamp
+
+
+def _is_own_write(path: Path) -> bool:
+    stamp = _file_stamp(path)
+    return stamp is not None and _OWN_WRITES.get(str(Path(path).resolve())) == stamp
+
+
+def _elapsed_ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000.0, 1)
 
 
 def _now_iso() -> str:
@@ -69,6 +170,1098 @@ def _safe_name(s: str) -> str:
     return out or "project"
 
 
+def _blob_put(src: Path, link: bool = True) -> Path:
+    """
+    Add a file to the blob store (once per content) and return the blob path.
+    link=True adopts src's inode instead of copying; only for files owned by the app
+    (external sources are copied so later edits to them cannot reach the store).
+    """
+    h = hashlib.sha256()
+    with src.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    blob = BLOBS_DIR / digest[:2] / f"{digest}.pdf"
+    if not blob.exists():
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        tmp = blob.with_name(blob.name + f".{uuid.uuid4().hex[:6]}.tmp")
+        try:
+            if not link:
+                raise OSError("copy requested")
+            os.link(src, tmp)
+        except OSError:
+            shutil.copy2(src, tmp)
+        os.replace(tmp, blob)
+    return blob
+
+
+def _link_or_copy(src: Path, dst: Path) -> bool:
+    """Replace dst with a hardlink to src (copy when the filesystem cannot link). True if linked."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists() and os.path.samefile(src, dst):
+        return True  # already the same inode (rename over it would be a no-op)
+    tmp = dst.with_name(dst.name + f".{uuid.uuid4().hex[:6]}.tmp")
+    try:
+        os.link(src, tmp)
+        linked = True
+    except OSError:
+        shutil.copy2(src, tmp)
+        linked = False
+    os.replace(tmp, dst)
+    _note_own_write(dst)
+    return linked
+
+
+def _store_file(src: Path, dst: Path, link: bool = True) -> None:
+    """Place src's content at dst as a hardlink to its blob."""
+    _link_or_copy(_blob_put(src, link=link), dst)
+
+
+def _share_file(src: Path, dst: Path) -> None:
+    """
+    Make dst share src's content. Files already backed by a blob (nlink > 1) are linked
+    directly without reading them; others are adopted into the store first.
+    """
+    if src.stat().st_nlink < 2:
+        _store_file(src, src)
+    _link_or_copy(src, dst)
+
+
+def _detach_file(path: Path) -> None:
+    """Copy-on-write: give path its own inode before it is modified in place."""
+    try:
+        if path.stat().st_nlink < 2:
+            return
+    except OSError:
+        return
+    tmp = path.with_name(path.name + f".{uuid.uuid4().hex[:6]}.tmp")
+    shutil.copy2(path, tmp)
+    os.replace(tmp, path)
+    _note_own_write(path)
+
+
+def _gc_blobs() -> dict[str, Any]:
+    """Delete blobs no project links to any more (link count 1 = only the store itself)."""
+    removed = 0
+    freed = 0
+    kept = 0
+    if BLOBS_DIR.exists():
+        for blob in BLOBS_DIR.glob("*/*.pdf"):
+            try:
+                st = blob.stat()
+                if st.st_nlink > 1:
+                    kept += 1
+                    continue
+                blob.unlink()
+                removed += 1
+                freed += int(st.st_size)
+            except OSError:
+                kept += 1
+        for sub in BLOBS_DIR.iterdir():
+            try:
+                sub.rmdir()
+            except OSError:
+                pass
+    return {"removed": removed, "freed_bytes": freed, "kept": kept}
+
+
+def _clone_file(src: Path, dst: Path) -> str:
+    """
+    Make dst an independent copy of src without copying bytes where possible:
+    reflink (Linux FICLONE) -> hardlink -> copy. Returns the method used.
+    Hardlinks are only safe because exports are never modified in place.
+    """
+    try:
+        import fcntl
+
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(dst.name + f".{uuid.uuid4().hex[:6]}.tmp")
+        try:
+            with src.open("rb") as fs, tmp.open("wb") as fd:
+                fcntl.ioctl(fd.fileno(), 0x40049409, fs.fileno())  # FICLONE
+            os.replace(tmp, dst)
+            return "reflink"
+        except OSError:
+            tmp.unlink(missing_ok=True)
+    except ImportError:
+        pass
+    return "hardlink" if _link_or_copy(src, dst) else "copy"
+
+
+class _ZipPackager:
+    """
+    Writes members into a zip as they are produced. PDFs are already compressed, so members are
+    STORED by default; compress=True deflates them (zipfile's own ZIP_DEFLATED). Files on disk are
+    streamed from disk by zipfile; in-memory members are written and released one at a time.
+    """
+
+    def __init__(self, path: Path, compress: bool = False, level: int = 6) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.compress = bool(compress)
+        self.level = int(level)
+        self._ctype = zipfile.ZIP_DEFLATED if self.compress else zipfile.ZIP_STORED
+        self._zf = zipfile.ZipFile(self.path, "w", compression=self._ctype, compresslevel=self.level if self.compress else None, allowZip64=True)
+        self.members = 0
+        self.bytes_in = 0
+        self._result: dict[str, Any] | None = None
+
+    def add(self, arcname: str, data: bytes) -> None:
+        self.members += 1
+        self.bytes_in += len(data)
+        zi = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+        zi.external_attr = 0o600 << 16
+        self._zf.writestr(zi, data, compress_type=self._ctype)
+
+    def add_file(self, path: Path, arcname: str | None = None) -> None:
+        path = Path(path)
+        self.members += 1
+        self.bytes_in += path.stat().st_size
+        self._zf.write(path, arcname=arcname or path.name)  # streamed from disk
+
+    def close(self) -> dict[str, Any]:
+        if self._result is not None:
+            return self._result
+        self._zf.close()
+        self._result = {"zip": str(self.path.resolve()), "members": self.members, "bytes_in": self.bytes_in, "bytes_out": self.path.stat().st_size}
+        return self._result
+
+    def __enter__(self) -> "_ZipPackager":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if exc[0] is None:
+            self.close()
+        else:
+            self._zf.close()
+
+
+def _num(v: Any, default: float) -> float | int:
+    """Number from JSON/UI input; whole numbers stay int (as the UI writes them)."""
+    try:
+        f = float(v or default)
+    except (TypeError, ValueError):
+        f = float(default)
+    return int(f) if f.is_integer() else f
+
+
+class Placement:
+    """
+    One placed field, typed once when loaded instead of re-coerced on every access.
+    Serializes to the project.json placement dict; get()/[]/keys() keep dict-style code and payloads working.
+    """
+
+    __slots__ = ("tag", "page", "x", "y", "font_size", "color", "line_height", "letter_spacing", "extra")
+    FIELDS = ("tag", "page", "x", "y", "font_size", "color", "line_height", "letter_spacing")
+
+    def __init__(
+        self,
+        tag: str = "",
+        page: int = 0,
+        x: float = 0.0,
+        y: float = 0.0,
+        font_size: float = 14,
+        color: str = "#0f172a",
+        line_height: float = 1.2,
+        letter_spacing: float = 0,
+        extra: dict[str, Any] | None = None,
+    ) -> None:
+        self.tag = tag
+        self.page = page
+        self.x = x
+        self.y = y
+        self.font_size = font_size
+        self.color = color
+        self.line_height = line_height
+        self.letter_spacing = letter_spacing
+        self.extra = extra
+
+    @staticmethod
+    def _coerce(key: str, v: Any) -> Any:
+        if key == "tag":
+            return str(v or "").strip()
+        if key == "page":
+            return int(_num(v, 0))
+        if key in ("x", "y"):
+            return float(_num(v, 0))
+        if key == "font_size":
+            return _num(v, 14)
+        if key == "color":
+            return str(v or "#0f172a")
+        if key == "line_height":
+            return _num(v, 1.2)
+        return _num(v, 0)  # letter_spacing
+
+    @classmethod
+    def from_json(cls, d: Any) -> "Placement | None":
+        if isinstance(d, Placement):
+            return d.copy()
+        if not isinstance(d, dict):
+            return None
+        g = d.get
+        extra = None if d.keys() <= _PLACEMENT_FIELDS else {k: v for k, v in d.items() if k not in _PLACEMENT_FIELDS}
+        return cls(
+            str(g("tag") or "").strip(),
+            int(_num(g("page"), 0)),
+            float(_num(g("x"), 0)),
+            float(_num(g("y"), 0)),
+            _num(g("font_size"), 14),
+            str(g("color") or "#0f172a"),
+            _num(g("line_height"), 1.2),
+            _num(g("letter_spacing"), 0),
+            extra or None,
+        )
+
+    def to_json(self) -> dict[str, Any]:
+        d = {k: getattr(self, k) for k in self.FIELDS}
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    def copy(self) -> "Placement":
+        return Placement(*(getattr(self, k) for k in self.FIELDS), extra=dict(self.extra) if self.extra else None)
+
+    def __deepcopy__(self, memo: Any) -> "Placement":
+        return Placement(*(getattr(self, k) for k in self.FIELDS), extra=copy.deepcopy(self.extra, memo))
+
+    # dict-style access (JSON schema keys)
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in Placement.FIELDS:
+            return getattr(self, key)
+        return (self.extra or {}).get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in Placement.FIELDS:
+            return getattr(self, key)
+        return (self.extra or {})[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in Placement.FIELDS:
+            setattr(self, key, self._coerce(key, value))
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: object) -> bool:
+        return key in Placement.FIELDS or key in (self.extra or {})
+
+    def keys(self) -> list[str]:
+        return list(self.FIELDS) + list(self.extra or ())
+
+    def update(self, patch: dict[str, Any]) -> None:
+        for k, v in patch.items():
+            self[k] = v
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, dict):
+            other = Placement.from_json(other)
+        if not isinstance(other, Placement):
+            return NotImplemented
+        return self.to_json() == other.to_json()
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"Placement({self.to_json()!r})"
+
+
+_PLACEMENT_FIELDS = frozenset(Placement.FIELDS)
+
+
+class PlacementStore(dict):
+    """
+    project.data["placements"]: fid -> Placement, validated when loaded and passed by reference.
+    Assigning a plain dict (UI payload, undo entry) converts it; entries that are not dicts are dropped on load.
+    """
+
+    def __init__(self, items: Any = None) -> None:
+        super().__init__()
+        for fid, d in (items or {}).items():
+            pl = Placement.from_json(d)
+            if pl is not None:
+                super().__setitem__(str(fid), pl)
+
+    def __setitem__(self, fid: str, pl: Any) -> None:
+        p = pl if isinstance(pl, Placement) else Placement.from_json(pl)
+        if p is None:
+            raise TypeError("placement must be an object")
+        super().__setitem__(str(fid), p)
+
+    def update(self, other: Any = (), **kw: Any) -> None:  # type: ignore[override]
+        for k, v in dict(other, **kw).items():
+            self[k] = v
+
+    def copy(self) -> "PlacementStore":  # type: ignore[override]
+        return PlacementStore({k: v.copy() for k, v in self.items()})
+
+    def to_json(self) -> dict[str, dict[str, Any]]:
+        return {k: v.to_json() for k, v in self.items()}
+
+    def pages_for_tags(self, tags: set[str]) -> set[int]:
+        return {pl.page for pl in self.values() if pl.tag in tags}
+
+
+def _json_default(o: Any) -> Any:
+    if isinstance(o, Placement):
+        return o.to_json()
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
+
+
+def _placements_json(placements: Any) -> dict[str, Any]:
+    """Plain-dict placements for bridge/HTTP responses."""
+    if isinstance(placements, PlacementStore):
+        return placements.to_json()
+    return {k: (v.to_json() if isinstance(v, Placement) else v) for k, v in (placements or {}).items()}
+
+
+def _diff_payload(old: dict[str, Any], new: dict[str, Any]) -> list[tuple[str, str, Any, Any]]:
+    """
+    Structural diff of two tags/values/placements payloads as (kind, key, before, after)
+    changes; None stands for "absent". Placements are keyed by fid, values by tag.
+    """
+    changes: list[tuple[str, str, Any, Any]] = []
+    for kind, section in (("placement", "placements"), ("value", "values")):
+        a = old.get(section) or {}
+        b = new.get(section) or {}
+        for key in list(a.keys()) + [k for k in b.keys() if k not in a]:
+            va, vb = a.get(key), b.get(key)
+            if va != vb:
+                changes.append((kind, str(key), copy.deepcopy(va), copy.deepcopy(vb)))
+    ta, tb = list(old.get("tags") or []), list(new.get("tags") or [])
+    if ta != tb:
+        changes.append(("tags", "", ta, tb))
+    return changes
+
+
+_JP_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\u3000-\u303f\uff00-\uffef]")
+
+
+def _needs_jp(s: str) -> bool:
+    return bool(_JP_RE.search(s or ""))
+
+
+_EXPORT_FONTS: tuple[str, dict[str, float]] | None = None
+
+
+def _export_fonts() -> tuple[str, dict[str, float]]:
+    """(Japanese font name, font name -> ascent per point of font size) for PDF export. Registered once."""
+    global _EXPORT_FONTS
+    if _EXPORT_FONTS is None:
+        from reportlab.pdfbase import pdfmetrics
+
+        # Ensure Japanese-capable font for PDF export.
+        try:
+            from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+
+            pdfmetrics.registerFont(UnicodeCIDFont("HeiseiKakuGo-W5"))
+            jp_font = "HeiseiKakuGo-W5"
+        except Exception:
+            jp_font = "Helvetica"
+        ascents: dict[str, float] = {}
+        for name in {"Helvetica", jp_font}:
+            try:
+                ascents[name] = float(pdfmetrics.getAscent(name) or 0) / 1000.0
+            except Exception:
+                ascents[name] = 0.8
+        _EXPORT_FONTS = (jp_font, ascents)
+    return _EXPORT_FONTS
+
+
+@dataclass(frozen=True)
+class ExportFont:
+    """
+    Embedded export font registered with reportlab. covers: characters it has glyphs for;
+    subset_of: characters the subset was cut for (None: the whole font).
+    """
+
+    name: str
+    ascent: float
+    covers: frozenset[str]
+    subset_of: frozenset[str] | None = None
+
+
+_FONT_LOCK = threading.Lock()
+_SUBSET_FONTS: dict[str, list[ExportFont]] = {}  # source font key -> registered subsets
+
+
+def _export_font_path() -> Path | None:
+    """Configured export font (admin_settings.json "export_font": TTF/OTF/TTC path), if it exists."""
+    s = _read_json(ADMIN_SETTINGS_PATH, {})
+    p = str((s.get("export_font") if isinstance(s, dict) else "") or "").strip()
+    if not p:
+        return None
+    path = Path(p).expanduser()
+    return path if path.is_file() else None
+
+
+def _export_chars(texts: Any) -> set[str]:
+    out: set[str] = set()
+    for t in texts:
+        out.update(str(t or "").replace("<br>", "\n"))
+    out.discard("\n")
+    out.discard("\r")
+    return out
+
+
+def _cff_to_glyf(font: Any) -> None:
+    """Convert CFF (OTF) outlines to TrueType glyf in place; reportlab embeds TrueType outlines only."""
+    from fontTools.pens.cu2quPen import Cu2QuPen
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+    from fontTools.ttLib import newTable
+
+    order = font.getGlyphOrder()
+    glyph_set = font.getGlyphSet()
+    glyf = newTable("glyf")
+    glyf.glyphOrder = order
+    glyf.glyphs = {}
+    for name in order:
+        pen = TTGlyphPen(glyph_set)
+        glyph_set[name].draw(Cu2QuPen(pen, 1.0, reverse_direction=True))
+        glyf[name] = pen.glyph()
+    font["glyf"] = glyf
+    font["loca"] = newTable("loca")
+    font["head"].glyphDataFormat = 0
+    del font["CFF "]
+    if "VORG" in font:
+        del font["VORG"]
+    maxp = font["maxp"] = newTable("maxp")
+    maxp.tableVersion = 0x00010000
+    for k in ("maxZones", "maxTwilightPoints", "maxStorage", "maxFunctionDefs", "maxInstructionDefs", "maxStackElements", "maxSizeOfInstructions", "maxComponentElements"):
+        setattr(maxp, k, 0)
+    maxp.maxZones = 1
+    post = font["post"]
+    post.formatType = 2.0
+    post.extraNames = []
+    post.mapping = {}
+    post.glyphOrder = order
+    font.sfntVersion = "\0\1\0\0"
+
+
+def _subset_font_file(src: Path, chars: set[str], out: Path) -> frozenset[str]:
+    """Write src cut down to the glyphs for chars (fontTools) as TrueType to out; returns the covered chars."""
+    from fontTools import subset as ftsubset
+    from fontTools.ttLib import TTFont as FTFont
+
+    font = FTFont(str(src), fontNumber=0)
+    cmap = font.getBestCmap() or {}
+    covers = frozenset(c for c in chars if ord(c) in cmap)
+    opts = ftsubset.Options()
+    opts.notdef_outline = True
+    opts.hinting = False
+    opts.layout_features = []
+    opts.name_IDs = ["*"]
+    opts.name_languages = ["*"]
+    sub = ftsubset.Subsetter(opts)
+    sub.populate(unicodes=[ord(c) for c in covers])
+    sub.subset(font)
+    if "glyf" not in font and "CFF " in font:
+        _cff_to_glyf(font)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(".tmp")
+    font.save(str(tmp))
+    os.replace(tmp, out)
+    return covers
+
+
+def _embedded_export_font(chars: set[str]) -> ExportFont | None:
+    """
+    The configured export font, subset to cover chars, registered for reportlab; None when no font is
+    configured or it cannot be used (export then keeps Helvetica / HeiseiKakuGo-W5). A subset already
+    covering chars is reused (one per batch), a new one is cut as a superset of the last, and subsets
+    are kept on disk under FONT_CACHE_DIR. After FONT_SUBSETS_MAX subsets, and without fontTools, the
+    whole font is registered; reportlab still embeds only the glyphs drawn.
+    """
+    src = _export_font_path()
+    if src is None:
+        return None
+    st = src.stat()
+    src_key = f"{src}|{st.st_size}|{st.st_mtime_ns}"
+    with _FONT_LOCK:
+        subsets = _SUBSET_FONTS.setdefault(src_key, [])
+        for f in reversed(subsets):  # newest is the largest (supersets below)
+            if f.subset_of is None or chars <= f.subset_of:
+                return f
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        if subsets and subsets[-1].subset_of is not None:
+            chars = chars | subsets[-1].subset_of  # grow one superset rather than many disjoint subsets
+        digest = hashlib.sha1((src_key + "\0" + "".join(sorted(chars))).encode("utf-8")).hexdigest()[:16]
+        try:
+            import fontTools  # noqa: F401
+        except ImportError:
+            digest = ""
+        if len(subsets) >= FONT_SUBSETS_MAX:
+            digest = ""  # registry bound reached: the whole font, which every later export reuses
+        try:
+            if digest:
+                path = FONT_CACHE_DIR / f"{digest}.ttf"
+                covers = None
+                if path.exists():
+                    os.utime(path)
+                else:
+                    covers = _subset_font_file(src, chars, path)
+                    _prune_font_cache()
+                name = f"IS-{digest}"
+                ttf = TTFont(name, str(path))
+                if covers is None:
+                    covers = frozenset(c for c in chars if ord(c) in ttf.face.charToGlyph)
+            else:
+                name = f"IS-{hashlib.sha1(src_key.encode('utf-8')).hexdigest()[:16]}"
+                ttf = TTFont(name, str(src), subfontIndex=0)
+                covers = frozenset(chr(c) for c in ttf.face.charToGlyph)
+            pdfmetrics.registerFont(ttf)
+            f = ExportFont(name, float(pdfmetrics.getAscent(name) or 800) / 1000.0, covers, frozenset(chars) if digest else None)
+        except Exception:
+            return None
+        subsets.append(f)
+        return f
+
+
+_FONT_FACES: dict[str, Any] = {}
+
+
+def _export_font_face() -> tuple[Path, Any] | None:
+    """The configured export font parsed whole (reportlab TTFontFace, not registered), for its advances and cmap."""
+    src = _export_font_path()
+    if src is None:
+        return None
+    st = src.stat()
+    key = f"{src}|{st.st_size}|{st.st_mtime_ns}"
+    with _FONT_LOCK:
+        face = _FONT_FACES.get(key)
+        if face is None:
+            from reportlab.pdfbase.ttfonts import TTFontFace
+
+            try:
+                face = TTFontFace(str(src), subfontIndex=0)
+            except Exception:
+                face = False
+            _FONT_FACES.clear()
+            _FONT_FACES[key] = face
+    return (src, face) if face else None
+
+
+def _glyph_metrics(chars: set[str]) -> dict[str, Any]:
+    """
+    Export text metrics for laying text out outside reportlab (the browser overlay preview): per font
+    ("latin": Helvetica, "jp": the CID font, "export": the configured export font) its ascent per point
+    and the advance of each char in 1/1000 of the font size, as _export_filled_pdf measures them.
+    Export font advances are None for chars it has no glyph for (such text is set in latin/jp).
+    """
+    from reportlab.pdfbase import pdfmetrics
+
+    jp_font, ascents = _export_fonts()
+    out: dict[str, Any] = {}
+    for key, name in (("latin", "Helvetica"), ("jp", jp_font)):
+        adv: dict[str, float] = {}
+        for ch in chars:
+            try:
+                adv[ch] = round(float(pdfmetrics.stringWidth(ch, name, 1000)), 3)
+            except Exception:
+                adv[ch] = 620.0  # the exporter's fallback (0.62 em)
+        out[key] = {"name": name, "ascent": ascents[name], "advances": adv}
+    ef = _export_font_face()
+    if ef is not None:
+        src, face = ef
+        cmap = face.charToGlyph
+        out["export"] = {
+            "name": src.stem,
+            "ascent": float(face.ascent) / 1000.0,
+            "url": src.resolve().as_uri(),
+            "advances": {ch: (round(float(face.getCharWidth(ord(ch))), 3) if ord(ch) in cmap else None) for ch in chars},
+        }
+    return out
+
+
+def _prune_export_cache() -> None:
+    """Keep the EXPORT_CACHE_MAX most recently used memoized exports / optimized templates (links in exports/ stay valid)."""
+    for d in (EXPORT_CACHE_DIR, EXPORT_CACHE_DIR / "templates"):
+        try:
+            files = sorted(d.glob("*.pdf"), key=lambda p: p.stat().st_mtime, reverse=True)
+        except OSError:
+            continue
+        for p in files[EXPORT_CACHE_MAX:]:
+            try:
+                p.unlink()
+                p.with_suffix(".json").unlink(missing_ok=True)
+            except OSError:
+                pass
+
+
+def _optimize_settings(project_data: Any = None) -> dict[str, Any] | None:
+    """
+    Output optimization settings, or None when off: project.json "optimize" (per template) over
+    admin_settings.json "optimize". Either is true/false or {"enabled", "dpi", "jpeg_quality"}.
+    """
+    s = _read_json(ADMIN_SETTINGS_PATH, {})
+    cfg = s.get("optimize") if isinstance(s, dict) else None
+    if isinstance(project_data, dict) and project_data.get("optimize") is not None:
+        cfg = project_data["optimize"]
+    if cfg is True:
+        cfg = {}
+    if not isinstance(cfg, dict) or not cfg.get("enabled", True):
+        return None
+    return {"dpi": float(cfg.get("dpi") or 200), "jpeg_quality": int(cfg.get("jpeg_quality") or 80)}
+
+
+def _optimize_pdf(src: Path, dst: Path, dpi: float = 200.0, jpeg_quality: int = 80) -> dict[str, Any]:
+    """
+    Shrink a PDF of scanned pages: page images finer than dpi are downsampled and re-encoded
+    (JPEG at jpeg_quality), identical objects are merged (images repeated across pages) and
+    unreferenced ones dropped. dst may be src. The original is kept when nothing gets smaller.
+    """
+    import io
+
+    from PIL import Image
+    from pypdf import PdfReader, PdfWriter
+
+    t0 = time.perf_counter()
+    data_in = Path(src).read_bytes()
+    writer = PdfWriter(clone_from=PdfReader(io.BytesIO(data_in)))
+    done: set[Any] = set()
+    resampled = 0
+    for page in writer.pages:
+        w_in = float(page.mediabox.width) / 72.0
+        h_in = float(page.mediabox.height) / 72.0
+        for img in page.images:
+            ref = img.indirect_reference
+            key = ref.idnum if ref is not None else id(img)
+            if key in done:
+                continue
+            done.add(key)
+            try:
+                pil = img.image
+                if pil is None or pil.mode not in ("RGB", "L"):
+                    continue  # bilevel, masks, CMYK, palettes: left as they are
+                # an image is shown no larger than its page, so this scale keeps at least dpi
+                scale = max(dpi * w_in / pil.width, dpi * h_in / pil.height)
+                if scale >= 0.95:
+                    continue
+                small = pil.resize((max(1, round(pil.width * scale)), max(1, round(pil.height * scale))), Image.LANCZOS)
+                img.replace(small, quality=int(jpeg_quality))
+                resampled += 1
+            except Exception:
+                continue
+    try:
+        writer.compress_identical_objects(remove_duplicates=True, remove_unreferenced=True)
+    except TypeError:  # pypdf < 5.1 keyword names
+        writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    except AttributeError:
+        pass
+    buf = io.BytesIO()
+    writer.write(buf)
+    data_out = buf.getvalue() if buf.tell() < len(data_in) else data_in
+    dst = Path(dst)
+    tmp = dst.with_name(dst.name + f".{uuid.uuid4().hex[:6]}.tmp")
+    tmp.write_bytes(data_out)
+    os.replace(tmp, dst)
+    return {
+        "bytes_in": len(data_in),
+        "bytes_out": len(data_out),
+        "saved": len(data_in) - len(data_out),
+        "images_resampled": resampled,
+        "elapsed_ms": _elapsed_ms(t0),
+    }
+
+
+def _prune_font_cache() -> None:
+    try:
+        files = sorted(FONT_CACHE_DIR.glob("*.ttf"), key=lambda p: p.stat().st_mtime, reverse=True)
+    except OSError:
+        return
+    for p in files[FONT_CACHE_MAX:]:
+        try:
+            p.unlink()
+        except OSError:
+            pass
+
+
+def _reader_geometry(reader: Any) -> list[tuple[float, float, float, float, float, float]]:
+    """Per page (media_w, media_h, crop_llx, crop_lly, crop_w, crop_h) in points (CropBox like preview)."""
+    out = []
+    for page in reader.pages:
+        media = page.mediabox
+        crop = getattr(page, "cropbox", None) or media
+        ll = getattr(crop, "lower_left", (0, 0))
+        out.append((float(media.width), float(media.height), float(ll[0]), float(ll[1]), float(crop.width), float(crop.height)))
+    return out
+
+
+def _fitz_geometry(doc: Any) -> list[tuple[float, float, float, float, float, float]]:
+    """_reader_geometry from an open PyMuPDF document (its cropbox is y-down from the MediaBox top)."""
+    out = []
+    for page in doc:
+        media, crop = page.mediabox, page.cropbox
+        out.append((float(media.width), float(media.height), float(crop.x0), float(media.y1 - crop.y1), float(crop.width), float(crop.height)))
+    return out
+
+
+@dataclass
+class ExportLayout:
+    """
+    Placement layout in PDF points, computed once per template geometry + placements.
+    Columns are indexed by placement; by_page lists placement indices per page in placement order.
+    Per record, export only looks up text and emits it.
+    """
+
+    pages: list[tuple[float, float]]
+    tag: list[str]
+    x_pt: list[float]
+    y_base: dict[str, list[float]]
+    fs_pt: list[float]
+    line_pt: list[float]
+    letter_pt: list[float]
+    color: list[str]
+    by_page: dict[int, list[int]]
+
+
+def _build_export_layout(
+    geom: list[tuple[float, float, float, float, float, float]],
+    placements: dict[str, Any],
+    ascents: dict[str, float],
+    use_numpy: bool = True,
+) -> ExportLayout:
+    """Pixel (RENDER_DPI) -> point transform for all placements; vectorized with NumPy when available."""
+    n_pages = len(geom)
+    tags: list[str] = []
+    cols: list[tuple[float, float, float, float, float, float]] = []
+    colors: list[str] = []
+    for _, p in placements.items():
+        if not isinstance(p, Placement):
+            p = Placement.from_json(p)
+            if p is None:
+                continue
+        pi = p.page
+        if not p.tag or pi < 0 or pi >= n_pages:
+            continue
+        tags.append(p.tag)
+        colors.append(p.color)
+        cols.append((float(pi), p.x, p.y, float(p.font_size), float(p.line_height), float(p.letter_spacing)))
+    px2pt = 72.0 / RENDER_DPI
+    np: Any = None
+    if use_numpy:
+        try:
+            import numpy as np
+        except ImportError:  # pragma: no cover
+            np = None
+
+    if np is not None and cols:
+        g = np.asarray(geom, dtype=np.float64).reshape(-1, 6)
+        a = np.asarray(cols, dtype=np.float64)
+        page = a[:, 0].astype(np.int64)
+        llx, lly, cw, ch = g[page, 2], g[page, 3], g[page, 4], g[page, 5]
+        # match preview pixel rounding
+        cw_px = np.maximum(1.0, np.round(cw / 72.0 * RENDER_DPI))
+        ch_px = np.maximum(1.0, np.round(ch / 72.0 * RENDER_DPI))
+        x_pt = llx + (a[:, 1] / cw_px) * cw
+        y_top = lly + ch - (a[:, 2] / ch_px) * ch
+        fs_pt = a[:, 3] * px2pt
+        y_base = {f: (y_top - asc * fs_pt - 0.08 * fs_pt).tolist() for f, asc in ascents.items()}
+        line_pt = (fs_pt * a[:, 4]).tolist()
+        letter_pt = (a[:, 5] * px2pt).tolist()
+        pages_col = page.tolist()
+        x_list, fs_list = x_pt.tolist(), fs_pt.tolist()
+    else:
+        x_list, fs_list, line_pt, letter_pt, pages_col = [], [], [], [], []
+        y_base = {f: [] for f in ascents}
+        for pi_f, x_px, y_px, fs_px, line_h, letter_px in cols:
+            pi = int(pi_f)
+            _, _, llx, lly, cw, ch = geom[pi]
+            cw_px = max(1, int(round(cw / 72.0 * RENDER_DPI)))
+            ch_px = max(1, int(round(ch / 72.0 * RENDER_DPI)))
+            fs = fs_px * px2pt
+            y_top = lly + ch - ((y_px / float(ch_px)) * ch)
+            x_list.append(llx + (x_px / float(cw_px)) * cw)
+            fs_list.append(fs)
+            for f, asc in ascents.items():
+                y_base[f].append(y_top - asc * fs - 0.08 * fs)
+            line_pt.append(fs * line_h)
+            letter_pt.append(letter_px * px2pt)
+            pages_col.append(pi)
+
+    by_page: dict[int, list[int]] = {}
+    for i, pi in enumerate(pages_col):
+        by_page.setdefault(int(pi), []).append(i)
+    return ExportLayout(
+        pages=[(g0[0], g0[1]) for g0 in geom],
+        tag=tags,
+        x_pt=x_list,
+        y_base=y_base,
+        fs_pt=fs_list,
+        line_pt=line_pt,
+        letter_pt=letter_pt,
+        color=colors,
+        by_page=by_page,
+    )
+
+
+_PLAN_MAGIC = b"ISPLAN03"
+_PLAN_HEADER = struct.Struct("<8sIIQQ20sI")  # magic, dpi, pages, template size, mtime_ns, sha1, meta length
+_PLAN_GEOM_COLS = 8  # media_w, media_h, crop_llx, crop_lly, crop_w, crop_h, px_w, px_h
+_PLAN_LAYOUT_COLS = ("page", "x_pt", "fs_pt", "line_pt", "letter_pt")
+
+
+def _file_sha1(path: Path) -> bytes:
+    h = hashlib.sha1()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+_SHA1_CACHE: dict[tuple[str, int, int, int], bytes] = {}
+
+
+def _file_sha1_cached(path: Path) -> bytes:
+    """_file_sha1 remembered per (path, inode, size, mtime), so unchanged templates are hashed once."""
+    st = path.stat()
+    key = (str(path), st.st_ino, st.st_size, st.st_mtime_ns)
+    h = _SHA1_CACHE.get(key)
+    if h is None:
+        if len(_SHA1_CACHE) > 256:
+            _SHA1_CACHE.clear()
+        h = _SHA1_CACHE[key] = _file_sha1(path)
+    return h
+
+
+def _page_hashes(pdf_path: Path, doc: Any = None) -> list[str]:
+    """
+    Per-page content fingerprints: content streams, form XObjects, image data, font identities,
+    geometry and annotations. Object numbers are left out, so a page keeps its fingerprint when
+    pages around it are inserted, removed or reordered, or the file is rewritten.
+    """
+    out: list[str] = []
+    fz = _fitz()
+    if fz is not None:
+        own = doc is None
+        if own:
+            doc = fz.open(str(pdf_path))
+        try:
+            for page in doc:
+                h = hashlib.sha1(page.read_contents())
+                h.update(repr((tuple(page.rect), tuple(page.cropbox), page.rotation)).encode("utf-8"))
+                for x in page.get_xobjects():
+                    h.update(hashlib.sha1(doc.xref_stream(x[0]) or b"").digest())
+                for img in page.get_images(full=True):
+                    h.update(hashlib.sha1(doc.xref_stream_raw(img[0]) or b"").digest())
+                    h.update(repr(img[2:9]).encode("utf-8", "replace"))
+                for f in page.get_fonts(full=True):
+                    h.update(repr(f[1:6]).encode("utf-8", "replace"))
+                for a in page.annots() or ():
+                    h.update(repr((a.type, tuple(a.rect), a.info.get("content"))).encode("utf-8", "replace"))
+                out.append(h.hexdigest())
+        finally:
+            if own:
+                doc.close()
+        return out
+    from pypdf import PdfReader
+
+    for page in PdfReader(str(pdf_path)).pages:
+        contents = page.get_contents()
+        h = hashlib.sha1(contents.get_data() if contents is not None else b"")
+        h.update(repr((list(page.mediabox), list(page.cropbox), page.get("/Rotate"))).encode("utf-8"))
+        # scanned pages share one content stream ("/Im0 Do"): the images, forms and fonts tell them apart
+        seen: set[tuple[int, int]] = set()
+        _hash_pdf_object(page.get("/Resources"), h, seen)
+        _hash_pdf_object(page.get("/Annots"), h, seen)
+        out.append(h.hexdigest())
+    return out
+
+
+def _hash_pdf_object(obj: Any, h: Any, seen: set[tuple[int, int]]) -> None:
+    """Feed a pypdf object into h by value: references followed, object numbers left out, stream data hashed."""
+    from pypdf.generic import IndirectObject, StreamObject
+
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key in seen:
+            h.update(b"@")
+            return
+        seen.add(key)
+        obj = obj.get_object()
+    if isinstance(obj, StreamObject):
+        try:
+            data = obj.get_data()
+        except Exception:
+            data = b""
+        h.update(b"S" + hashlib.sha1(data).digest())
+    if isinstance(obj, dict):
+        h.update(b"{")
+        for k in sorted(obj):
+            if k in ("/Parent", "/P"):
+                continue  # back references to the page tree
+            h.update(str(k).encode("utf-8", "replace"))
+            _hash_pdf_object(dict.__getitem__(obj, k), h, seen)
+        h.update(b"}")
+    elif isinstance(obj, list):
+        h.update(b"[")
+        for v in obj:
+            _hash_pdf_object(v, h, seen)
+        h.update(b"]")
+    elif obj is not None:
+        h.update(repr(obj).encode("utf-8", "replace"))
+
+
+def _placements_digest(placements: dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(placements, sort_keys=True, ensure_ascii=False, default=_json_default).encode("utf-8")).hexdigest()
+
+
+class TemplatePlan:
+    """
+    Compiled per-template artifact (template.plan beside project.json), keyed by the template's
+    content hash and memory-mapped on load: page geometry in points and preview pixels, export
+    font ascents and the last export layout. Sizing, preview and export read it instead of re-parsing the PDF.
+
+    Layout: header | meta JSON (8-byte aligned) | geometry float64[pages][8] | layout float64 columns.
+    """
+
+    def __init__(self, path: Path, mm: Any, meta: dict[str, Any], n_pages: int, size: int, mtime_ns: int, sha1: bytes) -> None:
+        self.path = path
+        self._mm = mm
+        self.meta = meta
+        self.n_pages = n_pages
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sha1 = sha1
+        off = _PLAN_HEADER.size + len(json.dumps(meta).encode("utf-8"))
+        off = (off + 7) // 8 * 8
+        self._geom = memoryview(mm)[off : off + n_pages * _PLAN_GEOM_COLS * 8].cast("d")
+        self._layout_off = off + n_pages * _PLAN_GEOM_COLS * 8
+
+    @classmethod
+    def open(cls, path: Path) -> "TemplatePlan | None":
+        import mmap
+
+        try:
+            with path.open("rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, dpi, n_pages, size, mtime_ns, sha1, meta_len = _PLAN_HEADER.unpack_from(mm, 0)
+            if magic != _PLAN_MAGIC or dpi != RENDER_DPI:
+                mm.close()
+                return None
+            meta = json.loads(bytes(mm[_PLAN_HEADER.size : _PLAN_HEADER.size + meta_len]).decode("utf-8"))
+            return cls(path, mm, meta, n_pages, size, mtime_ns, sha1)
+        except Exception:
+            return None
+
+    @staticmethod
+    def write(
+        path: Path,
+        pdf_path: Path,
+        geom: list[tuple[float, ...]],
+        meta: dict[str, Any],
+        layout_cols: list[list[float]] | None = None,
+        sha1: bytes | None = None,
+    ) -> None:
+        st = pdf_path.stat()
+        meta_b = json.dumps(meta).encode("utf-8")
+        head = _PLAN_HEADER.pack(_PLAN_MAGIC, RENDER_DPI, len(geom), st.st_size, st.st_mtime_ns, sha1 or _file_sha1(pdf_path), len(meta_b))
+        pad = b"\0" * ((-(len(head) + len(meta_b))) % 8)
+        body = array("d", [float(v) for row in geom for v in row])
+        tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex[:6]}.tmp")
+        with tmp.open("wb") as f:
+            f.write(head + meta_b + pad)
+            body.tofile(f)
+            for col in layout_cols or []:
+                array("d", col).tofile(f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def compile(cls, path: Path, pdf_path: Path, fitz_doc: Any = None) -> "TemplatePlan | None":
+        geom = []
+        sizes: list[tuple[float, float]] = []
+        if fitz_doc is not None:
+            # The open document already has every box: no second parse of the template.
+            # Preview renders via PyMuPDF, whose page rect honours CropBox/rotation.
+            rows = _fitz_geometry(fitz_doc)
+            sizes = [(float(page.rect.width), float(page.rect.height)) for page in fitz_doc]
+        else:
+            from pypdf import PdfReader
+
+            reader = PdfReader(str(pdf_path))
+            rows = _reader_geometry(reader)
+            for pi, g in enumerate(rows):
+                # poppler (pdf2image) renders the CropBox, rotated
+                rotated = int(reader.pages[pi].rotation or 0) % 180
+                sizes.append((g[5], g[4]) if rotated else (g[4], g[5]))
+        for g, (w_pt, h_pt) in zip(rows, sizes):
+            px_w = max(1, int(round(w_pt / 72.0 * RENDER_DPI)))
+            px_h = max(1, int(round(h_pt / 72.0 * RENDER_DPI)))
+            geom.append((*g, float(px_w), float(px_h)))
+        jp_font, ascents = _export_fonts()
+        meta = {"jp_font": jp_font, "ascents": ascents, "page_hashes": _page_hashes(pdf_path, fitz_doc)}
+        cls.write(path, pdf_path, geom, meta)
+        return cls.open(path)
+
+    def close(self) -> None:
+        try:
+            self._geom.release()
+            self._mm.close()
+        except Exception:
+            pass
+
+    def matches(self, pdf_path: Path) -> bool:
+        """Cheap freshness check (size + mtime) against the template file."""
+        try:
+            st = pdf_path.stat()
+        except Exception:
+            return False
+        return st.st_size == self.size and st.st_mtime_ns == self.mtime_ns
+
+    def page_px(self, page_index: int) -> tuple[int, int]:
+        pi = min(max(0, int(page_index)), self.n_pages - 1)
+        base = pi * _PLAN_GEOM_COLS
+        return int(self._geom[base + 6]), int(self._geom[base + 7])
+
+    def geometry(self) -> list[tuple[float, float, float, float, float, float]]:
+        g = self._geom
+        return [tuple(g[i * _PLAN_GEOM_COLS : i * _PLAN_GEOM_COLS + 6]) for i in range(self.n_pages)]  # type: ignore[misc]
+
+    def layout(self, digest: str) -> ExportLayout | None:
+        """Stored export layout if it was built for the same placements digest."""
+        info = self.meta.get("layout")
+        if not isinstance(info, dict) or info.get("digest") != digest:
+            return None
+        n = int(info.get("n") or 0)
+        fonts = list(info.get("fonts") or [])
+        names = list(_PLAN_LAYOUT_COLS) + [f"y_base:{f}" for f in fonts]
+        cols = memoryview(self._mm)[self._layout_off : self._layout_off + len(names) * n * 8].cast("d")
+        col = {name: cols[k * n : (k + 1) * n].tolist() for k, name in enumerate(names)}
+        by_page: dict[int, list[int]] = {}
+        for i, pi in enumerate(col["page"]):
+            by_page.setdefault(int(pi), []).append(i)
+        g = self.geometry()
+        return ExportLayout(
+            pages=[(row[0], row[1]) for row in g],
+            tag=list(info.get("tags") or []),
+            x_pt=col["x_pt"],
+            y_base={f: col[f"y_base:{f}"] for f in fonts},
+            fs_pt=col["fs_pt"],
+            line_pt=col["line_pt"],
+            letter_pt=col["letter_pt"],
+            color=list(info.get("colors") or []),
+            by_page=by_page,
+        )
+
+    def with_layout(self, pdf_path: Path, digest: str, layout: ExportLayout) -> "TemplatePlan | None":
+        """Rewrite the plan including layout (returns the re-mapped plan; this one is closed)."""
+        page_col = [0.0] * len(layout.tag)
+        for pi, idxs in layout.by_page.items():
+            for i in idxs:
+                page_col[i] = float(pi)
+        fonts = sorted(layout.y_base.keys())
+        cols = [page_col, layout.x_pt, layout.fs_pt, layout.line_pt, layout.letter_pt] + [layout.y_base[f] for f in fonts]
+        meta = dict(self.meta)
+        meta["layout"] = {"digest": digest, "n": len(layout.tag), "fonts": fonts, "tags": layout.tag, "colors": layout.color}
+        geom = [tuple(self._geom[i * _PLAN_GEOM_COLS : (i + 1) * _PLAN_GEOM_COLS]) for i in range(self.n_pages)]
+        sha1 = self.sha1
+        self.close()  # unmap before replacing the file (Windows)
+        TemplatePlan.write(self.path, pdf_path, geom, meta, cols, sha1=sha1)
+        return TemplatePlan.open(self.path)
+
+
 def _pick_file(title: str, filetypes: list[tuple[str, str]], initialdir: str | None = None) -> str | None:
     # tkinter is stdlib; make sure the dialog is visible on pywebview contexts.
     import tkinter as tk
@@ -100,42 +1293,899 @@ def _pick_file(title: str, filetypes: list[tuple[str, str]], initialdir: str | N
             pass
 
 
+class _FileWatcher:
+    """
+    Watches a changing set of files (get_paths() is re-read every cycle) and calls on_change(paths)
+    from its own thread once events have been quiet for WATCH_DEBOUNCE_SEC.
+    Linux: inotify on the files' directories (so atomic replaces are seen). Elsewhere: stat polling.
+    """
+
+    _MASK = 0x008 | 0x080 | 0x100  # IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, get_paths: Any, on_change: Any, poll_sec: float = WATCH_POLL_SEC) -> None:
+        self._get_paths = get_paths
+        self._on_change = on_change
+        self._poll_sec = float(poll_sec)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._libc: Any = None
+        self._fd: int | None = None
+        self.mode = "poll"
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._inotify_init()
+        self.mode = "inotify" if self._fd is not None else "poll"
+        self._thread = threading.Thread(target=self._run, name="file-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+
+    def _inotify_init(self) -> None:
+        if not sys.platform.startswith("linux"):
+            return
+        try:
+            import ctypes
+
+            libc = ctypes.CDLL(None, use_errno=True)
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            fd = int(libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC))
+            if fd >= 0:
+                self._libc, self._fd = libc, fd
+        except Exception:
+            self._libc, self._fd = None, None
+
+    def _read_events(self, dir_of_wd: dict[int, str], wanted: dict[tuple[str, str], Path]) -> set[Path]:
+        import select
+
+        hits: set[Path] = set()
+        ready, _, _ = select.select([self._fd], [], [], 0.25)
+        if not ready:
+            return hits
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return hits
+        off = 0
+        while off + 16 <= len(buf):
+            wd, _, _, ln = struct.unpack_from("iIII", buf, off)
+            name = buf[off + 16 : off + 16 + ln].split(b"\0", 1)[0].decode("utf-8", "replace")
+            off += 16 + ln
+            p = wanted.get((dir_of_wd.get(wd, ""), name))
+            if p is not None:
+                hits.add(p)
+        return hits
+
+    def _run(self) -> None:
+        stamps: dict[str, tuple[int, int] | None] = {}
+        wd_of_dir: dict[str, int] = {}
+        dir_of_wd: dict[int, str] = {}
+        pending: set[Path] = set()
+        last_event = 0.0
+        while not self._stop.is_set():
+            try:
+                paths = [Path(p) for p in self._get_paths()]
+            except Exception:
+                paths = []
+            if self._fd is not None:
+                dirs = {str(p.parent) for p in paths}
+                for d in dirs - wd_of_dir.keys():
+                    wd = int(self._libc.inotify_add_watch(self._fd, os.fsencode(d), self._MASK))
+                    if wd >= 0:
+                        wd_of_dir[d] = wd
+                        dir_of_wd[wd] = d
+                for d in set(wd_of_dir) - dirs:
+                    wd = wd_of_dir.pop(d)
+                    dir_of_wd.pop(wd, None)
+                    self._libc.inotify_rm_watch(self._fd, wd)
+                hits = self._read_events(dir_of_wd, {(str(p.parent), p.name): p for p in paths})
+            else:
+                hits = set()
+                for p in paths:
+                    st = _file_stamp(p)
+                    if str(p) in stamps and stamps[str(p)] != st:
+                        hits.add(p)
+                    stamps[str(p)] = st
+                for key in set(stamps) - {str(p) for p in paths}:
+                    stamps.pop(key, None)
+                self._stop.wait(self._poll_sec)
+            if hits:
+                pending |= hits
+                last_event = time.monotonic()
+            if pending and time.monotonic() - last_event >= WATCH_DEBOUNCE_SEC:
+                batch, pending = pending, set()
+                try:
+                    self._on_change(batch)
+                except Exception:
+                    pass
+
+
+_RASTER_MAGIC = b"ISRGBA01"
+_RASTER_HEADER = struct.Struct("<8sIII")  # magic, format version, width, height; then height rows of width*4 bytes
+_RASTER_VERSION = 1
+
+
+def _raster_write(path: Path, width: int, height: int, pixels: Any) -> None:
+    """
+    Store RGBA pixels (bytes-like, row-major) as header + raw rows. Written through a mapping of a
+    temp file and renamed in place, so concurrent readers (other engines/processes) never see a partial raster.
+    """
+    import mmap
+
+    n = int(width) * int(height) * 4
+    if len(memoryview(pixels).cast("B")) != n:
+        raise ValueError("raster size mismatch")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f".{uuid.uuid4().hex[:6]}.tmp")
+    with tmp.open("w+b") as f:
+        f.truncate(_RASTER_HEADER.size + n)
+        with mmap.mmap(f.fileno(), 0) as mm:
+            _RASTER_HEADER.pack_into(mm, 0, _RASTER_MAGIC, _RASTER_VERSION, int(width), int(height))
+            mm[_RASTER_HEADER.size :] = memoryview(pixels).cast("B")
+    os.replace(tmp, path)
+
+
+def _raster_read(path: Path) -> Any:
+    """Cached raster as a new RGBA PIL image (mapped read-only, copied once); None if missing or invalid."""
+    import mmap
+
+    from PIL import Image
+
+    try:
+        with path.open("rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        magic, version, w, h = _RASTER_HEADER.unpack_from(mm, 0)
+        if magic != _RASTER_MAGIC or version != _RASTER_VERSION or len(mm) != _RASTER_HEADER.size + w * h * 4:
+            return None
+        view = memoryview(mm)[_RASTER_HEADER.size :]
+        try:
+            return Image.frombuffer("RGBA", (w, h), view, "raw", "RGBA", 0, 1).copy()
+        finally:
+            view.release()
+    except (struct.error, ValueError):
+        return None
+    finally:
+        mm.close()
+
+
+def _preview_cache_dir(project_dir: Path) -> Path:
+    # NOTE: Keep cache path ASCII-only for WebView file:// reliability.
+    # Project folders may include non-ASCII (e.g. Japanese) names.
+    key = str(project_dir).encode("utf-8", errors="ignore")
+    return LOCAL / "_cache_pages" / hashlib.sha1(key).hexdigest()[:16]
+
+
+def _plan_page_count(project_dir: Path) -> int | None:
+    """Page count from the template.plan header (no PDF parsing); None when there is no plan yet."""
+    try:
+        with (project_dir / "template.plan").open("rb") as f:
+            magic, _, n_pages, *_ = _PLAN_HEADER.unpack(f.read(_PLAN_HEADER.size))
+        return int(n_pages) if magic == _PLAN_MAGIC else None
+    except (OSError, struct.error):
+        return None
+
+
+class ProjectCatalog:
+    """
+    SQLite index of projects (name, dates, page count, tags, value text, thumbnail) for listing and
+    full-text search without parsing project.json files. Text search is FTS5 with the trigram
+    tokenizer (substring match, so Japanese needs no word breaks); queries under 3 characters,
+    or SQLite without FTS5, fall back to LIKE. Saves arrive through note() and are written in
+    batches; sync() re-reads only project.json files whose mtime changed.
+    """
+
+    def __init__(self, path: Path = CATALOG_PATH) -> None:
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn: Any = None
+        self._fts = False
+        self._pending: dict[str, tuple[dict[str, Any], int]] = {}
+        self._flush_timer: threading.Timer | None = None
+        self._synced = 0.0
+
+    def _db(self) -> Any:
+        if self._conn is None:
+            import sqlite3
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS projects (path TEXT PRIMARY KEY, project TEXT, created_at TEXT, updated_at TEXT,"
+                " page_count INTEGER, tags TEXT, vals TEXT, thumb TEXT, mtime_ns INTEGER)"
+            )
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS projects_fts USING fts5(project, tags, vals,"
+                    " content='projects', content_rowid='rowid', tokenize='trigram')"
+                )
+                self._fts = True
+            except sqlite3.OperationalError:
+                self._fts = False
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _row(path: Path, data: dict[str, Any], mtime_ns: int) -> tuple[Any, ...]:
+        tags = [str(t) for t in (data.get("tags") or []) if str(t).strip()]
+        values = data.get("values") or {}
+        vals = "\n".join(str(v).replace("<br>", " ") for v in values.values() if str(v or "").strip())
+        thumb = _preview_cache_dir(path.parent) / "page_0000.png"
+        return (
+            str(path),
+            str(data.get("project") or path.parent.name),
+            str(data.get("created_at") or ""),
+            str(data.get("updated_at") or ""),
+            _plan_page_count(path.parent),
+            "\n".join(tags),
+            vals,
+            str(thumb) if thumb.exists() else None,
+            mtime_ns,
+        )
+
+    def _upsert(self, rows: list[tuple[Any, ...]]) -> None:
+        conn = self._db()
+        for row in rows:
+            old = conn.execute("SELECT rowid, project, tags, vals, page_count FROM projects WHERE path = ?", (row[0],)).fetchone()
+            if old is not None and row[4] is None:
+                row = row[:4] + (old[4],) + row[5:]  # keep the known page count until a plan exists
+            if old is not None and self._fts:
+                conn.execute("INSERT INTO projects_fts(projects_fts, rowid, project, tags, vals) VALUES('delete', ?, ?, ?, ?)", old[:4])
+            conn.execute("INSERT OR REPLACE INTO projects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            if self._fts:
+                rid = conn.execute("SELECT rowid FROM projects WHERE path = ?", (row[0],)).fetchone()[0]
+                conn.execute("INSERT INTO projects_fts(rowid, project, tags, vals) VALUES (?, ?, ?, ?)", (rid, row[1], row[5], row[6]))
+
+    def _remove(self, paths: list[str]) -> None:
+        conn = self._db()
+        for p in paths:
+            old = conn.execute("SELECT rowid, project, tags, vals FROM projects WHERE path = ?", (p,)).fetchone()
+            if old is None:
+                continue
+            if self._fts:
+                conn.execute("INSERT INTO projects_fts(projects_fts, rowid, project, tags, vals) VALUES('delete', ?, ?, ?, ?)", old)
+            conn.execute("DELETE FROM projects WHERE path = ?", (p,))
+
+    def note(self, path: Path, data: dict[str, Any]) -> None:
+        """Record a project.json save (called by _write_json); written to the index shortly after."""
+        p = Path(path).resolve()
+        stamp = _file_stamp(p)
+        with self._lock:
+            # shallow snapshot: the caller keeps mutating data
+            snap = {k: data.get(k) for k in ("project", "created_at", "updated_at")}
+            snap["tags"] = list(data.get("tags") or [])
+            snap["values"] = dict(data.get("values") or {})
+            self._pending[str(p)] = (snap, stamp[0] if stamp else 0)
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(CATALOG_FLUSH_SEC, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_timer = None
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                self._upsert([self._row(Path(p), d, m) for p, (d, m) in pending.items()])
+                self._db().commit()
+            except Exception:
+                pass
+
+    def sync(self, force: bool = False) -> dict[str, int]:
+        """Reconcile with PROJECTS_DIR: index new/changed project.json files (by mtime), drop removed ones."""
+        with self._lock:
+            if not force and time.monotonic() - self._synced < CATALOG_RESCAN_SEC:
+                return {"indexed": 0, "removed": 0}
+            self.flush()
+            conn = self._db()
+            known = dict(conn.execute("SELECT path, mtime_ns FROM projects").fetchall())
+            rows = []
+            seen: set[str] = set()
+            for fp in PROJECTS_DIR.glob("*/project.json"):
+                key = str(fp.resolve())
+                seen.add(key)
+                try:
+                    m = fp.stat().st_mtime_ns
+                except OSError:
+                    continue
+                if known.get(key) == m:
+                    continue
+                data = _read_json(fp, None)
+                if isinstance(data, dict):
+                    rows.append(self._row(Path(key), data, m))
+            gone = [p for p in known if p not in seen and not Path(p).exists()]
+            self._upsert(rows)
+            self._remove(gone)
+            conn.commit()
+            self._synced = time.monotonic()
+            return {"indexed": len(rows), "removed": len(gone)}
+
+    def _rows(self, sql: str, args: tuple[Any, ...]) -> list[dict[str, Any]]:
+        cols = ("path", "project", "created_at", "updated_at", "page_count", "tags", "vals", "thumb")
+        out = []
+        for r in self._db().execute(sql, args).fetchall():
+            d = dict(zip(cols, r))
+            d["tags"] = [t for t in (d["tags"] or "").split("\n") if t]
+            d["thumb"] = d["thumb"] if d["thumb"] and os.path.exists(d["thumb"]) else None
+            d.pop("vals")
+            out.append(d)
+        return out
+
+    def recent(self, limit: int = 100, offset: int = 0) -> list[dict[str, Any]]:
+        with self._lock:
+            self.sync()
+            return self._rows(
+                "SELECT path, project, created_at, updated_at, page_count, tags, vals, thumb FROM projects"
+                " ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                (int(limit), int(offset)),
+            )
+
+    def search(self, query: str, limit: int = 50) -> list[dict[str, Any]]:
+        terms = [t for t in str(query or "").split() if t]
+        with self._lock:
+            self.sync()
+            if not terms:
+                return self.recent(limit)
+            cols = "p.path, p.project, p.created_at, p.updated_at, p.page_count, p.tags, p.vals, p.thumb"
+            if self._fts and all(len(t) >= 3 for t in terms):
+                match = " AND ".join('"' + t.replace('"', '""') + '"' for t in terms)
+                return self._rows(
+                    f"SELECT {cols} FROM projects_fts f JOIN projects p ON p.rowid = f.rowid"
+                    " WHERE projects_fts MATCH ? ORDER BY bm25(projects_fts) LIMIT ?",
+                    (match, int(limit)),
+                )
+            like = " AND ".join("(p.project || ' ' || p.tags || ' ' || p.vals) LIKE ? ESCAPE '\\'" for _ in terms)
+            args = tuple("%" + t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%" for t in terms)
+            return self._rows(f"SELECT {cols} FROM projects p WHERE {like} ORDER BY p.updated_at DESC LIMIT ?", args + (int(limit),))
+
+
+_CATALOG: ProjectCatalog | None = None
+
+
+def _catalog() -> ProjectCatalog:
+    global _CATALOG
+    if _CATALOG is None:
+        _CATALOG = ProjectCatalog()
+    return _CATALOG
+
+
+def _iso_utc(ts: float) -> str:
+    """Epoch seconds as the UI's ISO form (Date.toISOString)."""
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ts)) + f".{int(ts * 1000) % 1000:03d}Z"
+
+
+def _parse_iso(s: Any) -> float | None:
+    from datetime import datetime
+
+    try:
+        return datetime.fromisoformat(str(s).replace("Z", "+00:00")).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class ActivityStore:
+    """
+    SQLite store for workers and their work sessions. Events (start, private, resume, finish) are
+    append-only; each finish adds its net seconds to a (worker, month, project) total in the same
+    transaction, so monthly hours are read from a few aggregate rows however long the history grows.
+    A session counts toward the month (local time) it started in.
+    """
+
+    def __init__(self, path: Path = ACTIVITY_PATH) -> None:
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn: Any = None
+
+    def _db(self) -> Any:
+        if self._conn is None:
+            import sqlite3
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, name TEXT NOT NULL, bank TEXT, hourly_yen INTEGER, pos INTEGER);"
+                "CREATE INDEX IF NOT EXISTS workers_pos ON workers(pos);"
+                "CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY, ts REAL, kind TEXT, worker_id TEXT, session TEXT,"
+                " project_path TEXT, project_name TEXT, started REAL, seconds REAL);"
+                "CREATE INDEX IF NOT EXISTS events_worker_ts ON events(worker_id, ts);"
+                "CREATE INDEX IF NOT EXISTS events_kind_ts ON events(kind, ts);"
+                "CREATE TABLE IF NOT EXISTS monthly (worker_id TEXT, month TEXT, project_path TEXT, project_name TEXT,"
+                " seconds REAL, sessions INTEGER, PRIMARY KEY (worker_id, month, project_path)) WITHOUT ROWID;"
+                "CREATE INDEX IF NOT EXISTS monthly_month ON monthly(month);"
+            )
+            if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+                rows = _read_json(WORKERS_PATH, [])
+                for i, r in enumerate(rows if isinstance(rows, list) else []):
+                    if isinstance(r, dict) and r.get("id"):
+                        conn.execute(
+                            "INSERT OR IGNORE INTO workers VALUES (?, ?, ?, ?, ?)",
+                            (str(r["id"]), str(r.get("name") or ""), str(r.get("bank") or ""), int(r.get("hourly_yen") or 0), i),
+                        )
+                conn.execute("PRAGMA user_version = 1")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def workers(self) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._db().execute("SELECT id, name, bank, hourly_yen FROM workers ORDER BY pos").fetchall()
+        return [{"id": r[0], "name": r[1], "bank": r[2] or "", "hourly_yen": int(r[3] or 0)} for r in rows]
+
+    def upsert_worker(self, item: dict[str, Any]) -> None:
+        """Update in place, or insert at the top of the list (as workers.json did)."""
+        with self._lock:
+            conn = self._db()
+            args = (item["name"], item["bank"], item["hourly_yen"], item["id"])
+            if conn.execute("UPDATE workers SET name = ?, bank = ?, hourly_yen = ? WHERE id = ?", args).rowcount == 0:
+                top = conn.execute("SELECT MIN(pos) FROM workers").fetchone()[0]
+                conn.execute("INSERT INTO workers VALUES (?, ?, ?, ?, ?)", (item["id"],) + args[:3] + ((top or 0) - 1,))
+            conn.commit()
+
+    def delete_worker(self, worker_id: str) -> None:
+        """Remove the worker from the list; their events and totals are kept."""
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+            conn.commit()
+
+    def append(
+        self,
+        kind: str,
+        worker_id: str,
+        session: str,
+        project_path: str = "",
+        project_name: str = "",
+        started: float | None = None,
+        seconds: float | None = None,
+        ts: float | None = None,
+    ) -> int:
+        """Append one event; a finish also updates its month's total. Returns the event id."""
+        ts = time.time() if ts is None else float(ts)
+        with self._lock:
+            conn = self._db()
+            cur = conn.execute(
+                "INSERT INTO events (ts, kind, worker_id, session, project_path, project_name, started, seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (ts, kind, worker_id, session, project_path, project_name, started, seconds),
+            )
+            if kind == "finish" and seconds is not None:
+                month = time.strftime("%Y-%m", time.localtime(started if started is not None else ts))
+                conn.execute(
+                    "INSERT INTO monthly VALUES (?, ?, ?, ?, ?, 1) ON CONFLICT (worker_id, month, project_path) DO UPDATE SET"
+                    " seconds = seconds + excluded.seconds, sessions = sessions + 1, project_name = excluded.project_name",
+                    (worker_id, month, project_path, project_name, float(seconds)),
+                )
+            conn.commit()
+            return int(cur.lastrowid)
+
+    def history(self, worker_id: str | None = None, limit: int = 200, before: float | None = None) -> list[dict[str, Any]]:
+        """Finished sessions, newest first (paged by before = ts of the last row seen)."""
+        sql = "SELECT id, ts, worker_id, session, project_path, project_name, started, seconds FROM events WHERE kind = 'finish'"
+        args: list[Any] = []
+        if worker_id:
+            sql += " AND worker_id = ?"
+            args.append(worker_id)
+        if before is not None:
+            sql += " AND ts < ?"
+            args.append(float(before))
+        sql += " ORDER BY ts DESC LIMIT ?"
+        args.append(int(limit))
+        with self._lock:
+            rows = self._db().execute(sql, tuple(args)).fetchall()
+        cols = ("id", "ts", "worker_id", "session", "project_path", "project_name", "started", "seconds")
+        return [dict(zip(cols, r)) for r in rows]
+
+    def monthly(self, month: str, worker_id: str | None = None) -> list[dict[str, Any]]:
+        """Per-worker totals for one month (YYYY-MM), with the worker's current name and rate."""
+        sql = (
+            "SELECT m.worker_id, w.name, w.hourly_yen, SUM(m.seconds), SUM(m.sessions), COUNT(*) FROM monthly m"
+            " LEFT JOIN workers w ON w.id = m.worker_id WHERE m.month = ?"
+        )
+        args: tuple[Any, ...] = (month,)
+        if worker_id:
+            sql += " AND m.worker_id = ?"
+            args += (worker_id,)
+        with self._lock:
+            rows = self._db().execute(sql + " GROUP BY m.worker_id ORDER BY w.pos", args).fetchall()
+        out = []
+        for wid, name, rate, secs, sessions, projects in rows:
+            hours = round(float(secs or 0) / 3600.0, 2)
+            out.append(
+                {
+                    "worker_id": wid,
+                    "name": name or "",
+                    "seconds": round(float(secs or 0), 1),
+                    "hours": hours,
+                    "sessions": int(sessions or 0),
+                    "projects": int(projects or 0),
+                    "hourly_yen": int(rate or 0),
+                    "yen": int(round(float(secs or 0) / 3600.0 * int(rate or 0))),
+                }
+            )
+        return out
+
+    def clear_history(self) -> None:
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM events")
+            conn.execute("DELETE FROM monthly")
+            conn.commit()
+
+
+_ACTIVITY: ActivityStore | None = None
+
+
+def _activity() -> ActivityStore:
+    global _ACTIVITY
+    if _ACTIVITY is None:
+        _ACTIVITY = ActivityStore()
+    return _ACTIVITY
+
+
+class ExportCancelled(Exception):
+    """Raised by _export_filled_pdf when its export job was cancelled."""
+
+
 @dataclass
 class LoadedProject:
     path: Path
     data: dict[str, Any]
 
 
-class Api:
+class _RenderSlot:
+    """Coalesced preview renders of one page: at most one in flight, later requests share one pending render."""
+
+    __slots__ = ("busy", "pending", "version", "frame")
+
+    def __init__(self) -> None:
+        self.busy = False
+        self.pending = False
+        self.version = -1
+        self.frame: tuple[str, int, int, str | None] | None = None  # png url, w, h, inline data url
+
+
+@dataclass
+class ProjectSession:
+    """Open state of one workspace project; the Engine's per-project attributes read through to the current one."""
+
+    project: LoadedProject | None = None
+    page_count: int = 1
+    fitz_doc: Any = None
+    fitz_pdf_path: str | None = None
+    page_cache: "OrderedDict[int, str]" = field(default_factory=OrderedDict)
+    plan: TemplatePlan | None = None
+    undo: list[list[tuple[str, str, Any, Any]]] = field(default_factory=list)
+    redo: list[list[tuple[str, str, Any, Any]]] = field(default_factory=list)
+    undo_merge_key: str | None = None
+    undo_t: float = 0.0
+    stamps: tuple[int, ...] = ()  # project.json / template mtimes when last switched away
+    page_hashes: list[str] | None = None  # template per-page content hashes (external change diffing)
+    page_px: list[tuple[int, int]] | None = None  # preview size per page when no template plan is available
+    page_versions: dict[int, int] = field(default_factory=dict)  # overlay version per page (-1: all pages)
+    render_slots: "dict[int, _RenderSlot]" = field(default_factory=dict)
+
+    def file_stamps(self) -> tuple[int, ...]:
+        out = []
+        for fp in (self.project.path, self.project.path.parent / str(self.project.data.get("pdf") or "template.pdf")):
+            try:
+                st = fp.stat()
+                out.extend((st.st_mtime_ns, st.st_size))
+            except OSError:
+                out.extend((0, 0))
+        return tuple(out)
+
+    def mem_estimate(self) -> int:
+        """Rough resident bytes: open document (~template size), in-memory previews, mapped plan."""
+        n = sum(len(v) for v in self.page_cache.values())
+        n += sum(len(s.frame[3] or "") for s in self.render_slots.values() if s.frame is not None)
+        if self.fitz_doc is not None and self.fitz_pdf_path:
+            try:
+                n += os.path.getsize(self.fitz_pdf_path)
+            except OSError:
+                pass
+        if self.plan is not None:
+            try:
+                n += os.path.getsize(self.plan.path)
+            except (OSError, AttributeError, TypeError):
+                pass
+        return n
+
+    def close(self) -> None:
+        try:
+            if self.fitz_doc is not None:
+                self.fitz_doc.close()
+        except Exception:
+            pass
+        self.fitz_doc = None
+        self.fitz_pdf_path = None
+        self.page_cache.clear()
+        self.render_slots.clear()
+        if self.plan is not None:
+            self.plan.close()
+        self.plan = None
+
+
+def _session_attr(name: str) -> property:
+    return property(lambda self: getattr(self._session, name), lambda self, v: setattr(self._session, name, v))
+
+
+class Engine:
+    """
+    Project engine: load, edit, render and export without any GUI imports.
+    Used directly by the headless CLI (python -m app ...) and wrapped by Api for the desktop window.
+    """
+
+    _project = _session_attr("project")
+    _page_count = _session_attr("page_count")
+    _fitz_doc = _session_attr("fitz_doc")
+    _fitz_pdf_path = _session_attr("fitz_pdf_path")
+    _page_cache = _session_attr("page_cache")
+    _plan = _session_attr("plan")
+    _undo = _session_attr("undo")
+    _redo = _session_attr("redo")
+    _undo_merge_key = _session_attr("undo_merge_key")
+    _undo_t = _session_attr("undo_t")
+    _page_versions = _session_attr("page_versions")
+    _render_slots = _session_attr("render_slots")
+
     def __init__(self) -> None:
         _ensure_dirs()
-        self._project: LoadedProject | None = None
+        self._session = ProjectSession()
+        self._sessions: "OrderedDict[str, ProjectSession]" = OrderedDict()  # workspace, LRU order
+        self._watcher: _FileWatcher | None = None
         self._last_project_path: str | None = None
         self._ui_mode: str = "worker"
         self._last_dir: str | None = None
         self._working_worker_id: str | None = None
         self._private: bool = False
-        self._page_count: int = 1
+        self._work: dict[str, Any] | None = None  # open work session (see start_work)
         self._render_lock = threading.Lock()
-        self._page_cache: "OrderedDict[int, str]" = OrderedDict()
+        self._render_cv = threading.Condition()
+        self._version_seq = itertools.count(1)
         self._cache_max_pages = 12
+        self._load_t0: float = time.perf_counter()
+        self._service_url: str | None = None
+        self._window: Any = None  # pywebview window (desktop only), used to push events to the UI
+        self._export_jobs: "OrderedDict[str, dict[str, Any]]" = OrderedDict()
+        self._export_cv = threading.Condition()
+        self._export_thread: threading.Thread | None = None
+        self._export_memo = {"hits": 0, "misses": 0}
+        self._plan_lock = threading.Lock()
+
+    def close(self) -> None:
+        """Release every open project document (engine can be reused by load_project)."""
+        self._stop_watcher()
+        if _CATALOG is not None:
+            _CATALOG.flush()
+        for sess in list(self._sessions.values()) + [self._session]:
+            self._close_session(sess)
+        self._sessions.clear()
+        self._session = ProjectSession()
+
+    def _close_session(self, sess: ProjectSession) -> None:
+        """Close a session's document and plan once no render is using them (renders hold _render_lock)."""
+        with self._render_lock, self._plan_lock:
+            sess.close()
+
+    # --- workspace ---
+    def _reuse_session(self, p: Path) -> bool:
+        """
+        Switch to p's kept-open session if its files are unchanged since it was left.
+        Loading the current project again always reopens it.
+        """
+        cur = self._session
+        if cur.project is not None:
+            cur.stamps = cur.file_stamps()
+        key = str(p)
+        sess = self._sessions.get(key)
+        if sess is None or sess is cur:
+            return False
+        if sess.project is not None and sess.stamps and sess.stamps == sess.file_stamps():
+            self._sessions.move_to_end(key)
+            self._session = sess
+            return True
+        self._sessions.pop(key, None)
+        self._close_session(sess)
+        return False
+
+    def _open_session(self, p: Path) -> None:
+        key = str(p)
+        old = self._sessions.pop(key, None)
+        if old is not None:
+            self._close_session(old)
+        self._session = ProjectSession()
+        self._sessions[key] = self._session
+
+    def _evict_sessions(self) -> None:
+        """Close least-recently-used projects beyond WORKSPACE_MAX_PROJECTS / WORKSPACE_MEM_BUDGET_MB."""
+        budget = WORKSPACE_MEM_BUDGET_MB * 1024 * 1024
+        while len(self._sessions) > 1:
+            total = sum(s.mem_estimate() for s in self._sessions.values())
+            if len(self._sessions) <= WORKSPACE_MAX_PROJECTS and total <= budget:
+                break
+            key, sess = next(iter(self._sessions.items()))
+            if sess is self._session:
+                self._sessions.move_to_end(key)
+                continue
+            self._sessions.pop(key)
+            self._close_session(sess)
+
+    # --- project catalog ---
+    def list_projects(self, limit: int = 100, offset: int = 0) -> dict[str, Any]:
+        """Projects under PROJECTS_DIR, most recently updated first, from the catalog index."""
+        t0 = time.perf_counter()
+        try:
+            rows = _catalog().recent(limit, offset)
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, "projects": rows, "elapsed_ms": _elapsed_ms(t0)}
+
+    def search_projects(self, query: str, limit: int = 50) -> dict[str, Any]:
+        """Projects whose name, tag names or values contain every word of query (catalog full-text index)."""
+        t0 = time.perf_counter()
+        try:
+            rows = _catalog().search(query, limit)
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, "projects": rows, "elapsed_ms": _elapsed_ms(t0)}
+
+    def get_workspace(self) -> dict[str, Any]:
+        """Projects kept open in this window, most recently used last."""
+        rows = []
+        for key, sess in self._sessions.items():
+            if sess.project is None:
+                continue
+            rows.append(
+                {
+                    "path": key,
+                    "project": sess.project.data.get("project") or sess.project.path.parent.name,
+                    "page_count": int(sess.page_count),
+                    "cached_pages": len(sess.page_cache),
+                    "mem_bytes": sess.mem_estimate(),
+                    "current": sess is self._session,
+                }
+            )
+        return {"ok": True, "projects": rows, "max_projects": WORKSPACE_MAX_PROJECTS, "budget_mb": WORKSPACE_MEM_BUDGET_MB}
+
+    def close_workspace_project(self, path: str) -> dict[str, Any]:
+        """Drop a kept-open project from the workspace (not the current one)."""
+        key = str(Path(path).resolve())
+        sess = self._sessions.get(key)
+        if sess is None:
+            return {"ok": False, "error": "not_open"}
+        if sess is self._session:
+            return {"ok": False, "error": "current_project"}
+        self._sessions.pop(key)
+        self._close_session(sess)
+        return {"ok": True}
+
+    # --- external changes (file watcher) ---
+    def _start_watcher(self) -> None:
+        """Reload project.json / template.pdf edited outside the app (sync tools, other operators)."""
+        if self._watcher is None:
+            self._watcher = _FileWatcher(self._watch_tick, self._on_files_changed)
+            self._watcher.start()
+
+    def _stop_watcher(self) -> None:
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def _watch_tick(self) -> list[Path]:
+        """Files to watch for the current project; also takes the template page-hash baseline once."""
+        sess = self._session
+        if sess.project is None:
+            return []
+        pdf = self._pdf_path()
+        if sess.page_hashes is None:
+            with self._render_lock:
+                if self._session is sess and sess.page_hashes is None:
+                    try:
+                        self._page_fingerprints()
+                    except Exception:
+                        sess.page_hashes = []
+        return [sess.project.path, pdf]
+
+    def _on_files_changed(self, paths: set[Path]) -> None:
+        sess = self._session
+        if sess.project is None:
+            return
+        changed = {str(p) for p in paths if not _is_own_write(p)}
+        if not changed:
+            return
+        with self._render_lock:
+            if self._session is not sess:
+                return
+            if str(self._pdf_path()) in changed:
+                self._reload_template_external()
+            if str(sess.project.path) in changed:
+                self._reload_project_json_external()
+
+    def _reload_template_external(self) -> None:
+        """Reopen an externally modified template; only pages whose content hash changed are re-rendered."""
+        pdf = self._pdf_path()
+        sess = self._session
+        try:
+            new_hashes = _page_hashes(pdf)
+        except Exception:
+            return  # mid-write; the next event retries
+        old_hashes = sess.page_hashes
+        try:
+            if self._fitz_doc is not None:
+                self._fitz_doc.close()
+        except Exception:
+            pass
         self._fitz_doc = None
-        self._fitz_pdf_path: str | None = None
+        self._fitz_pdf_path = None
+        if _fitz() is not None:
+            self._fitz_doc = _fitz().open(str(pdf))
+            self._fitz_pdf_path = str(pdf)
+        self._page_count = max(1, len(new_hashes))
+        self._drop_plan()
+        if not old_hashes:
+            pages = None
+        else:
+            n = max(len(old_hashes), len(new_hashes))
+            pages = {
+                i for i in range(n) if i >= len(old_hashes) or i >= len(new_hashes) or old_hashes[i] != new_hashes[i]
+            }
+        self._invalidate_pages(pages)
+        sess.page_hashes = new_hashes
+        self._emit(
+            {
+                "type": "template_changed",
+                "pages": sorted(pages) if pages is not None else None,
+                "page_count": int(self._page_count),
+            }
+        )
 
-    # --- dialogs ---
-    def pick_project(self) -> dict[str, Any]:
-        p = _pick_file("案件（プロジェクト）を開く", [("Project JSON", "*.json"), ("All", "*.*")], self._last_dir)
-        if not p:
-            return {"ok": False}
-        self._last_dir = str(Path(p).resolve().parent)
-        return {"ok": True, "path": str(Path(p).resolve())}
+    def _reload_project_json_external(self) -> None:
+        """Merge an externally modified project.json: diff it against memory and invalidate touched pages."""
+        data = _read_json(self._project.path, None)
+        if not isinstance(data, dict):
+            return  # mid-write; the next event retries
+        new_view = {
+            "tags": list(data.get("tags") or []),
+            "values": dict(data.get("values") or {}),
+            "placements": dict(data.get("placements") or {}),
+        }
+        changes = _diff_payload(self._payload_view(), new_view)
+        for k, v in data.items():
+            if k not in ("tags", "values", "placements"):
+                self._project.data[k] = v
+        if not changes:
+            return
+        patch, pages = self._apply_edit(changes, True, write=False)
+        self._reset_edit_log()  # history was relative to the replaced state
+        self._emit({"type": "project_changed", "patch": patch, "pages": sorted(pages)})
 
-    def pick_pdf(self) -> dict[str, Any]:
-        p = _pick_file("PDFを選択", [("PDF", "*.pdf"), ("All", "*.*")], self._last_dir)
-        if not p:
-            return {"ok": False}
-        self._last_dir = str(Path(p).resolve().parent)
-        return {"ok": True, "path": str(Path(p).resolve())}
+    # --- startup metrics ---
+    def mark_first_page_shown(self) -> dict[str, Any]:
+        """Called by the UI once the first page image is on screen after load_project."""
+        _STARTUP["time_to_first_page_ms"] = _elapsed_ms(self._load_t0)
+        return {"ok": True}
+
+    def get_startup_metrics(self) -> dict[str, Any]:
+        return {"ok": True, "metrics": dict(_STARTUP)}
 
     # --- projects ---
     def create_project_from_pdf_simple(self, pdf_path: str) -> dict[str, Any]:
@@ -153,7 +2203,7 @@ class Api:
             proj_dir = PROJECTS_DIR / pid
             proj_dir.mkdir(parents=True, exist_ok=True)
             pdf_dst = proj_dir / "template.pdf"
-            shutil.copy2(src, pdf_dst)
+            _store_file(src, pdf_dst, link=False)
 
             data: dict[str, Any] = {
                 "project": stem,
@@ -185,11 +2235,19 @@ class Api:
         except Exception:
             return False
 
-    def load_project(self, path: str) -> dict[str, Any]:
+    def load_project(self, path: str, preview: bool = True) -> dict[str, Any]:
+        self._load_t0 = time.perf_counter()
         try:
             p = Path(path).resolve()
             if not p.exists():
                 return {"ok": False, "error": "not_found"}
+            if self._reuse_session(p):
+                # Kept open in the workspace: document, previews, plan and undo log are warm.
+                self._last_project_path = str(p)
+                self._ui_mode = str(self._project.data.get("ui_mode") or "worker")
+                first_page = self._first_page(preview)
+                self._evict_sessions()
+                return {**self._loaded_response(), "first_page": first_page, "reused": True}
             data = _read_json(p, None)
             if not isinstance(data, dict):
                 return {"ok": False, "error": "invalid_json"}
@@ -222,16 +2280,19 @@ class Api:
             tags0 = data.get("tags")
             tags_list: list[str] = [str(t) for t in tags0] if isinstance(tags0, list) else []
             tagset = {t for t in tags_list if t.strip()}
-            for _, pl in (data.get("placements") or {}).items():
-                if isinstance(pl, dict):
-                    t = str(pl.get("tag") or "").strip()
-                    if t and t not in tagset:
-                        tags_list.append(t)
-                        tagset.add(t)
-                        changed = True
+            # Validate/type placements once; the rest of the engine uses them by reference.
+            data["placements"] = PlacementStore(data.get("placements") or {})
+            for _, pl in data["placements"].items():
+                t = pl.tag
+                if t and t not in tagset:
+                    tags_list.append(t)
+                    tagset.add(t)
+                    changed = True
             data["tags"] = tags_list
 
+            self._open_session(p)
             self._project = LoadedProject(path=p, data=data)
+            self._reset_edit_log()
             self._last_project_path = str(p)
             self._ui_mode = str(data.get("ui_mode") or "worker")
             pdf_path = str(self._pdf_path())
@@ -245,11 +2306,13 @@ class Api:
                     except Exception:
                         pass
                     self._fitz_doc = None
-                if fitz is not None:
-                    self._fitz_doc = fitz.open(pdf_path)
+                if _fitz() is not None:
+                    self._fitz_doc = _fitz().open(pdf_path)
                     self._fitz_pdf_path = pdf_path
                     self._page_count = max(1, int(self._fitz_doc.page_count))
                 else:
+                    from pypdf import PdfReader
+
                     self._fitz_pdf_path = None
                     self._page_count = max(1, int(len(PdfReader(pdf_path).pages)))
             except Exception:
@@ -258,37 +2321,111 @@ class Api:
                 self._page_count = 1
 
             self._page_cache.clear()
+
+            first_page = self._first_page(preview)
+
             if changed:
                 # Write back migrated/normalized schema so future loads are consistent.
                 _write_json(self._project.path, self._project.data)
-            return {
-                "ok": True,
-                "project": data.get("project") or p.parent.name,
-                "tags": list(data.get("tags") or []),
-                "values": dict(data.get("values") or {}),
-                "placements": dict(data.get("placements") or {}),
-                "drop_dir": str((p.parent / "exports").resolve()),
-                "ui_mode": self._ui_mode,
-                "path": str(p),
-                "page_count": self._page_count,
-            }
+            self._evict_sessions()
+            return {**self._loaded_response(), "first_page": first_page}
         except Exception as e:
             return {"ok": False, "error": str(e)}
 
+    def _first_page(self, preview: bool) -> dict[str, Any] | None:
+        # Render the first page before anything else so the UI can show it
+        # straight from the load response (no extra bridge round trip).
+        first_page = None
+        try:
+            if preview:
+                first_page = self.get_preview_png_base64_page(0)
+            if first_page and not first_page.get("ok"):
+                first_page = None
+        except Exception:
+            first_page = None
+        _STARTUP["first_page_render_ms"] = _elapsed_ms(self._load_t0)
+        return first_page
+
+    def _loaded_response(self) -> dict[str, Any]:
+        p = self._project.path
+        data = self._project.data
+        return {
+            "ok": True,
+            "project": data.get("project") or p.parent.name,
+            "tags": list(data.get("tags") or []),
+            "values": dict(data.get("values") or {}),
+            "placements": _placements_json(data.get("placements")),
+            "drop_dir": str((p.parent / "exports").resolve()),
+            "ui_mode": self._ui_mode,
+            "path": str(p),
+            "page_count": self._page_count,
+        }
+
     def _cache_dir(self) -> Path:
         if not self._project:
             raise RuntimeError("no project")
-        # NOTE: Keep cache path ASCII-only for WebView file:// reliability.
-        # Project folders may include non-ASCII (e.g. Japanese) names.
-        key = str(self._project.path.parent).encode("utf-8", errors="ignore")
-        hid = hashlib.sha1(key).hexdigest()[:16]
-        d = LOCAL / "_cache_pages" / hid
+        d = _preview_cache_dir(self._project.path.parent)
         d.mkdir(parents=True, exist_ok=True)
         return d
 
     def _cache_png_path(self, page_index: int) -> Path:
         return self._cache_dir() / f"page_{int(page_index):04d}.png"
 
+    def _page_fingerprints(self) -> list[str]:
+        """
+        Content fingerprint per template page (see _page_hashes), taken from the template plan
+        when it is current, else computed. Base rasters are cached under these keys.
+        """
+        sess = self._session
+        if sess.page_hashes is not None and len(sess.page_hashes) == int(self._page_count):
+            return sess.page_hashes
+        hashes = None
+        plan = self._template_plan()
+        if plan is not None:
+            hashes = plan.meta.get("page_hashes")
+        if not isinstance(hashes, list) or len(hashes) != int(self._page_count):
+            hashes = _page_hashes(self._pdf_path(), self._fitz_doc)
+        sess.page_hashes = [str(h) for h in hashes]
+        self._prune_base_rasters(set(sess.page_hashes))
+        return sess.page_hashes
+
+    def _base_raster_path(self, page_index: int) -> Path | None:
+        """Cached template raster (no overlay, raw RGBA) for a page, keyed by its content fingerprint."""
+        try:
+            fp = self._page_fingerprints()[int(page_index)]
+        except Exception:
+            return None
+        return self._cache_dir() / "base" / f"{fp}.rgba"
+
+    def _prune_base_rasters(self, keep: set[str]) -> None:
+        try:
+            d = self._cache_dir() / "base"
+            if not d.exists():
+                return
+            for fp in d.iterdir():
+                if fp.name.endswith(".tmp"):
+                    continue  # being written by another engine
+                if fp.stem not in keep or fp.suffix not in (".rgba", ".png"):
+                    fp.unlink()
+        except Exception:
+            pass
+
+    def _trim_base_rasters(self) -> None:
+        """Keep this project's raw template rasters within RASTER_CACHE_MB (least recently used go first)."""
+        try:
+            files = [(fp.stat(), fp) for fp in (self._cache_dir() / "base").iterdir() if fp.suffix in (".rgba", ".png")]
+        except OSError:
+            return
+        total = sum(st.st_size for st, _ in files)
+        for st, fp in sorted(files, key=lambda x: x[0].st_mtime_ns):
+            if total <= RASTER_CACHE_MB * 1024 * 1024:
+                break
+            try:
+                fp.unlink()
+                total -= st.st_size
+            except OSError:
+                pass
+
     def _file_url(self, path: Path, bust: bool = True) -> str:
         # Use file:// URL so we don't send huge base64 over the JS bridge.
         p = path.resolve()
@@ -336,8 +2473,11 @@ class Api:
             pass
 
     def _invalidate_pages(self, pages: set[int] | None = None) -> None:
-        """Invalidate cached preview PNGs for given pages (or all)."""
+        """Invalidate cached preview PNGs for given pages (or all) and bump their overlay version."""
         try:
+            v = next(self._version_seq)
+            for pi in [-1] if pages is None else pages:
+                self._page_versions[int(pi)] = v
             if pages is None:
                 self._page_cache.clear()
                 d = self._cache_dir()
@@ -361,17 +2501,21 @@ class Api:
         except Exception:
             return
 
-    def _render_page_png_url(self, idx: int) -> tuple[str, int, int]:
-        # disk cache first (instant + no huge bridge payload)
-        cache_png = self._cache_png_path(idx)
-        if cache_png.exists():
-            w, h = self._page_image_size(idx)
-            return self._file_url(cache_png, bust=True), w, h
-
+    def _page_base_image(self, idx: int) -> Any:
+        """Template raster of page idx without overlays (RGBA PIL image), from the raw raster cache or rendered once."""
         img = None
+        # Template raster shared by every overlay state of this page content
+        base_raster = self._base_raster_path(idx)
+        if base_raster is not None:
+            img = _raster_read(base_raster)
+            if img is not None:
+                try:
+                    os.utime(base_raster)  # LRU order for _trim_base_rasters
+                except OSError:
+                    pass
         # Preferred: in-process rendering (no external process / no black window)
         try:
-            if self._fitz_doc is not None and fitz is not None:
+            if img is None and self._fitz_doc is not None and _fitz() is not None:
                 pi = int(idx)
                 if pi < 0:
                     pi = 0
@@ -379,28 +2523,50 @@ class Api:
                     pi = int(self._fitz_doc.page_count) - 1
                 page = self._fitz_doc.load_page(pi)
                 scale = RENDER_DPI / 72.0
-                pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=True)
-                b0 = pix.tobytes("png")
-
-                import io
+                pix = page.get_pixmap(matrix=_fitz().Matrix(scale, scale), alpha=True)
                 from PIL import Image
 
-                img = Image.open(io.BytesIO(b0)).convert("RGBA")
+                if pix.n == 4:
+                    img = Image.frombytes("RGBA", (pix.width, pix.height), pix.samples)
+                else:
+                    import io
+
+                    img = Image.open(io.BytesIO(pix.tobytes("png"))).convert("RGBA")
         except Exception:
             img = None
 
-        # Fallback: pdf2image (may spawn poppler subprocess)
-        if img is None:
-            pdf = self._pdf_path()
-            images = convert_from_path(
-                str(pdf),
-                dpi=RENDER_DPI,
-                first_page=idx + 1,
-                last_page=idx + 1,
-            )
-            if not images:
-                raise RuntimeError("render_failed")
-            img = images[0].convert("RGBA")
+        # Fallback: pdf2image (poppler subprocess), a range of pages per run
+        if img is None:
+            img = self._render_pages_poppler(idx)
+        if base_raster is not None and not base_raster.exists():
+            try:
+                _raster_write(base_raster, img.width, img.height, img.tobytes())
+                self._trim_base_rasters()
+            except Exception:
+                pass
+        return img
+
+    def _render_page_png_url(self, idx: int) -> tuple[str, int, int]:
+        # disk cache first (instant + no huge bridge payload)
+        cache_png = self._cache_png_path(idx)
+        if cache_png.exists():
+            w, h = self._page_image_size(idx)
+            return self._file_url(cache_png, bust=True), w, h
+
+        # Shared local render service: reuse its warm document and cache when configured.
+        if self._service_url and self._project:
+            r = _service_request(self._service_url, "/render", {"project": str(self._project.path), "page": idx}, timeout=20.0)
+            res = (r or {}).get("result") or {}
+            try:
+                if res.get("ok") and Path(str(res.get("path") or "")).exists():
+                    src_png = Path(str(res["path"]))
+                    if src_png.resolve() != cache_png.resolve():
+                        shutil.copyfile(src_png, cache_png)
+                    return self._file_url(cache_png, bust=True), int(res.get("width") or 0), int(res.get("height") or 0)
+            except Exception:
+                pass
+
+        img = self._page_base_image(idx)
 
         # overlay
         try:
@@ -409,13 +2575,16 @@ class Api:
             draw = ImageDraw.Draw(img)
             try:
                 font_cache: dict[int, Any] = {}
+                export_font = _export_font_path()
 
                 def font(sz: int):
                     if sz in font_cache:
                         return font_cache[sz]
                     try:
-                        # Japanese text needs a JP-capable font; prefer Windows built-ins.
-                        candidates = [
+                        # The export font when configured (same metrics as the PDF), else a JP-capable
+                        # font: prefer Windows built-ins.
+                        candidates = [str(export_font)] if export_font else []
+                        candidates += [
                             r"C:\Windows\Fonts\meiryo.ttc",
                             r"C:\Windows\Fonts\YuGothR.ttc",
                             r"C:\Windows\Fonts\YuGothM.ttc",
@@ -482,26 +2651,14 @@ class Api:
                         draw2.text((cx, cy), line, fill=fill, font=fnt)
                     cy += float(fs) * float(line_h)
 
-            placements = dict(self._project.data.get("placements") or {})
-            values = dict(self._project.data.get("values") or {})
-            for _, p in placements.items():
-                if not isinstance(p, dict):
-                    continue
-                if int(p.get("page") or 0) != idx:
-                    continue
-                tag = str(p.get("tag") or "").strip()
-                if not tag:
+            values = self._project.data.get("values") or {}
+            for _, p in self._placements().items():
+                if p.page != idx or not p.tag:
                     continue
-                text = str(values.get(tag) or "").replace("<br>", "\n")
+                text = str(values.get(p.tag) or "").replace("<br>", "\n")
                 if not text.strip():
                     continue
-                x = float(p.get("x") or 0)
-                y = float(p.get("y") or 0)
-                fs = int(p.get("font_size") or 14)
-                color = _hex_to_rgba(str(p.get("color") or "#0f172a"))
-                line_h = float(p.get("line_height") or 1.2)
-                letter_s = float(p.get("letter_spacing") or 0)
-                _draw_text(draw, x, y, text, fs, color, line_h, letter_s)
+                _draw_text(draw, p.x, p.y, text, int(p.font_size), _hex_to_rgba(p.color), float(p.line_height), float(p.letter_spacing))
         except Exception:
             pass
 
@@ -519,6 +2676,55 @@ class Api:
         w, h = img.size
         return self._file_url(cache_png, bust=True), w, h
 
+    def _page_version(self, idx: int, sess: ProjectSession | None = None) -> int:
+        pv = (sess or self._session).page_versions
+        return max(pv.get(idx, 0), pv.get(-1, 0))
+
+    def _render_coalesced(self, idx: int, wait: bool = True) -> tuple[str, int, int, str | None, int] | None:
+        """
+        Preview frame of page idx at least as new as its overlay version when called, as (png, w, h, png_data, version).
+        Requests arriving while the page renders share one pending render of the newest overlay; versions
+        superseded meanwhile (intermediate keystrokes) are never rendered. wait=False returns None if busy.
+        """
+        sess = self._session
+        slot = sess.render_slots.setdefault(idx, _RenderSlot())
+        want = self._page_version(idx, sess)
+        with self._render_cv:
+            while True:
+                if slot.frame is not None and slot.version >= want:
+                    return (*slot.frame, slot.version)
+                if not slot.busy:
+                    slot.busy = True
+                    slot.pending = False
+                    break
+                if not wait:
+                    return None
+                slot.pending = True
+                self._render_cv.wait()
+        v = self._page_version(idx, sess)  # newest overlay, not necessarily the caller's
+        frame = None
+        try:
+            with self._render_lock:
+                if self._session is not sess:
+                    raise RuntimeError("project_switched")
+                png, w, h = self._render_page_png_url(idx)
+                frame = (png, w, h, self._png_as_data_url(png))
+        finally:
+            with self._render_cv:
+                slot.busy = False
+                if frame is not None:
+                    slot.frame, slot.version = frame, v
+                    if self._page_version(idx, sess) == v:
+                        self._cache_put(idx, frame[0])
+                    else:
+                        # edited while rendering: callers get this frame inline (png_data), later requests re-render
+                        try:
+                            self._cache_png_path(idx).unlink()
+                        except OSError:
+                            pass
+                self._render_cv.notify_all()
+        return (*frame, v)
+
     def get_preview_png_base64_page(self, page_index: int) -> dict[str, Any]:
         """
         Render an explicit page index with current overlays.
@@ -542,35 +2748,21 @@ class Api:
                     "page_display_width": w,
                     "page_display_height": h,
                     "page_index": idx,
+                    "version": self._page_version(idx),
                 }
 
-            with self._render_lock:
-                hit2 = self._cache_get(idx)
-                if hit2:
-                    w, h = self._page_image_size(idx)
-                    return {
-                        "ok": True,
-                        "png": hit2,
-                        "png_data": self._png_as_data_url(hit2),
-                        "page_display_width": w,
-                        "page_display_height": h,
-                        "page_index": idx,
-                    }
-                png, w, h = self._render_page_png_url(idx)
-                self._cache_put(idx, png)
+            png, w, h, png_data, version = self._render_coalesced(idx)
 
             # prefetch neighbor pages in background (for fast rapid paging)
+            sess = self._session
+
             def _prefetch(n: int) -> None:
                 try:
                     if n < 0 or n >= self._page_count:
                         return
-                    if self._cache_get(n):
-                        return
-                    with self._render_lock:
-                        if self._cache_get(n):
-                            return
-                        png2, _, _ = self._render_page_png_url(n)
-                        self._cache_put(n, png2)
+                    if self._cache_get(n) or self._session is not sess:
+                        return  # switched to another workspace project meanwhile
+                    self._render_coalesced(n, wait=False)
                 except Exception:
                     return
 
@@ -580,15 +2772,116 @@ class Api:
             return {
                 "ok": True,
                 "png": png,
-                "png_data": self._png_as_data_url(png),
+                "png_data": png_data,
                 "page_display_width": w,
                 "page_display_height": h,
                 "page_index": idx,
+                "version": version,
+            }
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    def _page_base_png(self, idx: int) -> Path:
+        """
+        The page's template raster as PNG for the browser, beside the raw raster and keyed by the same fingerprint.
+        Without a fingerprint it is rewritten on every call, outside base/ so _prune_base_rasters leaves it alone.
+        """
+        raw = self._base_raster_path(idx)
+        path = raw.with_suffix(".png") if raw is not None else self._cache_dir() / f"base_{idx:04d}.png"
+        if raw is None or not path.exists():
+            with self._render_lock:
+                if raw is None or not path.exists():
+                    img = self._page_base_image(idx)
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    tmp = path.with_name(path.name + f".{uuid.uuid4().hex[:6]}.tmp")
+                    img.save(tmp, format="PNG")
+                    os.replace(tmp, path)
+        return path
+
+    def _page_geometry(self) -> list[tuple[float, float, float, float, float, float]]:
+        if self._template_plan() is not None:
+            with self._plan_lock:
+                if self._plan is not None:
+                    return self._plan.geometry()
+        from pypdf import PdfReader
+
+        return _reader_geometry(PdfReader(str(self._pdf_path())))
+
+    def get_page_overlay(self, page_index: int, have_base: str | None = None) -> dict[str, Any]:
+        """
+        Overlay-only preview of a page: its template raster (the same image for every overlay state;
+        base_data is omitted when have_base already names it) and the text as _export_filled_pdf sets
+        it, in preview pixels: per placement the font, size, colour, and each line's baseline and
+        per-character x. fonts carries the export metrics (see _glyph_metrics) and k the placement
+        px -> image px factors, so the UI can lay out edits itself with no render round trip.
+        """
+        if not self._project and not self._ensure_project_loaded():
+            return {"ok": False, "error": "no_project"}
+        try:
+            idx = min(max(0, int(page_index or 0)), self._page_count - 1)
+            base = self._page_base_png(idx)
+            w, h = self._page_image_size(idx)
+            geom = self._page_geometry()
+            _, _, llx, lly, cw, ch = geom[idx]
+            kx = max(1, round(cw / 72.0 * RENDER_DPI)) / cw  # image px per point
+            ky = max(1, round(ch / 72.0 * RENDER_DPI)) / ch
+            placements = self._placements()
+            on_page = {fid: pl for fid, pl in placements.items() if pl.page == idx and pl.tag}
+            _, ascents = _export_fonts()
+            layout = _build_export_layout(geom, on_page, ascents)
+            values = self._project.data.get("values") or {}
+            texts = {t: str(values.get(t) or "").replace("<br>", "\n") for t in set(layout.tag)}
+            fonts = _glyph_metrics(_export_chars(texts.values()) | {chr(c) for c in range(0x20, 0x7F)})
+            emb = fonts.get("export")
+            items = []
+            for i, fid in enumerate(on_page):
+                text = texts[layout.tag[i]]
+                if not text.strip():
+                    continue
+                fs_pt = layout.fs_pt[i]
+                if emb is not None and all(emb["advances"].get(c) is not None for c in set(text) - {"\n", "\r"}):
+                    key = "export"
+                    y0 = layout.y_base["Helvetica"][i] + (ascents["Helvetica"] - emb["ascent"]) * fs_pt
+                else:
+                    key = "jp" if _needs_jp(text) else "latin"
+                    y0 = layout.y_base[fonts[key]["name"]][i]
+                adv = fonts[key]["advances"]
+                lines = []
+                for li, line in enumerate(text.splitlines() or [""]):
+                    xs = []
+                    cx = layout.x_pt[i]
+                    for c in line:
+                        xs.append(round((cx - llx) * kx, 2))
+                        cx += adv[c] / 1000.0 * fs_pt + layout.letter_pt[i]
+                    lines.append({"text": line, "y": round((lly + ch - (y0 - layout.line_pt[i] * li)) * ky, 2), "x": xs})
+                items.append({"fid": fid, "tag": layout.tag[i], "font": key, "size": round(fs_pt * ky, 3), "color": layout.color[i], "lines": lines})
+            base_key = base.stem
+            return {
+                "ok": True,
+                "page_index": idx,
+                "page_display_width": w,
+                "page_display_height": h,
+                "version": self._page_version(idx),
+                "base": self._file_url(base, bust=False),
+                "base_key": base_key,
+                "base_data": None if have_base == base_key else self._png_as_data_url(self._file_url(base, bust=False)),
+                "k": [round(kx * 72.0 / RENDER_DPI, 6), round(ky * 72.0 / RENDER_DPI, 6)],
+                "jp_re": _JP_RE.pattern,
+                "fonts": fonts,
+                "items": items,
             }
         except Exception as e:
             return {"ok": False, "error": str(e)}
 
-    def save_current_project(self, make_filled_pdf: bool = False) -> dict[str, Any]:
+    def get_glyph_metrics(self, chars: str) -> dict[str, Any]:
+        """Export metrics for chars the overlay preview has not seen yet (typed after get_page_overlay)."""
+        try:
+            return {"ok": True, "fonts": _glyph_metrics(set(str(chars or "")) - {"\n", "\r"})}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    def save_current_project(self, make_filled_pdf: bool = False, background: bool = False) -> dict[str, Any]:
+        """Write project.json. make_filled_pdf also exports (background=True queues it via start_export)."""
         if not self._project and not self._ensure_project_loaded():
             return {"ok": False, "error": "no_project"}
         try:
@@ -597,23 +2890,15 @@ class Api:
             _write_json(self._project.path, self._project.data)
             filled_pdf = None
             pdf_path = None
-            if bool(make_filled_pdf):
-                out_dir = (self._project.path.parent / "exports").resolve()
-                stamp = time.strftime("%Y%m%d-%H%M%S")
-                proj = _safe_name(str(self._project.data.get("project") or "project"))
-                who = _safe_name(str(self._working_worker_id or "worker"))
-                out_pdf = out_dir / f"autosave-{proj}-{stamp}-{who}.pdf"
-                self._export_filled_pdf(out_pdf)
-                latest = (self._project.path.parent / "template_filled_latest.pdf").resolve()
-                try:
-                    shutil.copy2(out_pdf, latest)
-                except Exception:
-                    try:
-                        self._export_filled_pdf(latest)
-                    except Exception:
-                        pass
-                filled_pdf = str(latest if latest else out_pdf.resolve())
-                pdf_path = str(out_pdf.resolve())
+            job_id = None
+            memo = None
+            if bool(make_filled_pdf) and background:
+                job_id = self.start_export("autosave").get("job_id")
+            elif bool(make_filled_pdf):
+                res = self._write_export_outputs("autosave", self._export_snapshot())
+                filled_pdf = res["filled_pdf"]
+                pdf_path = res["pdf"]
+                memo = res["memo"]
             return {
                 "ok": True,
                 "path": str(self._project.path),
@@ -621,11 +2906,13 @@ class Api:
                 "exports_dir": str((self._project.path.parent / "exports").resolve()),
                 "pdf": pdf_path,
                 "filled_pdf": filled_pdf,
+                "job_id": job_id,
+                "memo": memo,
             }
         except Exception as e:
             return {"ok": False, "error": str(e)}
 
-    def save_project_as(self, name: str, make_filled_pdf: bool = True) -> dict[str, Any]:
+    def save_project_as(self, name: str, make_filled_pdf: bool = True, background: bool = False) -> dict[str, Any]:
         """
         Save as a new project (duplicate current project to a new folder) and load it.
         """
@@ -636,8 +2923,9 @@ class Api:
             pid = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}-{new_name}"
             src_dir = self._project.path.parent
             dst_dir = PROJECTS_DIR / pid
-            # Copy whole project folder, but skip exports
-            shutil.copytree(src_dir, dst_dir, ignore=shutil.ignore_patterns("exports"))
+            # Duplicate the project folder (skipping exports). PDFs are hardlinked through the
+            # blob store, so this costs no copy of template/backups/sources.
+            self._clone_project_dir(src_dir, dst_dir)
 
             # Rewrite project.json with updated name/timestamps
             proj_json = dst_dir / self._project.path.name
@@ -652,23 +2940,15 @@ class Api:
             self.load_project(self._last_project_path)
             filled_pdf = None
             pdf_path = None
-            if bool(make_filled_pdf) and self._project:
-                out_dir = (Path(self._last_project_path).resolve().parent / "exports").resolve()
-                stamp = time.strftime("%Y%m%d-%H%M%S")
-                proj = _safe_name(str(self._project.data.get("project") or "project"))
-                who = _safe_name(str(self._working_worker_id or "worker"))
-                out_pdf = out_dir / f"autosave-{proj}-{stamp}-{who}.pdf"
-                self._export_filled_pdf(out_pdf)
-                latest = (Path(self._last_project_path).resolve().parent / "template_filled_latest.pdf").resolve()
-                try:
-                    shutil.copy2(out_pdf, latest)
-                except Exception:
-                    try:
-                        self._export_filled_pdf(latest)
-                    except Exception:
-                        pass
-                filled_pdf = str(latest if latest else out_pdf.resolve())
-                pdf_path = str(out_pdf.resolve())
+            job_id = None
+            memo = None
+            if bool(make_filled_pdf) and self._project and background:
+                job_id = self.start_export("autosave").get("job_id")
+            elif bool(make_filled_pdf) and self._project:
+                res = self._write_export_outputs("autosave", self._export_snapshot())
+                filled_pdf = res["filled_pdf"]
+                pdf_path = res["pdf"]
+                memo = res["memo"]
             return {
                 "ok": True,
                 "path": self._last_project_path,
@@ -676,14 +2956,41 @@ class Api:
                 "exports_dir": str((Path(self._last_project_path).resolve().parent / "exports").resolve()),
                 "pdf": pdf_path,
                 "filled_pdf": filled_pdf,
+                "job_id": job_id,
+                "memo": memo,
             }
         except Exception as e:
             return {"ok": False, "error": str(e)}
 
-    def append_pdf_to_project(self, pdf_path: str) -> dict[str, Any]:
+    def _clone_project_dir(self, src_dir: Path, dst_dir: Path) -> None:
+        for fp in sorted(src_dir.rglob("*")):
+            rel = fp.relative_to(src_dir)
+            if rel.parts[0] == "exports" or fp.name.endswith(".tmp"):
+                continue
+            dst = dst_dir / rel
+            if fp.is_dir():
+                dst.mkdir(parents=True, exist_ok=True)
+            elif fp.suffix.lower() == ".pdf" and fp.name != "template_filled_latest.pdf":
+                _share_file(fp, dst)
+            elif fp.name == "template.plan":
+                _link_or_copy(fp, dst)  # rewritten by replace, never in place
+            else:
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(fp, dst)
+
+    def gc_blobs(self) -> dict[str, Any]:
+        """Reclaim blob store entries no project references any more."""
+        try:
+            return {"ok": True, **_gc_blobs()}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    def append_pdf_to_project(self, pdf_path: str, insert_at: int | None = None) -> dict[str, Any]:
         """
-        Append another PDF to current project's template.pdf (merge pages).
-        This produces a single combined PDF for the project.
+        Insert another PDF into current project's template.pdf (merge pages).
+        Pages are appended at the end unless insert_at (0-based page index) is given.
+        With PyMuPDF the pages are inserted in place and saved incrementally, so
+        existing pages keep their cached previews (only new pages need rendering).
         """
         if not self._project and not self._ensure_project_loaded():
             return {"ok": False, "error": "no_project"}
@@ -692,69 +2999,273 @@ class Api:
             if not src.exists():
                 return {"ok": False, "error": "pdf_not_found"}
 
-            dst_pdf = self._pdf_path()
-            # Close renderer before touching the PDF file on Windows.
-            try:
-                if self._fitz_doc is not None:
-                    self._fitz_doc.close()
-            except Exception:
-                pass
-            self._fitz_doc = None
-            self._fitz_pdf_path = None
-
             # Keep a copy of the added PDF inside project folder for traceability.
             try:
                 src_dir = self._project.path.parent / "sources"
                 src_dir.mkdir(parents=True, exist_ok=True)
                 stamp = time.strftime("%Y%m%d-%H%M%S")
                 dst_src = src_dir / f"{stamp}-{_safe_name(src.stem)}.pdf"
-                shutil.copy2(src, dst_src)
+                _store_file(src, dst_src, link=False)
             except Exception:
                 pass
 
-            # Merge existing template and new PDF into template.pdf
-            reader_a = PdfReader(str(dst_pdf))
-            reader_b = PdfReader(str(src))
-            writer = PdfWriter()
-            for pg in reader_a.pages:
-                writer.add_page(pg)
-            for pg in reader_b.pages:
-                writer.add_page(pg)
+            with self._render_lock:
+                self._detach_template()
+                n_before = int(self._page_count)
+                pos = n_before if insert_at is None else min(max(0, int(insert_at)), n_before)
+                if _fitz() is not None:
+                    n_new = self._fitz_insert_pdf(src, pos)
+                else:
+                    n_new = self._pypdf_insert_pdf(src, pos)
+
+                # Pages at/after the insert position move back by n_new.
+                mapping = {i: (i if i < pos else i + n_new) for i in range(n_before)}
+                self._remap_placement_pages(mapping)
+                self._remap_cached_pages(mapping)
+                self._remap_edit_log(mapping)
 
-            tmp = dst_pdf.with_suffix(".pdf.tmp")
-            with open(tmp, "wb") as f:
-                writer.write(f)
+            self._project.data["updated_at"] = _now_iso()
+            _write_json(self._project.path, self._project.data)
+            return {
+                "ok": True,
+                "page_count": int(self._page_count),
+                "inserted_at": pos,
+                "inserted_pages": n_new,
+                "placements": _placements_json(self._project.data.get("placements")),
+            }
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    def reorder_pages(self, order: list[int]) -> dict[str, Any]:
+        """
+        Reorder template pages. order[i] is the current index of the page that becomes page i.
+        Placements follow their page; cached previews are moved, not re-rendered.
+        """
+        if not self._project and not self._ensure_project_loaded():
+            return {"ok": False, "error": "no_project"}
+        try:
+            if not isinstance(order, list):
+                return {"ok": False, "error": "invalid_args"}
+            new_order = [int(x) for x in order]
+            if sorted(new_order) != list(range(int(self._page_count))):
+                return {"ok": False, "error": "invalid_order"}
+            mapping = {old: new for new, old in enumerate(new_order)}
+            if all(k == v for k, v in mapping.items()):
+                return {"ok": True, "page_count": int(self._page_count)}
+
+            with self._render_lock:
+                self._detach_template()
+                if _fitz() is not None:
+                    doc = self._fitz_doc if self._fitz_doc is not None else _fitz().open(str(self._pdf_path()))
+                    doc.select(new_order)
+                    self._fitz_save(doc)
+                else:
+                    from pypdf import PdfReader, PdfWriter
+
+                    dst_pdf = self._pdf_path()
+                    reader = PdfReader(str(dst_pdf))
+                    writer = PdfWriter()
+                    for old in new_order:
+                        writer.add_page(reader.pages[old])
+                    self._pypdf_replace_template(writer)
+                self._remap_placement_pages(mapping)
+                self._remap_cached_pages(mapping)
+                self._remap_edit_log(mapping)
 
-            # Optional backup
+            self._project.data["updated_at"] = _now_iso()
+            _write_json(self._project.path, self._project.data)
+            return {
+                "ok": True,
+                "page_count": int(self._page_count),
+                "placements": _placements_json(self._project.data.get("placements")),
+            }
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    def _fitz_insert_pdf(self, src: Path, pos: int) -> int:
+        """Insert src pages at pos into the open template (PyMuPDF). Returns number of pages inserted."""
+        dst_pdf = self._pdf_path()
+        doc = self._fitz_doc
+        if doc is None:
+            doc = _fitz().open(str(dst_pdf))
+        other = _fitz().open(str(src))
+        try:
+            n_new = int(other.page_count)
+            doc.insert_pdf(other, start_at=pos)
+        finally:
+            other.close()
+        self._fitz_save(doc)
+        return n_new
+
+    def _detach_template(self) -> None:
+        """
+        Copy-on-write before an in-place template edit: a template shared with the blob
+        store (or another project) is copied to its own inode first. The open document
+        is closed because it still points at the shared file.
+        """
+        dst_pdf = self._pdf_path()
+        try:
+            if dst_pdf.stat().st_nlink < 2:
+                return
+        except OSError:
+            return
+        try:
+            if self._fitz_doc is not None:
+                self._fitz_doc.close()
+        except Exception:
+            pass
+        self._fitz_doc = None
+        self._fitz_pdf_path = None
+        _detach_file(dst_pdf)
+
+    def _fitz_save(self, doc: Any) -> None:
+        """
+        Persist a modified template. Incremental save only appends the changed objects,
+        and the previous revision stays recoverable as a byte prefix of the file
+        (recorded in template_revisions instead of a full backup copy).
+        """
+        dst_pdf = self._pdf_path()
+        prev_size = dst_pdf.stat().st_size if dst_pdf.exists() else 0
+        saved_incr = False
+        try:
+            if doc.can_save_incrementally():
+                doc.saveIncr()
+                saved_incr = True
+        except Exception:
+            saved_incr = False
+        if saved_incr:
+            _note_own_write(dst_pdf)
+            # reopen so a later incremental save chains /Prev to this revision's xref
+            doc.close()
+            doc = _fitz().open(str(dst_pdf))
+            revs = list(self._project.data.get("template_revisions") or [])
+            revs.append({"size": prev_size, "at": _now_iso()})
+            self._project.data["template_revisions"] = revs
+        else:
+            tmp = dst_pdf.with_suffix(".pdf.tmp")
+            doc.save(str(tmp), garbage=1, deflate=True)
+            doc.close()
             try:
                 bak = dst_pdf.with_name(f"template__bak_{int(time.time())}.pdf")
-                shutil.copy2(dst_pdf, bak)
+                _share_file(dst_pdf, bak)
             except Exception:
                 pass
-
             os.replace(tmp, dst_pdf)
+            _note_own_write(dst_pdf)
+            doc = _fitz().open(str(dst_pdf))
+        self._fitz_doc = doc
+        self._fitz_pdf_path = str(dst_pdf)
+        self._page_count = max(1, int(doc.page_count))
+        self._session.page_hashes = None  # watcher re-takes the baseline
+        self._drop_plan()
+
+    def _pypdf_insert_pdf(self, src: Path, pos: int) -> int:
+        """Fallback merge without PyMuPDF (full rewrite through pypdf)."""
+        from pypdf import PdfReader, PdfWriter
+
+        reader_a = PdfReader(str(self._pdf_path()))
+        reader_b = PdfReader(str(src))
+        writer = PdfWriter()
+        pages_a = list(reader_a.pages)
+        for pg in pages_a[:pos]:
+            writer.add_page(pg)
+        for pg in reader_b.pages:
+            writer.add_page(pg)
+        for pg in pages_a[pos:]:
+            writer.add_page(pg)
+        self._pypdf_replace_template(writer)
+        return len(reader_b.pages)
+
+    def _pypdf_replace_template(self, writer: Any) -> None:
+        from pypdf import PdfReader
 
-            # Reload and reset caches
+        dst_pdf = self._pdf_path()
+        tmp = dst_pdf.with_suffix(".pdf.tmp")
+        with open(tmp, "wb") as f:
+            writer.write(f)
+
+        # Optional backup (shares the previous revision's blob instead of copying it)
+        try:
+            bak = dst_pdf.with_name(f"template__bak_{int(time.time())}.pdf")
+            _share_file(dst_pdf, bak)
+        except Exception:
+            pass
+
+        os.replace(tmp, dst_pdf)
+        _note_own_write(dst_pdf)
+        self._fitz_doc = None
+        self._fitz_pdf_path = None
+        self._page_count = max(1, int(len(PdfReader(str(dst_pdf)).pages)))
+        self._session.page_hashes = None
+        self._drop_plan()
+
+    def _remap_placement_pages(self, mapping: dict[int, int]) -> None:
+        """Move placements to new page indices (old -> new)."""
+        for _, pl in self._placements().items():
+            old = pl.page
+            if old in mapping and mapping[old] != old:
+                pl.page = int(mapping[old])
+
+    def _remap_edit_log(self, mapping: dict[int, int]) -> None:
+        """Renumber pages in logged placement states (old -> new), so undo/redo keep working across page edits."""
+        for entry in (*self._undo, *self._redo):
+            for kind, _, before, after in entry:
+                if kind != "placement":
+                    continue
+                for state in (before, after):
+                    if state is None:
+                        continue
+                    old = int(_num(state.get("page"), 0))
+                    if old in mapping and mapping[old] != old:
+                        state["page"] = int(mapping[old])
+        self._undo_merge_key = None  # an edit after the page change is a new entry
+
+    def _remap_cached_pages(self, mapping: dict[int, int]) -> None:
+        """Move cached preview PNGs to new page indices (old -> new). Pages missing from mapping are dropped."""
+        try:
+            d = self._cache_dir()
+        except Exception:
+            return
+        moved: list[tuple[Path, int]] = []
+        for fp in d.glob("page_*.png"):
             try:
-                if fitz is not None:
-                    self._fitz_doc = fitz.open(str(dst_pdf))
-                    self._fitz_pdf_path = str(dst_pdf)
-                    self._page_count = max(1, int(self._fitz_doc.page_count))
-                else:
-                    self._page_count = max(1, int(len(PdfReader(str(dst_pdf)).pages)))
+                old = int(fp.stem.split("_", 1)[1])
             except Exception:
-                self._fitz_doc = None
-                self._fitz_pdf_path = None
-                self._page_count = 1
+                continue
+            new = mapping.get(old)
+            try:
+                if new is None:
+                    fp.unlink()
+                elif new != old:
+                    # two-phase rename so swapped pages don't overwrite each other
+                    tmp = d / f"remap_{old:04d}.png"
+                    os.replace(fp, tmp)
+                    moved.append((tmp, new))
+            except Exception:
+                pass
+        for tmp, new in moved:
+            try:
+                os.replace(tmp, self._cache_png_path(new))
+            except Exception:
+                pass
 
-            self._page_cache.clear()
-            self._invalidate_pages(None)
+        old_cache = list(self._page_cache.items())
+        self._page_cache.clear()
+        for old, url in old_cache:
+            new = mapping.get(int(old))
+            if new is None:
+                continue
+            if str(url).startswith("file:"):
+                url = self._file_url(self._cache_png_path(new), bust=True)
+            self._page_cache[new] = url
 
-            self._project.data["updated_at"] = _now_iso()
-            _write_json(self._project.path, self._project.data)
-            return {"ok": True, "page_count": int(self._page_count)}
-        except Exception as e:
-            return {"ok": False, "error": str(e)}
+        # coalesced frames hold the image of whatever page had their index before: drop them, and move
+        # every page to a new version so in-flight renders of the old order are not handed out either
+        with self._render_cv:
+            for slot in self._render_slots.values():
+                slot.frame, slot.version = None, -1
+            self._page_versions.clear()
+            self._page_versions[-1] = next(self._version_seq)
 
     # --- mode / workers ---
     def set_ui_mode(self, mode: str) -> dict[str, Any]:
@@ -774,28 +3285,15 @@ class Api:
         return {"ok": True, "settings": s}
 
     def get_workers(self) -> dict[str, Any]:
-        rows = _read_json(WORKERS_PATH, [])
-        if not isinstance(rows, list):
-            rows = []
-        # minimal normalization
-        workers = []
-        for r in rows:
-            if not isinstance(r, dict):
-                continue
-            if not r.get("id"):
-                continue
-            workers.append(r)
+        workers = _activity().workers()
         # If there are no workers yet, seed a friendly default (prevents confusing empty UI).
         if not workers:
             workers = [{"id": "w1", "name": "作業者1", "bank": "", "hourly_yen": 0}]
-            _write_json(WORKERS_PATH, workers)
+            _activity().upsert_worker(workers[0])
         last = workers[0]["id"] if workers else None
         return {"ok": True, "workers": workers, "last_worker_id": last}
 
     def upsert_worker(self, w: dict[str, Any]) -> dict[str, Any]:
-        rows = _read_json(WORKERS_PATH, [])
-        if not isinstance(rows, list):
-            rows = []
         wid = str(w.get("id") or "") or f"w_{uuid.uuid4().hex[:8]}"
         item = {
             "id": wid,
@@ -805,17 +3303,7 @@ class Api:
         }
         if not item["name"]:
             return {"ok": False, "error": "missing_name"}
-        out = []
-        replaced = False
-        for r in rows:
-            if isinstance(r, dict) and r.get("id") == wid:
-                out.append(item)
-                replaced = True
-            else:
-                out.append(r)
-        if not replaced:
-            out.insert(0, item)
-        _write_json(WORKERS_PATH, out)
+        _activity().upsert_worker(item)
         return {"ok": True, "id": wid}
 
     def delete_worker(self, worker_id: str) -> dict[str, Any]:
@@ -823,11 +3311,7 @@ class Api:
             wid = str(worker_id or "").strip()
             if not wid:
                 return {"ok": False, "error": "missing_id"}
-            rows = _read_json(WORKERS_PATH, [])
-            if not isinstance(rows, list):
-                rows = []
-            out = [r for r in rows if not (isinstance(r, dict) and str(r.get("id") or "") == wid)]
-            _write_json(WORKERS_PATH, out)
+            _activity().delete_worker(wid)
             return {"ok": True}
         except Exception as e:
             return {"ok": False, "error": str(e)}
@@ -836,14 +3320,232 @@ class Api:
     def start_work(self, worker_id: str) -> dict[str, Any]:
         if not self._project and not self._ensure_project_loaded():
             return {"ok": False, "error": "no_project"}
-        self._working_worker_id = str(worker_id or "")
+        wid = str(worker_id or "")
+        proj = str(self._project.path)
+        work = self._work
+        if work is not None and work["worker_id"] == wid and work["project_path"] == proj:
+            return {"ok": True, "session": work["id"], "resumed": True}
+        if work is not None:
+            # Another worker/project was still open: close it at the switch instead of dropping its time.
+            done = self._work_until(time.time())
+            self._log_work("finish", done, started=done["t0"], seconds=done["seconds"], ts=done["end"])
+        self._working_worker_id = wid
         self._private = False
-        return {"ok": True}
+        self._work = {
+            "id": uuid.uuid4().hex[:12],
+            "worker_id": wid,
+            "project_path": proj,
+            "project_name": str(self._project.data.get("project") or self._project.path.parent.name),
+            "t0": time.time(),
+            "private_t0": None,
+            "private_sec": 0.0,
+        }
+        self._log_work("start")
+        return {"ok": True, "session": self._work["id"]}
 
     def toggle_private(self) -> dict[str, Any]:
         self._private = not self._private
+        work = self._work
+        if work is not None:
+            now = time.time()
+            if self._private:
+                work["private_t0"] = now
+                self._log_work("private")
+            elif work["private_t0"] is not None:
+                gap = now - work["private_t0"]
+                work["private_sec"] += gap
+                work["private_t0"] = None
+                self._log_work("resume", seconds=gap)
         return {"ok": True, "in_private": self._private}
 
+    def _log_work(self, kind: str, work: dict[str, Any] | None = None, **kw: Any) -> None:
+        work = work or self._work
+        if work is None:
+            return
+        try:
+            _activity().append(kind, work["worker_id"], work["id"], work["project_path"], work["project_name"], **kw)
+        except Exception:
+            pass  # the activity log must never block editing or exports
+
+    def _work_until(self, end: float) -> dict[str, Any] | None:
+        """The open work session with its net seconds (private time excluded) up to end."""
+        work = self._work
+        if work is None:
+            return None
+        private = work["private_sec"] + (end - work["private_t0"] if work["private_t0"] is not None else 0.0)
+        return {**work, "end": end, "seconds": max(0.0, end - work["t0"] - private)}
+
+    def get_activity_history(self, worker_id: str | None = None, limit: int = 200, before: float | None = None) -> dict[str, Any]:
+        try:
+            rows = _activity().history(str(worker_id or "") or None, int(limit or 200), before)
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        for r in rows:
+            r["start"] = _iso_utc(r["started"]) if r["started"] is not None else None
+            r["end"] = _iso_utc(r["ts"])
+        return {"ok": True, "history": rows}
+
+    def get_activity_summary(self, month: str | None = None, worker_id: str | None = None) -> dict[str, Any]:
+        """Hours (and pay at the worker's hourly rate) per worker for a month, default this month."""
+        m = str(month or time.strftime("%Y-%m"))
+        if not re.fullmatch(r"\d{4}-\d{2}", m):
+            return {"ok": False, "error": "invalid_month"}
+        try:
+            return {"ok": True, "month": m, "workers": _activity().monthly(m, str(worker_id or "") or None)}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    def import_activity_history(self, items: list[dict[str, Any]]) -> dict[str, Any]:
+        """One-time import of history kept by older UIs (localStorage inputstudio-history)."""
+        n = 0
+        for h in items or []:
+            try:
+                end = _parse_iso(h.get("end"))
+                start = _parse_iso(h.get("start"))
+                if end is None:
+                    continue
+                _activity().append(
+                    "finish",
+                    str(h.get("workerId") or ""),
+                    f"import-{uuid.uuid4().hex[:8]}",
+                    str(h.get("projectPath") or ""),
+                    str(h.get("projectName") or ""),
+                    started=start,
+                    seconds=float(h.get("duration") or 0),
+                    ts=end,
+                )
+                n += 1
+            except Exception:
+                continue
+        return {"ok": True, "imported": n}
+
+    def reset_activity_history(self) -> dict[str, Any]:
+        try:
+            _activity().clear_history()
+            return {"ok": True}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    # --- undo / redo (structural diffs) ---
+    def _placements(self) -> PlacementStore:
+        """The project's placement store, by reference (converted once if it was set as plain dicts)."""
+        data = self._project.data
+        store = data.get("placements")
+        if not isinstance(store, PlacementStore):
+            store = PlacementStore(store or {})
+            data["placements"] = store
+        return store
+
+    def _payload_view(self) -> dict[str, Any]:
+        """Shallow view of tags/values/placements (placement objects are shared, not copied)."""
+        data = self._project.data
+        return {
+            "tags": list(data.get("tags") or []),
+            "values": dict(data.get("values") or {}),
+            "placements": dict(self._placements()),
+        }
+
+    def _record_edit(self, changes: list[tuple[str, str, Any, Any]], merge_key: str | None = None) -> None:
+        """
+        Push one edit (list of (kind, key, before, after) changes) onto the undo log and clear redo.
+        Consecutive edits with the same merge_key (e.g. typing into one tag) collapse into one entry.
+        """
+        changes = [c for c in changes if c[2] != c[3]]
+        if not changes:
+            return
+        now = time.monotonic()
+        if merge_key and self._undo and self._undo_merge_key == merge_key and now - self._undo_t < UNDO_MERGE_SEC:
+            last = self._undo[-1]
+            index = {(k, key): i for i, (k, key, _, _) in enumerate(last)}
+            for kind, key, before, after in changes:
+                i = index.get((kind, key))
+                if i is None:
+                    last.append((kind, key, before, after))
+                else:
+                    last[i] = (kind, key, last[i][2], after)
+        else:
+            self._undo.append(changes)
+            if len(self._undo) > UNDO_LIMIT:
+                del self._undo[0]
+        self._undo_merge_key = merge_key
+        self._undo_t = now
+        self._redo.clear()
+
+    def _reset_edit_log(self) -> None:
+        self._undo.clear()
+        self._redo.clear()
+        self._undo_merge_key = None
+
+    def _apply_edit(self, changes: list[tuple[str, str, Any, Any]], forward: bool, write: bool = True) -> tuple[dict[str, Any], set[int]]:
+        """
+        Apply the after (forward) or before side of changes in place. Returns (patch for the UI, touched pages).
+        write=False when the changes came from project.json itself (external edit).
+        """
+        data = self._project.data
+        placements = self._placements()
+        values = data.setdefault("values", {})
+        patch: dict[str, Any] = {"placements": {}, "values": {}, "tags": None}
+        pages: set[int] = set()
+        value_tags: set[str] = set()
+        for kind, key, before, after in changes if forward else reversed(changes):
+            val = copy.deepcopy(after if forward else before)
+            if kind == "placement":
+                old = placements.get(key)
+                if old is not None:
+                    pages.add(old.page)
+                if val is None:
+                    placements.pop(key, None)
+                    patch["placements"][key] = None
+                else:
+                    placements[key] = val
+                    pages.add(placements[key].page)
+                    patch["placements"][key] = placements[key].to_json()
+            elif kind == "value":
+                if val is None:
+                    values.pop(key, None)
+                else:
+                    values[key] = val
+                value_tags.add(key)
+                patch["values"][key] = val
+            elif kind == "tags":
+                data["tags"] = list(val or [])
+                patch["tags"] = list(val or [])
+        if value_tags:
+            pages |= placements.pages_for_tags(value_tags)
+        if write:
+            _write_json(self._project.path, data)
+        if pages:
+            self._invalidate_pages(pages)
+        return patch, pages
+
+    def _undo_redo(self, forward: bool) -> dict[str, Any]:
+        if not self._project and not self._ensure_project_loaded():
+            return {"ok": False, "error": "no_project"}
+        src, dst = (self._redo, self._undo) if forward else (self._undo, self._redo)
+        if not src:
+            return {"ok": False, "error": "nothing_to_redo" if forward else "nothing_to_undo"}
+        changes = src.pop()
+        patch, pages = self._apply_edit(changes, forward)
+        dst.append(changes)
+        self._undo_merge_key = None
+        return {
+            "ok": True,
+            "patch": patch,
+            "pages": sorted(pages),
+            "can_undo": bool(self._undo),
+            "can_redo": bool(self._redo),
+        }
+
+    def undo(self) -> dict[str, Any]:
+        """Revert the last edit; only the changed placements/values are touched and only their pages re-render."""
+        return self._undo_redo(False)
+
+    def redo(self) -> dict[str, Any]:
+        return self._undo_redo(True)
+
+    def get_undo_state(self) -> dict[str, Any]:
+        return {"ok": True, "can_undo": bool(self._undo), "can_redo": bool(self._redo), "depth": len(self._undo)}
+
     # --- tags / placements / values ---
     def add_text_field(self, tag: str, page: int, x: float, y: float, font_size: int) -> dict[str, Any]:
         if not self._project and not self._ensure_project_loaded():
@@ -852,23 +3554,15 @@ class Api:
         if not t:
             return {"ok": False, "error": "missing_tag"}
         data = self._project.data
-        tags = list(data.get("tags") or [])
+        old_tags = list(data.get("tags") or [])
+        tags = list(old_tags)
         if t not in tags:
             tags.append(t)
         data["tags"] = tags
-        placements = dict(data.get("placements") or {})
+        placements = self._placements()
         fid = f"f_{uuid.uuid4().hex[:8]}"
-        placements[fid] = {
-            "tag": t,
-            "page": int(page or 0),
-            "x": float(x),
-            "y": float(y),
-            "font_size": int(font_size or 14),
-            "color": "#0f172a",
-            "line_height": 1.2,
-            "letter_spacing": 0,
-        }
-        data["placements"] = placements
+        placements[fid] = Placement(tag=t, page=int(page or 0), x=float(x), y=float(y), font_size=int(font_size or 14))
+        self._record_edit([("placement", fid, None, copy.deepcopy(placements[fid])), ("tags", "", old_tags, list(tags))])
         _write_json(self._project.path, data)
         self._invalidate_pages({int(page or 0)})
         return {"ok": True, "fid": fid, "tag": t}
@@ -879,36 +3573,34 @@ class Api:
         f = str(fid or "").strip()
         if not f:
             return {"ok": False, "error": "missing_id"}
-        placements = dict(self._project.data.get("placements") or {})
-        if f not in placements or not isinstance(placements.get(f), dict):
-            placements[f] = {"tag": "", "page": 0, "x": float(x), "y": float(y), "font_size": 14, "color": "#0f172a", "line_height": 1.2, "letter_spacing": 0}
+        placements = self._placements()
+        pl = placements.get(f)
+        before = copy.deepcopy(pl)
+        if pl is None:
+            pl = placements[f] = Placement(x=float(x), y=float(y))
         else:
-            placements[f]["x"] = float(x)
-            placements[f]["y"] = float(y)
-        self._project.data["placements"] = placements
+            pl.x = float(x)
+            pl.y = float(y)
+        self._record_edit([("placement", f, before, pl.copy())], merge_key=f"pos:{f}")
         _write_json(self._project.path, self._project.data)
-        try:
-            self._invalidate_pages({int(placements[f].get("page") or 0)})
-        except Exception:
-            self._invalidate_pages(None)
+        self._invalidate_pages({pl.page})
         return {"ok": True}
 
     def get_element_info(self, fid: str) -> dict[str, Any]:
         if not self._project and not self._ensure_project_loaded():
             return {"ok": False, "error": "no_project"}
         f = str(fid or "").strip()
-        pl = (self._project.data.get("placements") or {}).get(f)
-        if not isinstance(pl, dict):
+        pl = self._placements().get(f)
+        if pl is None:
             return {"ok": False, "error": "not_found"}
-        page = int(pl.get("page") or 0)
-        w, h = self._page_image_size(page)
+        w, h = self._page_image_size(pl.page)
         return {
             "ok": True,
-            "page": page,
-            "tag": str(pl.get("tag") or ""),
-            "x": float(pl.get("x") or 0),
-            "y": float(pl.get("y") or 0),
-            "font_size": int(pl.get("font_size") or 14),
+            "page": pl.page,
+            "tag": pl.tag,
+            "x": pl.x,
+            "y": pl.y,
+            "font_size": int(pl.font_size),
             "page_display_width": w,
             "page_display_height": h,
         }
@@ -918,15 +3610,14 @@ class Api:
             return {"ok": False, "error": "no_project"}
         t = str(tag or "").strip()
         values = dict(self._project.data.get("values") or {})
+        before = values.get(t)
         values[t] = str(value or "")
         self._project.data["values"] = values
+        self._record_edit([("value", t, before, values[t])], merge_key=f"value:{t}")
         _write_json(self._project.path, self._project.data)
         # Invalidate all pages that have placements using this tag.
         try:
-            pages: set[int] = set()
-            for _, pl in (self._project.data.get("placements") or {}).items():
-                if isinstance(pl, dict) and str(pl.get("tag") or "").strip() == t:
-                    pages.add(int(pl.get("page") or 0))
+            pages = self._placements().pages_for_tags({t})
             self._invalidate_pages(pages if pages else None)
         except Exception:
             self._invalidate_pages(None)
@@ -939,31 +3630,19 @@ class Api:
         f = str(fid or "").strip()
         if not f:
             return {"ok": False, "error": "missing_id"}
-        placements = dict(self._project.data.get("placements") or {})
-        pl = placements.get(f)
-        if not isinstance(pl, dict):
+        pl = self._placements().get(f)
+        if pl is None:
             return {"ok": False, "error": "not_found"}
         if not isinstance(patch, dict):
             return {"ok": False, "error": "invalid_patch"}
+        before = pl.copy()
+        old_page = pl.page
         for k, v in patch.items():
-            if k in ("x", "y"):
-                pl[k] = float(v)
-            elif k in ("page",):
-                pl[k] = int(v)
-            elif k in ("font_size",):
-                pl[k] = int(v)
-            elif k in ("color",):
-                pl[k] = str(v)
-            elif k in ("line_height",):
-                pl[k] = float(v)
-            elif k in ("letter_spacing",):
-                pl[k] = float(v)
-            elif k in ("tag",):
-                pl[k] = str(v)
-        placements[f] = pl
-        self._project.data["placements"] = placements
+            if k in Placement.FIELDS:
+                pl[k] = v
+        self._record_edit([("placement", f, before, pl.copy())])
         _write_json(self._project.path, self._project.data)
-        self._invalidate_pages({int(pl.get("page") or 0)})
+        self._invalidate_pages({old_page, pl.page})
         return {"ok": True}
 
     def delete_elements(self, fids: list[str]) -> dict[str, Any]:
@@ -973,18 +3652,18 @@ class Api:
         if not isinstance(fids, list):
             return {"ok": False, "error": "invalid_args"}
         data = self._project.data
-        placements = dict(data.get("placements") or {})
+        view0 = self._payload_view()
+        placements = self._placements()
         pages: set[int] = set()
         removed_tags: list[str] = []
         for fid in [str(x).strip() for x in fids if str(x).strip()]:
             pl = placements.pop(fid, None)
-            if isinstance(pl, dict):
-                pages.add(int(pl.get("page") or 0))
-                removed_tags.append(str(pl.get("tag") or "").strip())
-        data["placements"] = placements
+            if pl is not None:
+                pages.add(pl.page)
+                removed_tags.append(pl.tag)
 
         # Remove tags that are no longer used by any placement.
-        still_used = {str(pl.get("tag") or "").strip() for pl in placements.values() if isinstance(pl, dict)}
+        still_used = {pl.tag for pl in placements.values()}
         tags0 = [str(t).strip() for t in (data.get("tags") or []) if str(t).strip()]
         if removed_tags:
             data["tags"] = [t for t in tags0 if t in still_used]
@@ -994,6 +3673,7 @@ class Api:
                     values.pop(t, None)
             data["values"] = values
 
+        self._record_edit(_diff_payload(view0, self._payload_view()))
         _write_json(self._project.path, data)
         self._invalidate_pages(pages if pages else None)
         return {"ok": True}
@@ -1008,43 +3688,59 @@ class Api:
         if not tset:
             return {"ok": True}
         data = self._project.data
+        view0 = self._payload_view()
         old_tags = list(data.get("tags") or [])
         data["tags"] = [t for t in old_tags if t not in tset]
         values = dict(data.get("values") or {})
-        placements = dict(data.get("placements") or {})
+        placements = self._placements()
         pages: set[int] = set()
         for t in list(tset):
             values.pop(t, None)
         # Remove all placements that use these tags.
         for fid, pl in list(placements.items()):
-            if isinstance(pl, dict) and str(pl.get("tag") or "").strip() in tset:
-                pages.add(int(pl.get("page") or 0))
+            if pl.tag in tset:
+                pages.add(pl.page)
                 placements.pop(fid, None)
         data["values"] = values
-        data["placements"] = placements
+        self._record_edit(_diff_payload(view0, self._payload_view()))
         _write_json(self._project.path, data)
         self._invalidate_pages(pages if pages else None)
         return {"ok": True}
 
     def set_project_payload(self, payload: dict[str, Any]) -> dict[str, Any]:
-        """Replace tags/values/placements in current project (for undo/redo & bulk ops)."""
+        """
+        Replace tags/values/placements in current project (for bulk ops).
+        Only entries that differ (placements by fid, values by tag) are applied, and only
+        pages whose overlay changed are invalidated. Returns a summary of the diff.
+        """
         if not self._project and not self._ensure_project_loaded():
             return {"ok": False, "error": "no_project"}
         if not isinstance(payload, dict):
             return {"ok": False, "error": "invalid_payload"}
-        data = self._project.data
+        view0 = self._payload_view()
+        new = dict(view0)
         tags = payload.get("tags")
         values = payload.get("values")
         placements = payload.get("placements")
         if isinstance(tags, list):
-            data["tags"] = [str(t) for t in tags if str(t).strip()]
+            new["tags"] = [str(t) for t in tags if str(t).strip()]
         if isinstance(values, dict):
-            data["values"] = {str(k): str(v) for k, v in values.items()}
+            new["values"] = {str(k): str(v) for k, v in values.items()}
         if isinstance(placements, dict):
-            data["placements"] = dict(placements)
-        _write_json(self._project.path, data)
-        self._invalidate_pages(None)
-        return {"ok": True}
+            new["placements"] = {str(k): v for k, v in placements.items() if isinstance(v, (dict, Placement))}
+        changes = _diff_payload(view0, new)
+        summary = {
+            "placements_added": [c[1] for c in changes if c[0] == "placement" and c[2] is None],
+            "placements_removed": [c[1] for c in changes if c[0] == "placement" and c[3] is None],
+            "placements_changed": [c[1] for c in changes if c[0] == "placement" and c[2] is not None and c[3] is not None],
+            "values_changed": [c[1] for c in changes if c[0] == "value"],
+            "tags_changed": any(c[0] == "tags" for c in changes),
+        }
+        if not changes:
+            return {"ok": True, "diff": summary, "pages": []}
+        _, pages = self._apply_edit(changes, forward=True)
+        self._record_edit(changes)
+        return {"ok": True, "diff": summary, "pages": sorted(pages)}
 
     # --- preview / export ---
     def _pdf_path(self) -> Path:
@@ -1053,9 +3749,92 @@ class Api:
         pdf_name = str(self._project.data.get("pdf") or "template.pdf")
         return (self._project.path.parent / pdf_name).resolve()
 
+    def _template_plan(self) -> TemplatePlan | None:
+        """
+        Compiled template plan for the current template.pdf (loaded from disk or compiled once).
+        Checked against the template when it is first loaded for a session; template edits here
+        and the file watcher drop it (_drop_plan), so later calls do not stat the file.
+        """
+        if not self._project:
+            return None
+        with self._plan_lock:
+            if self._plan is not None:
+                return self._plan
+        pdf = self._pdf_path()
+        with self._plan_lock:
+            plan = self._plan
+            if plan is not None:
+                return plan
+            path = self._project.path.parent / "template.plan"
+            plan = TemplatePlan.open(path) if path.exists() else None
+            if plan is not None and not plan.matches(pdf):
+                # touched but possibly identical (copy/sync): content hash decides
+                same = plan.sha1 == _file_sha1(pdf)
+                plan.close()
+                plan = None
+                if same:
+                    try:
+                        old = TemplatePlan.open(path)
+                        if old is not None:
+                            geom = [tuple(old._geom[i * _PLAN_GEOM_COLS : (i + 1) * _PLAN_GEOM_COLS]) for i in range(old.n_pages)]
+                            meta = {k: v for k, v in old.meta.items() if k != "layout"}
+                            sha1 = old.sha1
+                            old.close()
+                            TemplatePlan.write(path, pdf, geom, meta, sha1=sha1)
+                            plan = TemplatePlan.open(path)
+                    except Exception:
+                        plan = None
+            if plan is None:
+                try:
+                    plan = TemplatePlan.compile(path, pdf, self._fitz_doc)
+                except Exception:
+                    plan = None
+            self._plan = plan
+            return plan
+
+    def _drop_plan(self) -> None:
+        with self._plan_lock:
+            if self._plan is not None:
+                self._plan.close()
+            self._plan = None
+
+    def _render_pages_poppler(self, idx: int) -> Any:
+        """
+        pdf2image fallback (no PyMuPDF): render page idx plus following pages that have no cached raster,
+        up to POPPLER_BATCH_PAGES, in one poppler run. The extra pages go straight to the base raster
+        cache, so paging forward and prefetch do not start another process.
+        """
+        from pdf2image import convert_from_path
+
+        n = int(self._page_count)
+        last = idx
+        keys = {self._base_raster_path(idx)}
+        while last + 1 < min(n, idx + POPPLER_BATCH_PAGES):
+            nxt = self._base_raster_path(last + 1)
+            if nxt is None or nxt.exists() or nxt in keys:
+                break  # cached already, or same fingerprint as a page in this run: never write one key twice
+            keys.add(nxt)
+            last += 1
+        images = convert_from_path(str(self._pdf_path()), dpi=RENDER_DPI, first_page=idx + 1, last_page=last + 1)
+        if not images:
+            raise RuntimeError("render_failed")
+        for k, im in enumerate(images[1:], start=idx + 1):
+            path = self._base_raster_path(k)
+            if path is not None and not path.exists():
+                try:
+                    rgba = im.convert("RGBA")
+                    _raster_write(path, rgba.width, rgba.height, rgba.tobytes())
+                except Exception:
+                    pass
+        return images[0].convert("RGBA")
+
     def _page_image_size(self, page_index: int) -> tuple[int, int]:
         # Compute expected image size at our DPI without rendering full image each time.
         try:
+            if self._template_plan() is not None:
+                with self._plan_lock:
+                    if self._plan is not None:
+                        return self._plan.page_px(page_index)
             if self._fitz_doc is not None:
                 pi = int(page_index)
                 if pi < 0:
@@ -1067,13 +3846,20 @@ class Api:
                 w_px = int(round(float(r.width) / 72.0 * RENDER_DPI))
                 h_px = int(round(float(r.height) / 72.0 * RENDER_DPI))
                 return max(1, w_px), max(1, h_px)
-            reader = PdfReader(str(self._pdf_path()))
-            page = reader.pages[int(page_index)]
-            w_pt = float(page.mediabox.width)
-            h_pt = float(page.mediabox.height)
-            w_px = int(round(w_pt / 72.0 * RENDER_DPI))
-            h_px = int(round(h_pt / 72.0 * RENDER_DPI))
-            return max(1, w_px), max(1, h_px)
+            sess = self._session
+            if sess.page_px is None:
+                # no plan (e.g. read-only project folder): parse the PDF once per session
+                from pypdf import PdfReader
+
+                reader = PdfReader(str(self._pdf_path()))
+                sizes = []
+                for page, g in zip(reader.pages, _reader_geometry(reader)):
+                    w_pt, h_pt = g[4], g[5]
+                    if int(page.rotation or 0) % 180:
+                        w_pt, h_pt = h_pt, w_pt
+                    sizes.append((max(1, int(round(w_pt / 72.0 * RENDER_DPI))), max(1, int(round(h_pt / 72.0 * RENDER_DPI)))))
+                sess.page_px = sizes
+            return sess.page_px[min(max(0, int(page_index)), len(sess.page_px) - 1)]
         except Exception:
             return 600, 800
 
@@ -1081,172 +3867,1152 @@ class Api:
         if not self._project and not self._ensure_project_loaded():
             return {"ok": False, "error": "no_project"}
         q = str(tag or "").strip()
-        placements = dict(self._project.data.get("placements") or {})
+        placements = self._placements()
         page_index = 0
         # Accept fid (new) or tag (legacy).
-        if q in placements and isinstance(placements.get(q), dict):
-            page_index = int(placements[q].get("page") or 0)
+        if q in placements:
+            page_index = placements[q].page
         else:
             for _, pl in placements.items():
-                if isinstance(pl, dict) and str(pl.get("tag") or "").strip() == q:
-                    page_index = int(pl.get("page") or 0)
+                if pl.tag == q:
+                    page_index = pl.page
                     break
         # Route to page renderer so cache/prefetch & PyMuPDF path applies.
         return self.get_preview_png_base64_page(page_index)
 
-    def _export_filled_pdf(self, out_pdf: Path) -> None:
-        """Render current project values onto template.pdf and write to out_pdf."""
+    def _export_filled_pdf(
+        self,
+        out_pdf: Path | Any,
+        values: dict[str, Any] | None = None,
+        placements: dict[str, Any] | None = None,
+        pdf_in: Path | None = None,
+        progress: Any = None,
+        cancel: threading.Event | None = None,
+        layout: ExportLayout | None = None,
+        font: ExportFont | None | bool = True,
+    ) -> None:
+        """
+        Render current project values (or the given snapshot) onto template.pdf and write to out_pdf.
+        progress(page, pages) is called after each page; setting cancel aborts with ExportCancelled.
+        Pass a prebuilt layout (see _export_layout) to skip the per-placement geometry work, e.g. in batches.
+        Text is set in the configured export font, embedded as one subset for the whole document
+        (font=True resolves it from the values; pass one shared ExportFont for a batch, or False for
+        the non-embedded Helvetica / HeiseiKakuGo-W5 pair).
+        """
         if not self._project and not self._ensure_project_loaded():
             raise RuntimeError("no_project")
         assert self._project is not None
+        from pypdf import PdfReader, PdfWriter
+        from reportlab.lib.colors import HexColor
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfgen import canvas
 
-        pdf_in = self._pdf_path()
+        pdf_in = self._pdf_path() if pdf_in is None else Path(pdf_in)
         reader = PdfReader(str(pdf_in))
-        placements = dict(self._project.data.get("placements") or {})
-        values = dict(self._project.data.get("values") or {})
-
-        # Ensure Japanese-capable font for PDF export.
-        try:
-            from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+        values = dict(self._project.data.get("values") or {}) if values is None else dict(values)
+        jp_font, ascents = _export_fonts()
+        if layout is None:
+            layout = self._export_layout(reader, placements, use_plan=(pdf_in == self._pdf_path()))
+        if font is True:
+            font = _embedded_export_font(_export_chars(values.get(t) for t in set(layout.tag)))
+        emb = font or None
 
-            pdfmetrics.registerFont(UnicodeCIDFont("HeiseiKakuGo-W5"))
-            jp_font = "HeiseiKakuGo-W5"
-        except Exception:
-            jp_font = "Helvetica"
+        colors: dict[str, Any] = {}
 
-        import re
+        def _color(s: str) -> Any:
+            col = colors.get(s)
+            if col is None:
+                try:
+                    col = HexColor(s)
+                except Exception:
+                    col = HexColor("#0f172a")
+                colors[s] = col
+            return col
 
-        def _needs_jp(s: str) -> bool:
-            return bool(re.search(r"[\u3040-\u30ff\u3400-\u9fff\u3000-\u303f\uff00-\uffef]", s or ""))
+        import io
 
+        # All overlays go on one multi-page canvas, so an embedded font is written once per document.
         writer = PdfWriter()
-        for pi, page in enumerate(reader.pages):
-            # Use CropBox like preview, and match preview pixel rounding.
-            media = page.mediabox
-            crop = getattr(page, "cropbox", None) or media
-            w_pt = float(media.width)
-            h_pt = float(media.height)
-            llx = float(getattr(crop, "lower_left", (0, 0))[0])
-            lly = float(getattr(crop, "lower_left", (0, 0))[1])
-            crop_w_pt = float(crop.width)
-            crop_h_pt = float(crop.height)
-            crop_w_px = max(1, int(round(crop_w_pt / 72.0 * RENDER_DPI)))
-            crop_h_px = max(1, int(round(crop_h_pt / 72.0 * RENDER_DPI)))
-
-            import io
-
-            packet = io.BytesIO()
-            c = canvas.Canvas(packet, pagesize=(w_pt, h_pt))
-            # Ensure overlay has at least one page.
-            try:
-                c.setFont("Helvetica", 1)
-                c.setFillColor(HexColor("#ffffff"))
-                c.drawString(-10000, -10000, " ")
-            except Exception:
-                pass
-
-            for _, p in placements.items():
-                if not isinstance(p, dict):
-                    continue
-                if int(p.get("page") or 0) != pi:
-                    continue
-                tag = str(p.get("tag") or "").strip()
-                if not tag:
-                    continue
-                text = str(values.get(tag) or "").replace("<br>", "\n")
-                if not text.strip():
-                    continue
-
-                x_px = float(p.get("x") or 0)
-                y_px = float(p.get("y") or 0)
-                fs_px = float(p.get("font_size") or 14)
-                color = str(p.get("color") or "#0f172a")
-                line_h = float(p.get("line_height") or 1.2)
-                letter_s_px = float(p.get("letter_spacing") or 0)
-
-                x_pt = llx + (x_px / float(crop_w_px)) * crop_w_pt
-                y_top_pt = lly + crop_h_pt - ((y_px / float(crop_h_px)) * crop_h_pt)
-
-                font_name = jp_font if _needs_jp(text) else "Helvetica"
-                fs_pt = float(fs_px) * 72.0 / RENDER_DPI
+        n_pages = len(reader.pages)
+        overlay_index: dict[int, int] = {}
+        packet = io.BytesIO()
+        c = canvas.Canvas(packet)
+        for pi in range(n_pages):
+            if cancel is not None and cancel.is_set():
+                raise ExportCancelled()
+            items = []
+            for i in layout.by_page.get(pi, ()):
+                text = str(values.get(layout.tag[i]) or "").replace("<br>", "\n")
+                if text.strip():
+                    items.append((i, text))
+            if not items:
+                continue  # nothing to draw: the template page is kept as-is (no overlay merge)
+            c.setPageSize(layout.pages[pi])
+            for i, text in items:
+                fs_pt = layout.fs_pt[i]
+                if emb is not None and set(text) - {"\n", "\r"} <= emb.covers:
+                    font_name = emb.name
+                    # layout baselines are per built-in font; shift by the ascent difference
+                    y_base0 = layout.y_base["Helvetica"][i] + (ascents["Helvetica"] - emb.ascent) * fs_pt
+                else:
+                    font_name = jp_font if _needs_jp(text) else "Helvetica"
+                    y_base0 = layout.y_base[font_name][i]
+                x_pt = layout.x_pt[i]
+                line_pt = layout.line_pt[i]
+                letter_s_pt = layout.letter_pt[i]
                 c.setFont(font_name, fs_pt)
-                try:
-                    c.setFillColor(HexColor(color))
-                except Exception:
-                    c.setFillColor(HexColor("#0f172a"))
-
-                # baseline adjust
-                try:
-                    ascent = float(pdfmetrics.getAscent(font_name) or 0) / 1000.0 * fs_pt
-                except Exception:
-                    ascent = fs_pt * 0.8
-                y_base0 = y_top_pt - ascent - (0.08 * fs_pt)
-                letter_s_pt = float(letter_s_px) * 72.0 / RENDER_DPI
+                c.setFillColor(_color(layout.color[i]))
 
-                def _draw_line_with_spacing(x0: float, y0: float, s: str) -> None:
+                for line_idx, line in enumerate(text.splitlines() or [""]):
+                    y_line = y_base0 - line_pt * line_idx
                     if not letter_s_pt:
-                        c.drawString(x0, y0, s)
-                        return
-                    cx = x0
-                    for ch in s:
-                        c.drawString(cx, y0, ch)
+                        c.drawString(x_pt, y_line, line)
+                        continue
+                    cx = x_pt
+                    for ch in line:
+                        c.drawString(cx, y_line, ch)
                         try:
                             w = pdfmetrics.stringWidth(ch, font_name, fs_pt)
                         except Exception:
                             w = fs_pt * 0.62
                         cx += float(w) + float(letter_s_pt)
+            overlay_index[pi] = len(overlay_index)
+            c.showPage()
 
-                for line_idx, line in enumerate(text.splitlines() or [""]):
-                    y_line = y_base0 - (fs_pt * line_h) * line_idx
-                    _draw_line_with_spacing(x_pt, y_line, line)
-
+        overlays = None
+        if overlay_index:
             c.save()
             packet.seek(0)
-            overlay = PdfReader(packet).pages[0]
-            page.merge_page(overlay)
+            overlays = PdfReader(packet).pages
+        for pi, page in enumerate(reader.pages):
+            if cancel is not None and cancel.is_set():
+                raise ExportCancelled()
+            k = overlay_index.get(pi)
+            if k is not None and overlays is not None:
+                page.merge_page(overlays[k])
             writer.add_page(page)
+            if progress is not None:
+                progress(pi + 1, n_pages)
 
+        if hasattr(out_pdf, "write"):  # stream (e.g. straight into a zip member)
+            writer.write(out_pdf)
+            return
+        # never write into an existing file: it may be hardlinked to an export_cache entry (or latest)
         out_pdf.parent.mkdir(parents=True, exist_ok=True)
-        with out_pdf.open("wb") as f:
-            writer.write(f)
+        tmp = out_pdf.with_name(out_pdf.name + f".{uuid.uuid4().hex[:6]}.tmp")
+        try:
+            with tmp.open("wb") as f:
+                writer.write(f)
+            os.replace(tmp, out_pdf)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def _export_layout(self, reader: Any = None, placements: dict[str, Any] | None = None, use_plan: bool = True) -> ExportLayout:
+        """Export layout for the current template and placements; reused from / stored in the template plan."""
+        if placements is None:
+            placements = self._placements()
+        if use_plan and self._template_plan() is not None:
+            digest = _placements_digest(placements)
+            with self._plan_lock:
+                plan = self._plan
+            if plan is None:
+                return self._export_layout(reader, placements, use_plan=False)
+            with self._plan_lock:
+                plan = self._plan or plan
+                layout = plan.layout(digest)
+                if layout is None:
+                    layout = _build_export_layout(plan.geometry(), placements, dict(plan.meta.get("ascents") or {}))
+                    try:
+                        self._plan = plan.with_layout(self._pdf_path(), digest, layout)
+                    except Exception:
+                        self._plan = None
+            return layout
+        if reader is None:
+            from pypdf import PdfReader
+
+            reader = PdfReader(str(self._pdf_path()))
+        if placements is None:
+            placements = self._placements()
+        _, ascents = _export_fonts()
+        return _build_export_layout(_reader_geometry(reader), placements, ascents)
 
     def finish(self) -> dict[str, Any]:
         if not self._project and not self._ensure_project_loaded():
             return {"ok": False, "error": "no_project"}
         try:
-            out_dir = self._project.path.parent / "exports"
-            out_dir.mkdir(parents=True, exist_ok=True)
-            stamp = time.strftime("%Y%m%d-%H%M%S")
-            proj = _safe_name(str(self._project.data.get("project") or "project"))
-            who = _safe_name(str(self._working_worker_id or "worker"))
-            base = f"{proj}-{stamp}-{who}"
-            out_pdf = out_dir / f"{base}.pdf"
-            self._export_filled_pdf(out_pdf)
+            res = self._write_export_outputs("finish", self._export_snapshot())
+            return {"ok": True, "dir": res["dir"], "zip": res["zip"], "pdf": res["pdf"], "filled_pdf": res["filled_pdf"], "memo": res["memo"], "activity": res.get("activity")}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    # --- background export jobs ---
+    def _emit(self, event: dict[str, Any]) -> None:
+        """Push an event to the UI (window.__inputstudioEvent). No-op when headless."""
+        w = self._window
+        if w is None:
+            return
+        try:
+            w.evaluate_js(f"window.__inputstudioEvent && window.__inputstudioEvent({json.dumps(event, ensure_ascii=False)})")
+        except Exception:
+            pass
 
-            latest = (self._project.path.parent / "template_filled_latest.pdf").resolve()
+    def _export_snapshot(self) -> dict[str, Any]:
+        """Copy of everything an export needs, so a job is unaffected by later edits or project switches."""
+        d = self._project.data
+        return {
+            "project_dir": self._project.path.parent,
+            "pdf": self._pdf_path(),
+            "project": _safe_name(str(d.get("project") or "project")),
+            "who": _safe_name(str(self._working_worker_id or "worker")),
+            "placements": self._placements().copy(),
+            "values": dict(d.get("values") or {}),
+            "optimize": _optimize_settings(d),
+            "work": self._work_until(time.time()),
+        }
+
+    def _write_export_outputs(self, kind: str, snap: dict[str, Any], progress: Any = None, cancel: threading.Event | None = None) -> dict[str, Any]:
+        """
+        Produce the files for an export kind:
+        autosave -> exports/autosave-*.pdf, finish -> exports/*.pdf + *.zip.
+        Both refresh template_filled_latest.pdf.
+        """
+        proj_dir = Path(snap["project_dir"])
+        out_dir = (proj_dir / "exports").resolve()
+        out_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        base = f"{snap['project']}-{stamp}-{snap['who']}"
+        if kind == "autosave":
+            base = f"autosave-{base}"
+        out_pdf = out_dir / f"{base}.pdf"
+        memo = self._export_memoized(out_pdf, snap, progress, cancel)
+        latest = (proj_dir / "template_filled_latest.pdf").resolve()
+        try:
+            _clone_file(out_pdf, latest)  # reflink/hardlink: no second pass over the bytes
+        except Exception:
             try:
-                shutil.copy2(out_pdf, latest)
+                self._export_filled_pdf(latest, values=snap["values"], placements=snap["placements"], pdf_in=snap["pdf"])
             except Exception:
-                try:
-                    self._export_filled_pdf(latest)
-                except Exception:
-                    pass
+                pass
+        res: dict[str, Any] = {
+            "dir": str(out_dir),
+            "exports_dir": str(out_dir),
+            "pdf": str(out_pdf.resolve()),
+            "filled_pdf": str(latest if latest else out_pdf.resolve()),
+            "memo": memo,
+        }
+        if kind == "finish":
+            settings = _read_json(ADMIN_SETTINGS_PATH, {})
+            compress = bool(settings.get("zip_compress")) if isinstance(settings, dict) else False
+            with _ZipPackager(out_dir / f"{base}.zip", compress=compress) as z:
+                z.add_file(out_pdf)
+            res["zip"] = z.close()["zip"]
+            work = snap.get("work")
+            if work is not None:
+                self._log_work("finish", work, started=work["t0"], seconds=work["seconds"], ts=work["end"])
+                res["activity"] = {"session": work["id"], "seconds": round(work["seconds"], 1)}
+                if self._work is not None and self._work["id"] == work["id"]:
+                    self._work = None
+        return res
 
-            out_zip = out_dir / f"{base}.zip"
-            with zipfile.ZipFile(out_zip, "w", compression=zipfile.ZIP_DEFLATED) as z:
-                z.write(out_pdf, arcname=out_pdf.name)
-            return {
-                "ok": True,
-                "dir": str(out_dir.resolve()),
-                "zip": str(out_zip.resolve()),
-                "pdf": str(out_pdf.resolve()),
-                "filled_pdf": str(latest if latest else out_pdf.resolve()),
+    def _export_digest(self, snap: dict[str, Any]) -> str:
+        """Identity of an export's output: template content, placements, values of placed tags, export settings."""
+        placements = snap["placements"]
+        used = sorted({pl.tag for pl in placements.values()})
+        values = snap["values"]
+        h = hashlib.sha1(f"v{EXPORT_FORMAT}|{RENDER_DPI}|".encode("ascii"))
+        h.update(_file_sha1_cached(Path(snap["pdf"])))
+        h.update(_placements_digest(placements).encode("ascii"))
+        h.update(json.dumps({t: values.get(t) for t in used}, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        font = _export_font_path()
+        if font is not None:
+            st = font.stat()
+            h.update(f"|{font}|{st.st_size}|{st.st_mtime_ns}".encode("utf-8"))
+        if snap.get("optimize"):
+            h.update(json.dumps(snap["optimize"], sort_keys=True).encode("ascii"))
+        return h.hexdigest()
+
+    def _optimized_template(self, pdf: Path, settings: dict[str, Any]) -> tuple[Path, dict[str, Any]]:
+        """
+        Template with _optimize_pdf applied, cached per (template content, settings). Exports built
+        on it inherit the smaller images, so the work is done once for every record and autosave.
+        """
+        key = hashlib.sha1(_file_sha1_cached(pdf) + json.dumps(settings, sort_keys=True).encode("ascii")).hexdigest()
+        out = EXPORT_CACHE_DIR / "templates" / f"{key}.pdf"
+        meta = out.with_suffix(".json")
+        if out.exists():
+            os.utime(out)
+            return out, {**_read_json(meta, {}), "cached": True}
+        out.parent.mkdir(parents=True, exist_ok=True)
+        stats = _optimize_pdf(pdf, out, settings["dpi"], settings["jpeg_quality"])
+        _write_json(meta, stats)
+        _prune_export_cache()
+        return out, {**stats, "cached": False}
+
+    def _export_memoized(self, out_pdf: Path, snap: dict[str, Any], progress: Any = None, cancel: threading.Event | None = None) -> dict[str, Any]:
+        """
+        Write the filled PDF for snap to out_pdf, or hardlink an identical earlier export from
+        EXPORT_CACHE_DIR (keyed by _export_digest). Returns hit/digest and the running hit counters.
+        """
+        digest = self._export_digest(snap)
+        cached = EXPORT_CACHE_DIR / f"{digest}.pdf"
+        hit = False
+        if cached.exists():
+            try:
+                _link_or_copy(cached, out_pdf)
+                os.utime(cached)
+                hit = True
+            except OSError:
+                hit = False
+        optimize = None
+        if hit:
+            if progress is not None:
+                progress(1, 1)
+        else:
+            pdf_in = Path(snap["pdf"])
+            if snap.get("optimize"):
+                pdf_in, optimize = self._optimized_template(pdf_in, snap["optimize"])
+            self._export_filled_pdf(
+                out_pdf,
+                values=snap["values"],
+                placements=snap["placements"],
+                pdf_in=pdf_in,
+                progress=progress,
+                cancel=cancel,
+            )
+            try:
+                _link_or_copy(out_pdf, cached)
+                _prune_export_cache()
+            except OSError:
+                pass
+        with self._export_cv:
+            self._export_memo["hits" if hit else "misses"] += 1
+            return {"hit": hit, "digest": digest, **self._export_memo, "optimize": optimize}
+
+    def start_export(self, kind: str = "autosave") -> dict[str, Any]:
+        """
+        Queue a background export of the current state and return its job id.
+        Page progress and completion are pushed to the UI as export_progress / export_done events.
+        An autosave that is still queued is updated to the latest state instead of queueing another.
+        """
+        if not self._project and not self._ensure_project_loaded():
+            return {"ok": False, "error": "no_project"}
+        if kind not in ("autosave", "finish"):
+            return {"ok": False, "error": "invalid_kind"}
+        snap = self._export_snapshot()
+        with self._export_cv:
+            if kind == "autosave":
+                for job in self._export_jobs.values():
+                    if job["kind"] == "autosave" and job["status"] == "queued" and job["snap"]["project_dir"] == snap["project_dir"]:
+                        job["snap"] = snap
+                        job["coalesced"] += 1
+                        return {"ok": True, "job_id": job["id"], "coalesced": True}
+            jid = uuid.uuid4().hex[:12]
+            self._export_jobs[jid] = {
+                "id": jid,
+                "kind": kind,
+                "status": "queued",
+                "snap": snap,
+                "cancel": threading.Event(),
+                "page": 0,
+                "pages": 0,
+                "coalesced": 0,
+                "result": None,
             }
+            done = [k for k, j in self._export_jobs.items() if j["status"] not in ("queued", "running")]
+            for k in done[: max(0, len(self._export_jobs) - 50)]:
+                self._export_jobs.pop(k, None)
+            if self._export_thread is None or not self._export_thread.is_alive():
+                self._export_thread = threading.Thread(target=self._export_loop, daemon=True)
+                self._export_thread.start()
+            self._export_cv.notify_all()
+        return {"ok": True, "job_id": jid, "coalesced": False}
+
+    def _export_loop(self) -> None:
+        while True:
+            with self._export_cv:
+                job = None
+                while job is None:
+                    job = next((j for j in self._export_jobs.values() if j["status"] == "queued"), None)
+                    if job is None:
+                        self._export_cv.wait()
+                job["status"] = "running"
+                snap = job["snap"]
+
+            last_emit = [0.0]
+
+            def progress(page: int, pages: int, job: dict[str, Any] = job) -> None:
+                job["page"], job["pages"] = page, pages
+                now = time.perf_counter()
+                if page == pages or now - last_emit[0] >= 0.1:
+                    last_emit[0] = now
+                    self._emit({"type": "export_progress", "job_id": job["id"], "kind": job["kind"], "page": page, "pages": pages})
+
+            try:
+                res = self._write_export_outputs(job["kind"], snap, progress, job["cancel"])
+                job["result"] = {"ok": True, **res}
+                job["status"] = "done"
+            except ExportCancelled:
+                job["result"] = {"ok": False, "error": "cancelled"}
+                job["status"] = "cancelled"
+            except Exception as e:
+                job["result"] = {"ok": False, "error": str(e)}
+                job["status"] = "error"
+            self._emit({"type": "export_done", "job_id": job["id"], "kind": job["kind"], "status": job["status"], "result": job["result"]})
+
+    def cancel_export(self, job_id: str) -> dict[str, Any]:
+        with self._export_cv:
+            job = self._export_jobs.get(str(job_id or ""))
+            if job is None:
+                return {"ok": False, "error": "not_found"}
+            job["cancel"].set()
+            if job["status"] == "queued":
+                job["status"] = "cancelled"
+                job["result"] = {"ok": False, "error": "cancelled"}
+        return {"ok": True, "status": job["status"]}
+
+    def get_export_job(self, job_id: str) -> dict[str, Any]:
+        job = self._export_jobs.get(str(job_id or ""))
+        if job is None:
+            return {"ok": False, "error": "not_found"}
+        keys = ("id", "kind", "status", "page", "pages", "coalesced", "result")
+        return {"ok": True, **{k: job[k] for k in keys}}
+
+    # --- headless (CLI / scripts) ---
+    def set_values(self, values: dict[str, Any], save: bool = True) -> dict[str, Any]:
+        """Set several tag values at once (single project.json write)."""
+        if not self._project and not self._ensure_project_loaded():
+            return {"ok": False, "error": "no_project"}
+        if not isinstance(values, dict):
+            return {"ok": False, "error": "invalid_args"}
+        cur = dict(self._project.data.get("values") or {})
+        before = dict(cur)
+        changed: set[str] = set()
+        for k, v in values.items():
+            t = str(k or "").strip()
+            if not t:
+                continue
+            sv = str(v if v is not None else "")
+            if cur.get(t) != sv:
+                cur[t] = sv
+                changed.add(t)
+        self._project.data["values"] = cur
+        self._record_edit([("value", t, before.get(t), cur[t]) for t in sorted(changed)])
+        if save:
+            _write_json(self._project.path, self._project.data)
+        pages = self._placements().pages_for_tags(changed)
+        if pages:
+            self._invalidate_pages(pages)
+        return {"ok": True, "changed": sorted(changed)}
+
+    def render_page(self, page_index: int, out_png: str | None = None) -> dict[str, Any]:
+        """Render one page (with overlays) to a PNG file. Returns the file path."""
+        if not self._project and not self._ensure_project_loaded():
+            return {"ok": False, "error": "no_project"}
+        try:
+            idx = min(max(0, int(page_index or 0)), self._page_count - 1)
+            with self._render_lock:
+                png, w, h = self._render_page_png_url(idx)
+            src = self._cache_png_path(idx)
+            if out_png:
+                dst = Path(out_png).resolve()
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                if png.startswith("data:"):
+                    dst.write_bytes(base64.b64decode(png.split(",", 1)[1]))
+                else:
+                    shutil.copyfile(src, dst)
+                src = dst
+            return {"ok": True, "page_index": idx, "path": str(src), "width": w, "height": h}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    def export_pdf(self, out_pdf: str, values: dict[str, Any] | None = None) -> dict[str, Any]:
+        """Export the filled PDF to out_pdf. values (tag -> text) override project values without saving them."""
+        if not self._project and not self._ensure_project_loaded():
+            return {"ok": False, "error": "no_project"}
+        try:
+            merged = None
+            if values is not None:
+                merged = dict(self._project.data.get("values") or {})
+                merged.update({str(k): str(v if v is not None else "") for k, v in values.items()})
+            out = Path(out_pdf).resolve()
+            self._export_filled_pdf(out, values=merged)
+            return {"ok": True, "pdf": str(out)}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    def batch_export(
+        self,
+        records: list[dict[str, Any]],
+        out_dir: str,
+        name_field: str | None = None,
+        zip_name: str | None = None,
+        compress: bool = False,
+    ) -> dict[str, Any]:
+        """
+        Export one filled PDF per record (tag -> text). Project values act as defaults.
+        Output files are named by name_field when present, else by record number.
+        With zip_name the PDFs are streamed straight into out_dir/zip_name instead of loose files
+        (STORED, or deflated with compress=True); only one record's PDF is held in memory at a time.
+        """
+        if not self._project and not self._ensure_project_loaded():
+            return {"ok": False, "error": "no_project"}
+        if not isinstance(records, list):
+            return {"ok": False, "error": "invalid_args"}
+        d = Path(out_dir).resolve()
+        d.mkdir(parents=True, exist_ok=True)
+        proj = _safe_name(str(self._project.data.get("project") or "project"))
+        outputs: list[str] = []
+        errors: list[dict[str, Any]] = []
+        t0 = time.perf_counter()
+        base_values = dict(self._project.data.get("values") or {})
+        try:
+            layout = self._export_layout()
         except Exception as e:
             return {"ok": False, "error": str(e)}
+        # one export font subset for every glyph in the batch, shared by all records
+        used = set(layout.tag)
+        font = _embedded_export_font(
+            _export_chars([v for t, v in base_values.items() if t in used] + [v for rec in records if isinstance(rec, dict) for t, v in rec.items() if t in used])
+        )
+        pdf_in = None
+        opt_stats = None
+        opt = _optimize_settings(self._project.data)
+        if opt:
+            pdf_in, opt_stats = self._optimized_template(self._pdf_path(), opt)
+        pack = _ZipPackager(d / _safe_name(zip_name), compress=compress) if zip_name else None
+        try:
+            for i, rec in enumerate(records):
+                if not isinstance(rec, dict):
+                    errors.append({"index": i, "error": "invalid_record"})
+                    continue
+                stem = _safe_name(str(rec.get(name_field) or "")) if name_field else ""
+                name = f"{stem or f'{proj}-{i + 1:05d}'}.pdf"
+                try:
+                    vals = dict(base_values)
+                    vals.update({str(k): str(v if v is not None else "") for k, v in rec.items()})
+                    if pack is None:
+                        self._export_filled_pdf(d / name, values=vals, layout=layout, font=font or False, pdf_in=pdf_in)
+                        outputs.append(str(d / name))
+                    else:
+                        import io
+
+                        buf = io.BytesIO()
+                        self._export_filled_pdf(buf, values=vals, layout=layout, font=font or False, pdf_in=pdf_in)
+                        pack.add(name, buf.getvalue())
+                        outputs.append(name)
+                except Exception as e:
+                    errors.append({"index": i, "error": str(e)})
+        finally:
+            zip_info = pack.close() if pack is not None else None
+        res: dict[str, Any] = {
+            "ok": not errors,
+            "dir": str(d),
+            "pdfs": outputs,
+            "errors": errors,
+            "elapsed_ms": _elapsed_ms(t0),
+        }
+        if zip_info is not None:
+            res["zip"] = zip_info
+        if opt_stats is not None:
+            res["optimize"] = {**opt_stats, "records": len(outputs), "saved_total": opt_stats["saved"] * len(outputs)}
+        return res
+
+
+class _AsyncCore:
+    """
+    asyncio event loop on its own thread. Calls scheduled here run on executors by lane
+    ("render": one at a time, matching the render lock; "io": saves/exports) and report
+    through on_result(call_id, result), so the caller never waits.
+    """
+
+    LANES = {"render": 1, "io": 2}
+
+    def __init__(self, on_result: Any) -> None:
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._asyncio = asyncio
+        self._on_result = on_result
+        self._loop = asyncio.new_event_loop()
+        self._pools = {lane: ThreadPoolExecutor(max_workers=n, thread_name_prefix=f"async-{lane}") for lane, n in self.LANES.items()}
+        self._thread = threading.Thread(target=self._loop.run_forever, name="async-core", daemon=True)
+        self._thread.start()
+
+    def submit(self, call_id: str, lane: str, fn: Any, args: list[Any]) -> None:
+        self._asyncio.run_coroutine_threadsafe(self._run(call_id, lane, fn, args), self._loop)
+
+    async def _run(self, call_id: str, lane: str, fn: Any, args: list[Any]) -> None:
+        try:
+            res = await self._loop.run_in_executor(self._pools[lane], lambda: fn(*args))
+        except Exception as e:
+            res = {"ok": False, "error": str(e)}
+        self._on_result(call_id, res)
+
+    def close(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        for pool in self._pools.values():
+            pool.shutdown(wait=False)
+
+
+class Api(Engine):
+    """pywebview js_api: Engine plus native file dialogs."""
+
+    # Bridge methods that may run on the async core (call_async), by executor lane: renders and saves only.
+    # Page inserts/reorders rewrite the template and remap placements and the edit log: they stay
+    # plain bridge calls that the UI awaits, never queued to run alongside edits of the same data.
+    ASYNC_CALLS = {
+        "get_preview_png_base64_page": "render",
+        "get_preview_png_base64": "render",
+        "get_page_overlay": "render",
+        "save_current_project": "io",
+        "save_project_as": "io",
+        "finish": "io",
+    }
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._async: _AsyncCore | None = None
+        settings = _read_json(ADMIN_SETTINGS_PATH, {})
+        url = os.environ.get("INPUTSTUDIO_SERVICE") or (settings.get("render_service_url") if isinstance(settings, dict) else None)
+        self._service_url = str(url or "").strip() or None
+
+    # --- non-blocking bridge ---
+    def call_async(self, method: str, args: list[Any] | None = None, call_id: str | None = None) -> dict[str, Any]:
+        """
+        Start a slow bridge call without waiting for it: returns {"call_id"} at once and the result
+        arrives later as a call_result event (ui/app.js callAsync). Cheap edits are not queued behind it.
+        """
+        lane = self.ASYNC_CALLS.get(str(method or ""))
+        if lane is None:
+            return {"ok": False, "error": "not_async"}
+        if not isinstance(args, list):
+            args = [] if args is None else [args]
+        if self._async is None:
+            self._async = _AsyncCore(self._deliver_call_result)
+        cid = str(call_id or uuid.uuid4().hex[:12])
+        self._async.submit(cid, lane, getattr(self, str(method)), list(args))
+        return {"ok": True, "call_id": cid}
+
+    def _deliver_call_result(self, call_id: str, result: Any) -> None:
+        self._emit({"type": "call_result", "call_id": call_id, "result": result})
+
+    def close(self) -> None:
+        if self._async is not None:
+            self._async.close()
+            self._async = None
+        super().close()
+
+    # --- dialogs ---
+    def pick_project(self) -> dict[str, Any]:
+        p = _pick_file("案件（プロジェクト）を開く", [("Project JSON", "*.json"), ("All", "*.*")], self._last_dir)
+        if not p:
+            return {"ok": False}
+        self._last_dir = str(Path(p).resolve().parent)
+        return {"ok": True, "path": str(Path(p).resolve())}
+
+    def pick_pdf(self) -> dict[str, Any]:
+        p = _pick_file("PDFを選択", [("PDF", "*.pdf"), ("All", "*.*")], self._last_dir)
+        if not p:
+            return {"ok": False}
+        self._last_dir = str(Path(p).resolve().parent)
+        return {"ok": True, "path": str(Path(p).resolve())}
+
+
+def _service_request(base_url: str, route: str, payload: dict[str, Any] | None = None, timeout: float = 30.0) -> dict[str, Any] | None:
+    """POST (or GET when payload is None) JSON to the local render service. None if unreachable."""
+    import urllib.request
+
+    try:
+        url = base_url.rstrip("/") + route
+        body = None if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            out = json.loads(resp.read().decode("utf-8"))
+        return out if isinstance(out, dict) else None
+    except Exception:
+        return None
+
+
+class RenderService:
+    """
+    Long-lived local render/export service (python -m app serve).
+    Keeps one warm Engine per project (open PyMuPDF document + disk page cache) and
+    runs render/export/batch jobs from a queue, so several desktop clients or batch
+    scripts on the same machine share hot caches instead of each rendering cold.
+    """
+
+    def __init__(self, workers: int = 2, max_engines: int = 8) -> None:
+        import queue
+
+        self._engines: "OrderedDict[str, tuple[Engine, threading.Lock]]" = OrderedDict()
+        self._max_engines = max(1, int(max_engines))
+        self._pool_lock = threading.Lock()
+        # project -> (project.json, template.pdf) stamps its engine is up to date with
+        self._stamps: dict[str, tuple[tuple[int, int] | None, tuple[int, int] | None]] = {}
+        self._jobs: "OrderedDict[str, dict[str, Any]]" = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._max_jobs = 500
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        for _ in range(max(1, int(workers))):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def _engine_for(self, key: str) -> tuple[Engine, threading.Lock]:
+        """Warm engine for a project (resolved project.json path), loaded on first use."""
+        evicted = []
+        with self._pool_lock:
+            hit = self._engines.pop(key, None)
+            if hit is None:
+                eng, lock = Engine(), threading.Lock()
+                lock.acquire()  # published unloaded: other jobs wait on it until load_project below
+            else:
+                eng, lock = hit
+            self._engines[key] = (eng, lock)
+            while len(self._engines) > self._max_engines:
+                old_key, (old, old_lock) = self._engines.popitem(last=False)
+                self._stamps.pop(old_key, None)
+                evicted.append((old, old_lock))
+        r: dict[str, Any] = {"ok": True}
+        if hit is None:
+            try:
+                js = _file_stamp(Path(key))  # taken first: a save during the load is merged by the next _refresh
+                r = eng.load_project(key, preview=False)
+                if r.get("ok"):
+                    self._stamps[key] = (js, _file_stamp(eng._pdf_path()))
+            finally:
+                lock.release()
+        # Close only after releasing our own lock (two loads evicting each other would deadlock),
+        # and only after the evicted engine's in-flight job: never close a document mid-render.
+        for old, old_lock in evicted:
+            with old_lock:
+                old.close()
+        if not r.get("ok"):
+            raise RuntimeError(str(r.get("error") or "load_failed"))
+        return eng, lock
+
+    def _refresh(self, key: str, eng: Engine) -> None:
+        """
+        Bring a warm engine up to date with the files on disk (caller holds its lock). Clients rewrite
+        project.json on every edit; that is merged in place (placements/values, touched pages
+        invalidated) rather than reloading. template.pdf is reopened only when its own stamp changed,
+        and then only pages whose content hash changed are re-rendered.
+        """
+        seen_json, seen_pdf = self._stamps.get(key, (None, None))
+        js = _file_stamp(Path(key))
+        if js != seen_json:
+            eng._on_files_changed({Path(key)})
+        pdf = eng._pdf_path()
+        ps = _file_stamp(pdf)
+        if ps != seen_pdf:
+            eng._on_files_changed({pdf})
+        self._stamps[key] = (js, ps)
+
+    def _run(self, op: str, params: dict[str, Any]) -> dict[str, Any]:
+        key = str(Path(str(params.get("project") or "")).resolve())
+        if not Path(key).is_file():
+            raise FileNotFoundError(key)
+        while True:
+            eng, lock = self._engine_for(key)
+            with lock:
+                with self._pool_lock:
+                    pooled = any(e is eng for e, _ in self._engines.values())
+                if not pooled:
+                    continue  # evicted (closed) while this job waited for it; eviction needs this lock to close
+                self._refresh(key, eng)
+                if op == "render":
+                    # render_page checks the disk cache, which _refresh invalidates for edited pages.
+                    return eng.render_page(int(params.get("page") or 0), params.get("out"))
+                if op == "export":
+                    return eng.export_pdf(str(params.get("out") or ""), params.get("values"))
+                if op == "batch":
+                    return eng.batch_export(list(params.get("records") or []), str(params.get("out_dir") or ""), params.get("name_field"))
+            return {"ok": False, "error": "unknown_op"}
+
+    def _worker(self) -> None:
+        while True:
+            jid = self._queue.get()
+            with self._jobs_lock:
+                job = self._jobs.get(jid)
+            if job is None:
+                continue
+            job["status"] = "running"
+            job["started_at"] = _now_iso()
+            try:
+                res = self._run(job["op"], job["params"])
+                job["result"] = res
+                job["status"] = "done" if res.get("ok") else "error"
+            except Exception as e:
+                job["result"] = {"ok": False, "error": str(e)}
+                job["status"] = "error"
+            job["finished_at"] = _now_iso()
+            job["done"].set()
+
+    def submit(self, op: str, params: dict[str, Any]) -> dict[str, Any]:
+        jid = uuid.uuid4().hex[:12]
+        job = {"id": jid, "op": op, "params": params, "status": "queued", "result": None, "done": threading.Event()}
+        with self._jobs_lock:
+            self._jobs[jid] = job
+            while len(self._jobs) > self._max_jobs:
+                self._jobs.popitem(last=False)
+        self._queue.put(jid)
+        return job
+
+    def job_info(self, jid: str) -> dict[str, Any]:
+        with self._jobs_lock:
+            job = self._jobs.get(jid)
+        if job is None:
+            return {"ok": False, "error": "not_found"}
+        return {"ok": True, **{k: v for k, v in job.items() if k not in ("params", "done")}}
+
+    def handle(self, route: str, payload: dict[str, Any] | None) -> dict[str, Any]:
+        """Dispatch one request. render waits for its job by default; export/batch return a job id unless wait=true."""
+        if route == "/health":
+            with self._pool_lock:
+                projects = list(self._engines.keys())
+            return {"ok": True, "projects": projects, "queued": self._queue.qsize()}
+        if route.startswith("/jobs/"):
+            return self.job_info(route[len("/jobs/"):])
+        op = route.strip("/")
+        if op not in ("render", "export", "batch") or not isinstance(payload, dict) or not payload.get("project"):
+            return {"ok": False, "error": "invalid_request"}
+        job = self.submit(op, payload)
+        if bool(payload.get("wait", op == "render")):
+            job["done"].wait(timeout=float(payload.get("timeout") or 300))
+            return self.job_info(job["id"])
+        return {"ok": True, "id": job["id"], "status": job["status"]}
+
+    def serve(self, host: str = "127.0.0.1", port: int = SERVICE_PORT) -> None:
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        svc = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, res: dict[str, Any]) -> None:
+                body = json.dumps(res, ensure_ascii=False).encode("utf-8")
+                self.send_response(200 if res.get("ok") else 400)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                self._reply(svc.handle(self.path, None))
+
+            def do_POST(self) -> None:
+                n = int(self.headers.get("Content-Length") or 0)
+                try:
+                    payload = json.loads(self.rfile.read(n).decode("utf-8") or "{}")
+                except Exception:
+                    payload = None
+                self._reply(svc.handle(self.path, payload))
+
+            def log_message(self, format: str, *args: Any) -> None:
+                return
+
+        httpd = ThreadingHTTPServer((host, int(port)), Handler)
+        try:
+            httpd.serve_forever()
+        finally:
+            httpd.server_close()
+            with self._pool_lock:
+                for eng, _, _ in self._engines.values():
+                    eng.close()
+                self._engines.clear()
+
+
+def _read_records(path: Path) -> list[dict[str, Any]]:
+    """Records for batch fills: .csv (header row = tags), .jsonl (one object per line) or .json (list)."""
+    if path.suffix.lower() == ".csv":
+        import csv
+
+        with path.open(encoding="utf-8-sig", newline="") as f:
+            return [dict(r) for r in csv.DictReader(f)]
+    text = path.read_text(encoding="utf-8")
+    if path.suffix.lower() == ".jsonl":
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    data = json.loads(text)
+    return data if isinstance(data, list) else [data]
+
+
+def _bench_layout(n_placements: int, n_pages: int, n_records: int) -> dict[str, Any]:
+    """Synthetic benchmark of the export layout stage (no PDF I/O): build once, then per-record text lookup."""
+    geom = [(595.0, 842.0, 0.0, 0.0, 595.0, 842.0)] * max(1, n_pages)
+    n_tags = max(1, n_placements // 2)
+    placements = {
+        f"f_{i:08x}": {
+            "tag": f"t{i % n_tags}",
+            "page": i % max(1, n_pages),
+            "x": float(i % 1200),
+            "y": float((i * 7) % 1700),
+            "font_size": 10 + i % 12,
+            "color": "#0f172a",
+            "line_height": 1.2,
+            "letter_spacing": 0,
+        }
+        for i in range(n_placements)
+    }
+    # Time only the layout build: convert placements up front (export passes a PlacementStore) and
+    # warm both paths once so the NumPy import and first-call costs are not counted.
+    store = PlacementStore(placements)
+    ascents = {"Helvetica": 0.718, "HeiseiKakuGo-W5": 0.88}
+    res: dict[str, Any] = {"ok": True, "placements": n_placements, "pages": n_pages, "records": n_records}
+    for use_np in (False, True):
+        _build_export_layout(geom, store, ascents, use_numpy=use_np)
+    for label, use_np in (("python", False), ("numpy", True)):
+        t0 = time.perf_counter()
+        layout = _build_export_layout(geom, store, ascents, use_numpy=use_np)
+        res[f"build_{label}_ms"] = _elapsed_ms(t0)
+    t0 = time.perf_counter()
+    emitted = 0
+    for r in range(n_records):
+        values = {f"t{k}": ("山田" if (k + r) % 3 == 0 else f"v{r}") for k in range(n_tags)}
+        for pi in range(n_pages):
+            for i in layout.by_page.get(pi, ()):
+                text = values.get(layout.tag[i])
+                if text:
+                    font = "HeiseiKakuGo-W5" if _needs_jp(text) else "Helvetica"
+                    _ = (layout.x_pt[i], layout.y_base[font][i], layout.fs_pt[i])
+                    emitted += 1
+    res["per_record_ms"] = round(_elapsed_ms(t0) / max(1, n_records), 1)
+    res["emitted"] = emitted
+    return res
+
+
+def _bench_placements(n_placements: int, n_pages: int, n_calls: int) -> dict[str, Any]:
+    """
+    Synthetic benchmark of the placement store vs the former dict-of-dicts access pattern:
+    memory, one-time validation, and per-call cost of a set_value page lookup and a page overlay scan.
+    """
+    import tracemalloc
+
+    n_tags = max(1, n_placements // 2)
+    raw = {
+        f"f_{i:08x}": {
+            "tag": f"t{i % n_tags}",
+            "page": i % max(1, n_pages),
+            "x": float(i % 1200),
+            "y": float((i * 7) % 1700),
+            "font_size": 10 + i % 12,
+            "color": "#0f172a",
+            "line_height": 1.2,
+            "letter_spacing": 0,
+        }
+        for i in range(n_placements)
+    }
+    res: dict[str, Any] = {"ok": True, "placements": n_placements, "pages": n_pages, "calls": n_calls}
+    text = json.dumps(raw)
+    tracemalloc.start()
+    as_dicts = json.loads(text)
+    res["dict_mem_mb"] = round(tracemalloc.get_traced_memory()[0] / 1e6, 1)
+    tracemalloc.stop()
+    del as_dicts
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    store = PlacementStore(json.loads(text))
+    res["store_load_ms"] = _elapsed_ms(t0)
+    res["store_mem_mb"] = round(tracemalloc.get_traced_memory()[0] / 1e6, 1)
+    tracemalloc.stop()
+
+    tag = "t1"
+    t0 = time.perf_counter()
+    for _ in range(n_calls):
+        placements = dict(raw)  # former per-call copy
+        pages = set()
+        for _, pl in placements.items():
+            if isinstance(pl, dict) and str(pl.get("tag") or "").strip() == tag:
+                pages.add(int(pl.get("page") or 0))
+    res["dict_tag_pages_ms"] = round(_elapsed_ms(t0) / max(1, n_calls), 2)
+    t0 = time.perf_counter()
+    for _ in range(n_calls):
+        store.pages_for_tags({tag})
+    res["store_tag_pages_ms"] = round(_elapsed_ms(t0) / max(1, n_calls), 2)
+
+    t0 = time.perf_counter()
+    for _ in range(n_calls):
+        hits = 0
+        for _, p in dict(raw).items():
+            if int(p.get("page") or 0) == 1 and str(p.get("tag") or "").strip():
+                _ = (float(p.get("x") or 0), float(p.get("y") or 0), int(p.get("font_size") or 14))
+                hits += 1
+    res["dict_page_scan_ms"] = round(_elapsed_ms(t0) / max(1, n_calls), 2)
+    t0 = time.perf_counter()
+    for _ in range(n_calls):
+        hits = 0
+        for _, p in store.items():
+            if p.page == 1 and p.tag:
+                _ = (p.x, p.y, p.font_size)
+                hits += 1
+    res["store_page_scan_ms"] = round(_elapsed_ms(t0) / max(1, n_calls), 2)
+
+    t0 = time.perf_counter()
+    json.dumps(store, default=_json_default)
+    res["store_serialize_ms"] = _elapsed_ms(t0)
+    return res
+
+
+def _bench_export_font(eng: "Engine", n_records: int) -> dict[str, Any]:
+    """Export the loaded project n_records times with the built-in fonts vs the embedded export font subset."""
+    import io
+
+    res: dict[str, Any] = {"ok": True, "records": n_records, "export_font": str(_export_font_path() or "")}
+    layout = eng._export_layout()
+    values = dict(eng._project.data.get("values") or {})
+    for label, font in (("builtin", False), ("embedded", True)):
+        t0 = time.perf_counter()
+        total = 0
+        shared = None
+        for _ in range(n_records):
+            buf = io.BytesIO()
+            if font and shared is None:
+                shared = _embedded_export_font(_export_chars(values.get(t) for t in set(layout.tag)))
+                res["embedded_font"] = shared.name if shared else None
+            eng._export_filled_pdf(buf, values=values, layout=layout, font=shared or False)
+            total += buf.tell()
+        res[f"{label}_ms"] = _elapsed_ms(t0)
+        res[f"{label}_bytes"] = total
+    return res
+
+
+def _cli(argv: list[str]) -> int:
+    """Headless entry point: python -m app <command> ... (prints JSON results)."""
+    import argparse
+
+    ap = argparse.ArgumentParser(prog="python -m app", description="Input Studio headless engine")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("new", help="create a project from a PDF")
+    p.add_argument("pdf")
+    p = sub.add_parser("info", help="show project summary")
+    p.add_argument("project")
+    p = sub.add_parser("fill", help="set values (and optionally export)")
+    p.add_argument("project")
+    p.add_argument("--values", help="JSON file with tag -> value")
+    p.add_argument("--set", action="append", default=[], metavar="TAG=VALUE")
+    p.add_argument("--out", help="also export the filled PDF here")
+    p = sub.add_parser("render", help="render a page to PNG")
+    p.add_argument("project")
+    p.add_argument("--page", type=int, default=0)
+    p.add_argument("--out", required=True)
+    p = sub.add_parser("export", help="export the filled PDF")
+    p.add_argument("project")
+    p.add_argument("--out", required=True)
+    p = sub.add_parser("batch", help="export one PDF per record")
+    p.add_argument("project")
+    p.add_argument("--records", required=True, help=".csv / .jsonl / .json")
+    p.add_argument("--out-dir", required=True)
+    p.add_argument("--name-field")
+    p.add_argument("--zip", help="stream the PDFs into this zip (in --out-dir) instead of loose files")
+    p.add_argument("--deflate", action="store_true", help="deflate zip members instead of STORED")
+    p = sub.add_parser("bench-layout", help="benchmark the export layout stage on synthetic placements")
+    p.add_argument("--placements", type=int, default=100_000)
+    p.add_argument("--pages", type=int, default=50)
+    p.add_argument("--records", type=int, default=3)
+    p = sub.add_parser("bench-placements", help="benchmark the placement store on synthetic placements")
+    p.add_argument("--placements", type=int, default=50_000)
+    p.add_argument("--pages", type=int, default=50)
+    p.add_argument("--calls", type=int, default=20)
+    p = sub.add_parser("bench-font", help="compare export time/size: built-in fonts vs embedded export font")
+    p.add_argument("project")
+    p.add_argument("--records", type=int, default=20)
+    p = sub.add_parser("optimize", help="shrink a PDF (downsample scans, merge duplicate images) to tune optimize settings")
+    p.add_argument("pdf")
+    p.add_argument("--out", required=True)
+    p.add_argument("--dpi", type=float, default=200)
+    p.add_argument("--jpeg-quality", type=int, default=80)
+    p = sub.add_parser("search", help="search projects by name, tag or value text (catalog index)")
+    p.add_argument("query", nargs="?", default="")
+    p.add_argument("--limit", type=int, default=50)
+    p = sub.add_parser("hours", help="hours and pay per worker for a month (activity store)")
+    p.add_argument("--month", help="YYYY-MM (default: this month)")
+    p.add_argument("--worker")
+    sub.add_parser("gc", help="delete blob store entries no project references")
+    p = sub.add_parser("serve", help="run the local render/export service")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=SERVICE_PORT)
+    p.add_argument("--workers", type=int, default=2)
+    p.add_argument("--max-projects", type=int, default=8)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "bench-layout":
+        res = _bench_layout(args.placements, args.pages, args.records)
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+        return 0
+
+    if args.cmd == "bench-placements":
+        res = _bench_placements(args.placements, args.pages, args.calls)
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+        return 0
+
+    if args.cmd == "optimize":
+        res = {"ok": True, **_optimize_pdf(Path(args.pdf), Path(args.out), args.dpi, args.jpeg_quality)}
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+        return 0
+
+    if args.cmd == "search":
+        res = Engine().search_projects(args.query, args.limit)
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+        return 0 if res.get("ok") else 1
+
+    if args.cmd == "hours":
+        res = Engine().get_activity_summary(args.month, args.worker)
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+        return 0 if res.get("ok") else 1
+
+    if args.cmd == "gc":
+        res = Engine().gc_blobs()
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+        return 0 if res.get("ok") else 1
+
+    if args.cmd == "serve":
+        print(json.dumps({"ok": True, "serving": f"http://{args.host}:{args.port}"}), flush=True)
+        RenderService(workers=args.workers, max_engines=args.max_projects).serve(args.host, args.port)
+        return 0
+
+    eng = Engine()
+    if args.cmd == "new":
+        res = eng.create_project_from_pdf_simple(args.pdf)
+    else:
+        res = eng.load_project(args.project, preview=False)
+        if res.get("ok"):
+            if args.cmd == "info":
+                res = {k: res[k] for k in ("ok", "project", "path", "page_count", "tags", "values")}
+            elif args.cmd == "fill":
+                vals: dict[str, Any] = _read_json(Path(args.values), {}) if args.values else {}
+                for kv in args.set:
+                    k, _, v = kv.partition("=")
+                    vals[k] = v
+                res = eng.set_values(vals)
+                if res.get("ok") and args.out:
+                    res = {**res, **eng.export_pdf(args.out)}
+            elif args.cmd == "render":
+                res = eng.render_page(args.page, args.out)
+            elif args.cmd == "export":
+                res = eng.export_pdf(args.out)
+            elif args.cmd == "batch":
+                res = eng.batch_export(_read_records(Path(args.records)), args.out_dir, args.name_field, args.zip, args.deflate)
+            elif args.cmd == "bench-font":
+                res = _bench_export_font(eng, args.records)
+    print(json.dumps(res, ensure_ascii=False, indent=2))
+    return 0 if res.get("ok") else 1
+
+
+_STARTUP["import_ms"] = _elapsed_ms(_IMPORT_T0)
+
+
+def _warm_renderer() -> None:
+    """Import PyMuPDF/Pillow in the background while the window is coming up."""
+    t0 = time.perf_counter()
+    try:
+        _fitz()
+        from PIL import Image, ImageDraw, ImageFont  # noqa: F401
+    except Exception:
+        pass
+    _STARTUP["warm_renderer_ms"] = _elapsed_ms(t0)
 
 
 def main() -> None:
+    threading.Thread(target=_warm_renderer, daemon=True).start()
+    import webview
+
     _ensure_dirs()
     api = Api()
     ui_index = (UI_DIR / "index.html").resolve()
@@ -1262,10 +5028,18 @@ def main() -> None:
         y=40,
         resizable=True,
     )
+    api._window = window
+    api._start_watcher()
+    try:
+        window.events.loaded += lambda *_: _STARTUP.__setitem__("window_loaded_ms", _elapsed_ms(_IMPORT_T0))
+    except Exception:
+        pass
     webview.start(debug=False)
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        raise SystemExit(_cli(sys.argv[1:]))
     main()
 
 
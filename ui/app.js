@@ -132,6 +132,15 @@ const $ = (sel) => document.querySelector(sel)
     async delete_worker() {
       return { ok: true }
     },
+    async get_activity_history() {
+      return { ok: true, history: [] }
+    },
+    async get_activity_summary() {
+      return { ok: true, month: "", workers: [] }
+    },
+    async reset_activity_history() {
+      return { ok: true }
+    },
     async set_value(tag, value) {
       demo.values[String(tag)] = String(value ?? "")
       return { ok: true }
@@ -273,7 +282,6 @@ const state = {
   addMode: false,
   addDraftName: "",
   previewPageIndex: 0,
-  history: [],
   lastSession: null,
   sessionStart: null,
   lastProjectDir: null,
@@ -286,10 +294,10 @@ const state = {
   lastExportDir: null,
 }
 
-state.history = loadLocal("inputstudio-history", [])
 state.lastSession = loadLocal("inputstudio-last-session", null)
 state.lastProjectDir = loadLocal("inputstudio-last-dir", null)
 state.showPanel = loadLocal("inputstudio-show-panel", true)
+state.vectorPreview = loadLocal("inputstudio-vector-preview", false)
 
 function loadLocal(key, fallback) {
   try {
@@ -333,7 +341,14 @@ function deepClone(obj) {
   return JSON.parse(JSON.stringify(obj))
 }
 
+// Desktop backend keeps its own undo log of structural diffs (undo/redo); the
+// snapshot stack below is only used when it is unavailable (e.g. demo mode).
+function hasServerUndo() {
+  return typeof window.pywebview?.api?.undo === "function"
+}
+
 function snapshotProject() {
+  if (hasServerUndo()) return null
   return {
     tags: [...state.tags],
     values: deepClone(state.values || {}),
@@ -355,11 +370,37 @@ async function applyProjectSnapshot(snap, { save = true } = {}) {
 }
 
 function pushUndo(beforeSnap) {
+  if (!beforeSnap) return
   state.undoStack.push(beforeSnap)
   if (state.undoStack.length > 60) state.undoStack.shift()
   state.redoStack = []
 }
 
+// Apply an undo/redo patch from the backend: only changed entries are touched.
+function applyServerPatch(patch) {
+  if (!patch) return
+  for (const [fid, pl] of Object.entries(patch.placements || {})) {
+    if (pl) state.placements[fid] = pl
+    else delete state.placements[fid]
+  }
+  for (const [tag, v] of Object.entries(patch.values || {})) {
+    if (v === null || v === undefined) delete state.values[tag]
+    else state.values[tag] = v
+  }
+  if (Array.isArray(patch.tags)) state.tags = [...patch.tags]
+  state.idx = Math.max(0, Math.min(state.idx, state.tags.length - 1))
+  state.selectKeys = state.selectKeys.filter((fid) => state.placements?.[fid])
+}
+
+async function serverUndoRedo(redo) {
+  const api = window.pywebview.api
+  const r = redo ? await api.redo() : await api.undo()
+  if (!r?.ok) return
+  applyServerPatch(r.patch)
+  render()
+  showPage(state.previewPageIndex || 0)
+}
+
 function isTextEditingTarget(el) {
   const t = (el?.tagName || "").toLowerCase()
   if (t === "textarea") return true
@@ -422,6 +463,100 @@ function toast(msg) {
   el._t = setTimeout(() => (el.style.display = "none"), 2100)
 }
 
+// --- background export jobs (backend pushes events via evaluate_js) ---
+const exportWaiters = new Map()
+const asyncCalls = new Map()
+let activeExportJob = null
+
+window.__inputstudioEvent = (ev) => {
+  if (!ev || typeof ev !== "object") return
+  if (ev.type === "call_result") {
+    const waiter = asyncCalls.get(ev.call_id)
+    if (waiter) {
+      asyncCalls.delete(ev.call_id)
+      waiter(ev.result)
+    }
+    return
+  }
+  if (ev.type === "project_changed") {
+    // project.json was edited outside the app; the backend already merged it
+    applyServerPatch(ev.patch)
+    render()
+    showPage(state.previewPageIndex || 0)
+    toast("案件ファイルが外部で更新されたため再読み込みしました")
+    return
+  }
+  if (ev.type === "template_changed") {
+    state.pageCount = ev.page_count || state.pageCount
+    render()
+    showPage(Math.min(state.previewPageIndex || 0, (state.pageCount || 1) - 1))
+    toast("テンプレートPDFが外部で更新されたため再読み込みしました")
+    return
+  }
+  if (ev.type === "export_progress") {
+    activeExportJob = ev.job_id
+    toast(`PDFを生成中… ${ev.page} / ${ev.pages} ページ（Escで中止）`)
+    return
+  }
+  if (ev.type === "export_done") {
+    if (activeExportJob === ev.job_id) activeExportJob = null
+    const r = ev.result || {}
+    if (r.ok) {
+      if (r.filled_pdf) state.lastFilledPdf = r.filled_pdf
+      if (r.exports_dir || r.dir) state.lastExportDir = r.exports_dir || r.dir
+    }
+    const waiter = exportWaiters.get(ev.job_id)
+    if (waiter) {
+      exportWaiters.delete(ev.job_id)
+      waiter(r)
+      return
+    }
+    if (ev.kind === "autosave") {
+      if (r.ok) toast("PDFを生成しました")
+      else if (ev.status !== "cancelled") toast(`PDF生成に失敗しました: ${r.error || "unknown"}`)
+      render()
+    }
+  }
+}
+
+// Non-blocking bridge: slow calls (renders) run on the backend's async core and resolve
+// through a call_result event, so the bridge stays free for edits meanwhile.
+function callAsync(method, ...args) {
+  const api = window.pywebview?.api
+  if (!api || typeof api.call_async !== "function") return api[method](...args)
+  const id = `c${Date.now().toString(36)}${Math.random().toString(36).slice(2, 8)}`
+  return new Promise((resolve) => {
+    asyncCalls.set(id, resolve)
+    api.call_async(method, args, id).then(
+      (r) => {
+        if (r?.ok) return
+        asyncCalls.delete(id)
+        resolve(api[method](...args))
+      },
+      () => {
+        asyncCalls.delete(id)
+        resolve(api[method](...args))
+      }
+    )
+  })
+}
+
+// Start an export job and resolve with its result when the export_done event arrives.
+async function runExportJob(kind) {
+  const api = window.pywebview?.api
+  const r = await api.start_export(kind)
+  if (!r?.ok) return r || { ok: false, error: "unknown" }
+  activeExportJob = r.job_id
+  return new Promise((resolve) => exportWaiters.set(r.job_id, resolve))
+}
+
+document.addEventListener("keydown", (ev) => {
+  if (ev.key !== "Escape" || !activeExportJob) return
+  window.pywebview?.api?.cancel_export?.(activeExportJob)
+  toast("PDF生成を中止しました")
+  activeExportJob = null
+})
+
 function fmtTime(sec) {
   const s = Math.max(0, Math.floor(sec))
   const h = String(Math.floor(s / 3600)).padStart(2, "0")
@@ -528,6 +663,28 @@ function bindTipFloatOnce() {
   })
 }
 
+// load_project returns the first page already rendered; put it on screen before
+// the rest of the UI state is rebuilt.
+function showFirstPage(loaded) {
+  const r = loaded?.first_page
+  if (!r || !r.ok) return
+  const img = $("#previewImg")
+  if (img) {
+    img.onload = () => {
+      img.style.visibility = "visible"
+      window.pywebview?.api?.mark_first_page_shown?.()
+    }
+    img.onerror = () => (img.style.visibility = "hidden")
+    img.style.visibility = "hidden"
+    img.src = r.png_data || r.png
+  }
+  state.previewPageIndex = 0
+  state.pageW = r.page_display_width || state.pageW
+  state.pageH = r.page_display_height || state.pageH
+  const p = $("#pageIndicator")
+  if (p) p.textContent = `1 / ${loaded.page_count || 1}`
+}
+
 async function showPage(pageIndex) {
   if (!state.projectPath) return
   const api = window.pywebview?.api
@@ -535,18 +692,19 @@ async function showPage(pageIndex) {
   const idx = Math.max(0, Math.min((state.pageCount || 1) - 1, Number(pageIndex) || 0))
   state.previewPageIndex = idx
   state.pageLocked = true
+  if (vectorOn()) return showVectorPage(idx)
   const my = ++pageReq
   const p0 = $("#pageIndicator")
   if (p0) p0.textContent = `${idx + 1} / ${state.pageCount || 1} …`
-  let r = await api.get_preview_png_base64_page(idx)
+  let r = await callAsync("get_preview_png_base64_page", idx)
   // Auto-recover when backend lost the project (WebView reload / timing / cache issues).
   if (r && !r.ok && r.error === "no_project" && state.projectPath && typeof api.load_project === "function") {
     try {
       await api.load_project(state.projectPath)
-      r = await api.get_preview_png_base64_page(idx)
+      r = await callAsync("get_preview_png_base64_page", idx)
     } catch {}
   }
-  if (my !== pageReq) return
+  if (my !== pageReq || isStaleFrame(r)) return
   if (r && r.ok) {
     const img = $("#previewImg")
     if (img) {
@@ -929,8 +1087,14 @@ function render() {
                 <span class="badge" id="pageIndicator">${(state.previewPageIndex || 0) + 1} / ${state.pageCount || 1}</span>
                 <button class="btn btn--soft" id="btnNextPage">次</button>
                 <button class="btn btn--soft" id="btnTogglePanel">${state.showPanel ? "操作欄:ON" : "操作欄:OFF"}</button>
+                ${
+                  typeof window.pywebview?.api?.get_page_overlay === "function"
+                    ? `<button class="btn btn--soft" id="btnVectorPreview">${state.vectorPreview ? "文字:画面描画" : "文字:画像"}</button>`
+                    : ""
+                }
               </div>
             </div>
+            <canvas id="textLayer" class="overlay textLayer" aria-hidden="true"></canvas>
             <canvas id="confetti" class="confetti" aria-hidden="true"></canvas>
             <canvas id="overlay" class="overlay"></canvas>
             ${
@@ -987,6 +1151,11 @@ function bind() {
     const ctrl = ev.ctrlKey || ev.metaKey
 
     // Undo / Redo
+    if (ctrl && hasServerUndo() && (k === "z" || k === "Z" || k === "y" || k === "Y")) {
+      ev.preventDefault()
+      await serverUndoRedo(k === "y" || k === "Y" || ev.shiftKey)
+      return
+    }
     if (ctrl && (k === "z" || k === "Z")) {
       ev.preventDefault()
       if (ev.shiftKey) {
@@ -1115,6 +1284,7 @@ function bind() {
     } catch {}
     const loaded = await window.pywebview.api.load_project(r.path)
     if (!loaded.ok) return
+    showFirstPage(loaded)
     state.projectPath = r.path
     state.projectName = loaded.project
     state.tags = loaded.tags || []
@@ -1225,6 +1395,7 @@ function bind() {
       if (!loaded?.ok) {
         return alert("新規プロジェクトを開けませんでした")
       }
+      showFirstPage(loaded)
       state.projectPath = g.path
       state.projectName = loaded.project
       state.tags = loaded.tags || []
@@ -1259,6 +1430,7 @@ function bind() {
       const p = state.lastSession.path
       const loaded = await window.pywebview.api.load_project(p)
       if (!loaded.ok) return toast("前回の案件を開けませんでした")
+      showFirstPage(loaded)
       state.projectPath = p
       state.projectName = loaded.project
       state.tags = loaded.tags || []
@@ -1294,12 +1466,13 @@ function bind() {
   if (btnSave) btnSave.onclick = async () => {
     if (!state.projectPath) return toast("先に案件を開いてください")
     try {
-      const r = await window.pywebview.api.save_current_project(true)
+      const background = typeof window.pywebview.api.start_export === "function"
+      const r = await window.pywebview.api.save_current_project(true, background)
       state.lastSession = { path: state.projectPath, workerId: state.workerId, projectName: state.projectName }
       saveLocal("inputstudio-last-session", state.lastSession)
       if (r?.filled_pdf) state.lastFilledPdf = r.filled_pdf
       if (r?.exports_dir) state.lastExportDir = r.exports_dir
-      toast("案件を保存しました（PDFも生成）")
+      toast(r?.job_id ? "案件を保存しました（PDFを生成中…）" : "案件を保存しました（PDFも生成）")
       render()
     } catch (e) {
       toast(`保存に失敗しました: ${e}`)
@@ -1354,6 +1527,7 @@ function bind() {
     const a = await api.append_pdf_to_project(r.path)
     if (!a?.ok) return toast(`PDF追加に失敗: ${a?.error || "unknown"}`)
     state.pageCount = a.page_count || state.pageCount
+    if (a.placements && typeof a.placements === "object") state.placements = a.placements
     toast(`PDFを追加しました（合計 ${state.pageCount} ページ）`)
     await showPage(state.previewPageIndex || 0)
     render()
@@ -1414,6 +1588,15 @@ function bind() {
     render()
   }
 
+  const btnVectorPreview = $("#btnVectorPreview")
+  if (btnVectorPreview) btnVectorPreview.onclick = () => {
+    state.vectorPreview = !state.vectorPreview
+    saveLocal("inputstudio-vector-preview", state.vectorPreview)
+    vec = null
+    render()
+    showPage(state.previewPageIndex || 0)
+  }
+
   const btnAddFromCenter = $("#btnAddFromCenter")
   if (btnAddFromCenter) btnAddFromCenter.onclick = () => {
     const img = $("#previewImg")
@@ -1469,11 +1652,22 @@ function bind() {
   const btnWorker = $("#btnWorker")
   if (btnWorker) btnWorker.onclick = () => openWorkerModal({ mode: "manage" })
 
-  const historyExport = () => {
-    if (!state.history.length) return toast("履歴がありません")
+  const historyExport = async () => {
+    // 履歴はバックエンド（activity.sqlite3）が保持。新しい順に受け取り、古い順でCSVにする
+    const history = []
+    let before = null
+    for (;;) {
+      const r = await window.pywebview.api.get_activity_history(null, 5000, before)
+      if (!r?.ok) return toast(`履歴の取得に失敗しました: ${r?.error || "unknown"}`)
+      history.push(...(r.history || []))
+      if ((r.history || []).length < 5000) break
+      before = r.history[r.history.length - 1].ts
+    }
+    if (!history.length) return toast("履歴がありません")
+    const names = Object.fromEntries((state.workers || []).map((w) => [w.id, w.name]))
     const header = ["project","path","worker","start_iso","end_iso","duration_sec"].join(",")
-    const rows = state.history.map((h) =>
-      [h.projectName || "", h.projectPath || "", h.workerName || "", h.start, h.end, h.duration].map((s) =>
+    const rows = history.reverse().map((h) =>
+      [h.project_name || "", h.project_path || "", names[h.worker_id] || h.worker_id || "", h.start, h.end, Math.round(h.seconds || 0)].map((s) =>
         `"${String(s || "").replace(/"/g, '""')}"`
       ).join(",")
     )
@@ -1489,13 +1683,21 @@ function bind() {
   const btnHistoryExport = $("#btnHistoryExport")
   if (btnHistoryExport) btnHistoryExport.onclick = historyExport
   const btnHistoryReset = $("#btnHistoryReset")
-  if (btnHistoryReset) btnHistoryReset.onclick = () => {
+  if (btnHistoryReset) btnHistoryReset.onclick = async () => {
     const ok = confirm("作業履歴をリセットします（内部保存のみ削除、プロジェクトは残ります）。よろしいですか？")
     if (!ok) return
-    state.history = []
-    saveLocal("inputstudio-history", state.history)
+    const r = await window.pywebview.api.reset_activity_history()
+    if (!r?.ok) return toast(`履歴のリセットに失敗しました: ${r?.error || "unknown"}`)
     toast("履歴をリセットしました")
   }
+  const btnMyHistory = $("#btnMyHistory")
+  if (btnMyHistory) btnMyHistory.onclick = async () => {
+    if (!state.workerId) return toast("作業者を選んでください")
+    const r = await window.pywebview.api.get_activity_summary(null, state.workerId)
+    if (!r?.ok) return toast(`履歴の取得に失敗しました: ${r?.error || "unknown"}`)
+    const me = (r.workers || [])[0]
+    toast(me ? `今月（${r.month}）の作業: ${me.hours}時間・${me.sessions}回` : "今月の作業履歴はまだありません")
+  }
 
   $("#btnStart").onclick = async () => {
     if (!state.projectPath) return toast("先に案件を開いてください")
@@ -1535,27 +1737,14 @@ function bind() {
     if (!ok) return
     await pushValue()
     toast("提出物を作成中…")
-    const r = await window.pywebview.api.finish()
+    const r =
+      typeof window.pywebview.api.start_export === "function" ? await runExportJob("finish") : await window.pywebview.api.finish()
     if (!r.ok) return toast(`提出物の作成に失敗しました: ${r.error || "unknown"}`)
     if (r?.filled_pdf) state.lastFilledPdf = r.filled_pdf
     if (r?.dir) state.lastExportDir = r.dir
     state.working = false
     state.justCompleted = true
-    const end = new Date().toISOString()
-    const duration = calcNetSeconds()
-    state.history = [
-      ...state.history,
-      {
-        projectName: state.projectName,
-        projectPath: state.projectPath,
-        workerId: state.workerId,
-        workerName: (state.workers.find((w) => w.id === state.workerId) || {}).name || "",
-        start: state.sessionStart,
-        end,
-        duration,
-      },
-    ]
-    saveLocal("inputstudio-history", state.history)
+    // 作業時間はバックエンドが終了イベントとして記録する（r.activity）
     state.sessionStart = null
     state.timerStart = null
     state.privateTotal = 0
@@ -1853,6 +2042,16 @@ async function pushValue() {
 
 let previewReq = 0
 let pageReq = 0
+// Newest overlay version shown per page: coalesced renders may answer an older request
+// with a newer frame, so an older frame arriving late must not replace it.
+const shownVersions = new Map()
+function isStaleFrame(r) {
+  if (!r?.ok || r.version == null) return false
+  const key = `${state.projectPath}#${r.page_index}`
+  if (r.version < (shownVersions.get(key) ?? -1)) return true
+  shownVersions.set(key, r.version)
+  return false
+}
 async function queuePreview(key) {
   if (!state.projectPath) {
     const img = $("#previewImg")
@@ -1863,6 +2062,16 @@ async function queuePreview(key) {
     return
   }
 
+  // 画面描画モード：同じページなら手元で描き直すだけ（バックエンドで描画しない）
+  if (vectorOn()) {
+    const k = key || state.tags[state.idx]
+    const pl = Object.values(state.placements || {}).find((p) => p && String(p.tag || "") === String(k || ""))
+    const page = state.pageLocked || !pl ? state.previewPageIndex || 0 : Number(pl.page || 0)
+    if (vec && vec.project === state.projectPath && vec.page === page) drawTextLayer()
+    else await showVectorPage(page)
+    return
+  }
+
   // ページ固定中は、選択タグに関係なく現在ページを維持
   if (state.pageLocked && window.pywebview?.api?.get_preview_png_base64_page) {
     await showPage(state.previewPageIndex || 0)
@@ -1880,14 +2089,14 @@ async function queuePreview(key) {
 
   const k = key || state.tags[state.idx]
   const my = ++previewReq
-  let r = await window.pywebview.api.get_preview_png_base64(k)
+  let r = await callAsync("get_preview_png_base64", k)
   if (r && !r.ok && r.error === "no_project" && state.projectPath && window.pywebview?.api?.load_project) {
     try {
       await window.pywebview.api.load_project(state.projectPath)
-      r = await window.pywebview.api.get_preview_png_base64(k)
+      r = await callAsync("get_preview_png_base64", k)
     } catch {}
   }
-  if (my !== previewReq) return
+  if (my !== previewReq || isStaleFrame(r)) return
   if (r.ok) {
     const img = $("#previewImg")
     if (img) {
@@ -1923,6 +2132,12 @@ async function loadWorkers() {
   const r = await window.pywebview.api.get_workers()
   if (!r.ok) return
   state.workers = r.workers || []
+  // 旧版がlocalStorageに持っていた作業履歴は、一度だけバックエンドへ移す
+  const legacy = loadLocal("inputstudio-history", null)
+  if (Array.isArray(legacy) && window.pywebview.api.import_activity_history) {
+    const m = await window.pywebview.api.import_activity_history(legacy)
+    if (m?.ok) localStorage.removeItem("inputstudio-history")
+  }
   const last = loadLocal("inputstudio-last-worker", null)
   if (last && state.workers.some((w) => w.id === last)) state.workerId = last
   else state.workerId = r.last_worker_id || (state.workers[0] ? state.workers[0].id : null)
@@ -2987,7 +3202,154 @@ async function focusDesignKey(refreshPreview = true) {
   drawOverlay()
 }
 
+// --- 画面描画モード（文字はブラウザが描く） ---
+// 背景はテンプレート画像（入力で変わらない）だけを受け取り、文字は書き出しと同じ字幅・ベースライン
+// （get_page_overlay の fonts / k）で1文字ずつ置く。入力・ドラッグ中はバックエンドで描画しない。
+let vec = null // { project, page, baseKey, baseSrc, fonts, k, jpRe, items }
+const vecMissing = new Set()
+let vecMetricsTimer = null
+const VEC_FAMILIES = {
+  latin: "Helvetica, Arial, sans-serif",
+  jp: "'Hiragino Kaku Gothic ProN', Meiryo, 'Yu Gothic', sans-serif",
+  export: "InputStudioExport, 'Hiragino Kaku Gothic ProN', Meiryo, sans-serif",
+}
+
+function vectorOn() {
+  return !!state.vectorPreview && typeof window.pywebview?.api?.get_page_overlay === "function"
+}
+
+function vecSig(pl, text) {
+  return [text, pl.x, pl.y, pl.font_size, pl.line_height, pl.letter_spacing, pl.color].join("|")
+}
+
+async function showVectorPage(idx) {
+  const my = ++pageReq
+  const p0 = $("#pageIndicator")
+  if (p0) p0.textContent = `${idx + 1} / ${state.pageCount || 1} …`
+  const have = vec && vec.project === state.projectPath ? vec.baseKey : null
+  const r = await callAsync("get_page_overlay", idx, have)
+  if (my !== pageReq) return
+  if (!r?.ok) return toast(`ページ表示に失敗: ${r?.error || "unknown"}`)
+  const baseSrc = r.base_key === have && vec ? vec.baseSrc : r.base_data || r.base
+  const items = new Map()
+  for (const it of r.items || []) {
+    const pl = state.placements?.[it.fid]
+    if (!pl) continue
+    // 受け取った時点の状態と一致する間だけ使う（以降の編集分は手元で組み直す）
+    it.sig = vecSig(pl, String(state.values?.[pl.tag] ?? "").replaceAll("<br>", "\n"))
+    items.set(it.fid, it)
+  }
+  vec = {
+    project: state.projectPath,
+    page: r.page_index,
+    baseKey: r.base_key,
+    baseSrc,
+    fonts: r.fonts || {},
+    k: r.k || [1, 1],
+    jpRe: new RegExp(r.jp_re || "[\\u3040-\\u30ff\\u3400-\\u9fff]"),
+    items,
+  }
+  const ef = vec.fonts.export
+  if (ef?.url && typeof FontFace === "function" && ![...document.fonts].some((f) => f.family === "InputStudioExport")) {
+    new FontFace("InputStudioExport", `url("${ef.url}")`).load().then(
+      (f) => {
+        document.fonts.add(f)
+        drawTextLayer()
+      },
+      () => {} // 読めなくても位置は書き出しの字幅で決まる（字形だけ代替フォント）
+    )
+  }
+  state.previewPageIndex = r.page_index
+  state.pageW = r.page_display_width || state.pageW
+  state.pageH = r.page_display_height || state.pageH
+  const img = $("#previewImg")
+  if (img && img.getAttribute("src") !== baseSrc) {
+    img.onload = () => {
+      img.style.visibility = "visible"
+      drawOverlay()
+    }
+    img.onerror = () => (img.style.visibility = "hidden")
+    img.src = baseSrc
+  }
+  const p = $("#pageIndicator")
+  if (p) p.textContent = `${r.page_index + 1} / ${state.pageCount || 1}`
+  drawOverlay()
+}
+
+// _export_filled_pdf と同じ規則：書き出しフォントが全文字を持てばそれ、無ければ和文/欧文
+function vecLayout(pl, text) {
+  const f = vec.fonts
+  const chars = [...text].filter((c) => c !== "\n" && c !== "\r")
+  for (const c of chars) {
+    for (const m of Object.values(f)) if (m.advances[c] === undefined) vecMissing.add(c)
+  }
+  const key = f.export && chars.every((c) => f.export.advances[c] != null) ? "export" : vec.jpRe.test(text) ? "jp" : "latin"
+  const m = f[key]
+  const [kx, ky] = vec.k
+  const fs = Number(pl.font_size || 14)
+  const y0 = Number(pl.y || 0) + (m.ascent + 0.08) * fs * ky
+  const step = fs * Number(pl.line_height || 1.2) * ky
+  const letter = Number(pl.letter_spacing || 0) * kx
+  const lines = text.split("\n").map((line, i) => {
+    const xs = []
+    let cx = Number(pl.x || 0)
+    for (const c of line) {
+      xs.push(cx)
+      cx += ((m.advances[c] ?? (vec.jpRe.test(c) ? 1000 : 620)) / 1000) * fs * kx + letter
+    }
+    return { text: line, y: y0 + step * i, x: xs }
+  })
+  return { font: key, size: fs * ky, color: pl.color || "#0f172a", lines }
+}
+
+// 初めて使う文字の字幅はまとめて問い合わせ、届いたら描き直す（それまでは概算幅）
+function fetchVecMetrics() {
+  if (!vecMissing.size || vecMetricsTimer) return
+  vecMetricsTimer = setTimeout(async () => {
+    const chars = [...vecMissing].join("")
+    vecMissing.clear()
+    const r = await window.pywebview.api.get_glyph_metrics(chars)
+    vecMetricsTimer = null
+    if (!r?.ok || !vec) return
+    for (const [key, m] of Object.entries(r.fonts || {})) {
+      if (vec.fonts[key]) Object.assign(vec.fonts[key].advances, m.advances)
+    }
+    drawTextLayer()
+  }, 50)
+}
+
+function drawTextLayer() {
+  const cv = $("#textLayer")
+  if (!cv) return
+  const ctx = cv.getContext("2d")
+  const rect = cv.getBoundingClientRect()
+  cv.width = Math.max(1, Math.floor(rect.width * devicePixelRatio))
+  cv.height = Math.max(1, Math.floor(rect.height * devicePixelRatio))
+  ctx.setTransform(devicePixelRatio, 0, 0, devicePixelRatio, 0, 0)
+  ctx.clearRect(0, 0, rect.width, rect.height)
+  const img = $("#previewImg")
+  if (!vectorOn() || !vec || vec.project !== state.projectPath || vec.page !== state.previewPageIndex || !img || !img.src) return
+  const box = getRenderedContentRect(img, state.pageW, state.pageH)
+  const s = box.width / Math.max(1, state.pageW)
+  const ox = box.left - rect.left
+  const oy = box.top - rect.top
+  for (const [fid, pl] of Object.entries(state.placements || {})) {
+    if (!pl || !pl.tag || Number(pl.page || 0) !== vec.page) continue
+    const text = String(state.values?.[pl.tag] ?? "").replaceAll("<br>", "\n")
+    if (!text.trim()) continue
+    const cached = vec.items.get(fid)
+    const it = cached && cached.sig === vecSig(pl, text) ? cached : vecLayout(pl, text)
+    ctx.font = `${it.size * s}px ${VEC_FAMILIES[it.font]}`
+    ctx.fillStyle = it.color
+    for (const ln of it.lines) {
+      ;[...ln.text].forEach((c, i) => ctx.fillText(c, ox + ln.x[i] * s, oy + ln.y * s))
+    }
+  }
+  fetchVecMetrics()
+}
+
 function drawOverlay() {
+  drawTextLayer()
   const ov = $("#overlay")
   const img = $("#previewImg")
   if (!ov) return